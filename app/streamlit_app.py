@@ -0,0 +1,404 @@
+"""
+streamlit_app.py
+
+Dashboard for predictions_customer_latest and its history.
+
+- reads the current published snapshot (clv.snapshots) read-only, so it keeps
+  working while the pipeline rebuilds the warehouse; once CURRENT has moved on,
+  the process's connection to an older snapshot is closed as soon as no query
+  is running on it
+- every query result is cached by (snapshot version, SQL, parameters); a new
+  snapshot is a new cache key, nothing has to be invalidated
+- all aggregation runs in DuckDB; only aggregates and one page of customers
+  come back (keyset pagination on (sort column, CustomerID))
+- targeting what-if: per snapshot + cutoff, one RoiCurve (sorted cumulative
+  expected_loss) per blend weight on WEIGHT_GRID is built once and kept in
+  st.cache_resource; every slider move is then a lookup (clv.business.RoiCurve),
+  and only the panel reruns (st.fragment)
+
+Run:
+    streamlit run app/streamlit_app.py
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from clv.business import RoiCurve, percentile_rank
+from clv.cohorts import COHORTS_TABLE, cohort_matrix, cohorts_query
+from clv.db import close, connect
+from clv.snapshots import current_snapshot, reader_path
+
+
+PRED_PREFIX = "predictions_customer"
+PRED_VIEW = "predictions_customer_latest"
+REASON_CODES_TABLE = "reason_codes_customer"
+RUNS_TABLE = "report_runs"
+SORT_COLS = ["expected_loss", "expected_clv", "churn_prob", "expected_revenue"]
+PAGE_COLS = ["CustomerID", "churn_prob", "spend_prob", "expected_revenue", "expected_clv", "expected_loss"]
+RISK_BANDS = 20
+WEIGHT_GRID = tuple(float(w) for w in np.round(np.linspace(0.0, 1.0, 11), 1))
+CHART_POINTS = 200
+
+
+# -------------------------
+# Snapshot + cached queries
+# -------------------------
+@st.cache_resource
+def _reader_state() -> dict:
+    """
+    Database path this server process reads now, and the number of queries
+    running per path (shared by all sessions).
+    """
+    return {"path": None, "active": Counter(), "lock": threading.Lock()}
+
+
+def _close_if_idle(state: dict, path: str) -> None:
+    # caller holds state["lock"]; a root that is no longer current and has no
+    # running query would stay open (and keep a pruned snapshot file alive)
+    # for the life of the server otherwise
+    if state["path"] is not None and path != state["path"] and state["active"][path] == 0:
+        del state["active"][path]
+        close(path)
+
+
+def snapshot() -> tuple[str, str]:
+    """
+    (version, path) of the database to read. Before the first publish the
+    working DB is read, versioned by its modification time. The previous
+    path's root connection is closed once no query is running on it.
+    """
+    path = reader_path()
+    version = current_snapshot() or f"working@{os.path.getmtime(path):.0f}"
+
+    state = _reader_state()
+    with state["lock"]:
+        previous, state["path"] = state["path"], path
+        if previous is not None and previous != path:
+            _close_if_idle(state, previous)
+    return version, path
+
+
+@contextmanager
+def reading(path: str):
+    """
+    Read-only cursor on path, counted as a running query until the block exits
+    (the last reader of a superseded snapshot closes its root).
+    """
+    state = _reader_state()
+    with state["lock"]:
+        state["active"][path] += 1
+    try:
+        con = connect(path, read_only=True, stage="serve")
+        try:
+            yield con
+        finally:
+            con.close()
+    finally:
+        with state["lock"]:
+            state["active"][path] -= 1
+            _close_if_idle(state, path)
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def query(version: str, path: str, sql: str, params: tuple = ()) -> pd.DataFrame:
+    """
+    One read-only query; version is part of the cache key only.
+    """
+    with reading(path) as con:
+        return con.execute(sql, list(params)).fetchdf()
+
+
+def table_names(version: str, path: str) -> set[str]:
+    names = query(version, path, "SELECT table_name FROM information_schema.tables")
+    return set(names["table_name"])
+
+
+def cutoff_tables(version: str, path: str) -> dict[str, str]:
+    """
+    {YYYY-MM-DD: versioned predictions table}, oldest first.
+    """
+    names = query(version, path, """
+        SELECT table_name
+        FROM information_schema.tables
+        WHERE regexp_matches(table_name, ?)
+        ORDER BY table_name
+    """, (f"^{PRED_PREFIX}_[0-9]{{4}}_[0-9]{{2}}_[0-9]{{2}}$",))
+    return {n[len(PRED_PREFIX) + 1:].replace("_", "-"): n for n in names["table_name"]}
+
+
+# -------------------------
+# Server-side aggregates
+# -------------------------
+def kpis(version: str, path: str, table: str) -> dict:
+    row = query(version, path, f"""
+        SELECT
+          COUNT(*) AS customers,
+          AVG(churn_prob) AS avg_churn_prob,
+          AVG(spend_prob) AS avg_spend_prob,
+          SUM(expected_clv) AS total_expected_clv,
+          SUM(expected_loss) AS total_expected_loss
+        FROM {table}
+    """)
+    return row.iloc[0].to_dict()
+
+
+def risk_bands(version: str, path: str, table: str, bands: int = RISK_BANDS) -> pd.DataFrame:
+    return query(version, path, f"""
+        SELECT
+          LEAST(FLOOR(churn_prob * ?), ? - 1) / ? AS churn_band,
+          COUNT(*) AS customers,
+          SUM(expected_loss) AS expected_loss
+        FROM {table}
+        WHERE churn_prob IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+    """, (bands, bands, bands))
+
+
+def history(version: str, path: str, tables: dict[str, str]) -> pd.DataFrame:
+    """
+    Per-cutoff aggregates over every versioned predictions table.
+    """
+    if not tables:
+        return pd.DataFrame()
+    union = "\nUNION ALL\n".join(
+        f"""SELECT cutoff_date, COUNT(*) AS customers, AVG(churn_prob) AS avg_churn_prob,
+                   SUM(expected_clv) AS total_expected_clv, SUM(expected_loss) AS total_expected_loss
+            FROM {t} GROUP BY cutoff_date"""
+        for t in tables.values()
+    )
+    return query(version, path, f"SELECT * FROM ({union}) ORDER BY cutoff_date")
+
+
+def customer_page(
+    version: str,
+    path: str,
+    table: str,
+    sort_col: str,
+    page_size: int,
+    after: tuple | None = None,
+) -> pd.DataFrame:
+    """
+    Next page_size customers by sort_col DESC, CustomerID (NULLs last), starting
+    after the (sort value, CustomerID) key of the previous page's last row.
+    """
+    key = f"COALESCE({sort_col}, '-infinity'::DOUBLE)"
+    where, params = "", ()
+    if after is not None:
+        where = f"WHERE {key} < ? OR ({key} = ? AND CustomerID > ?)"
+        params = (after[0], after[0], after[1])
+
+    cols = ", ".join(PAGE_COLS)
+    return query(version, path, f"""
+        SELECT {cols}, {key} AS _sort_key
+        FROM {table}
+        {where}
+        ORDER BY _sort_key DESC, CustomerID
+        LIMIT {int(page_size)}
+    """, params)
+
+
+def customer_detail(version: str, path: str, table: str, customer_id: int, cutoff: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    pred = query(version, path, f"SELECT * FROM {table} WHERE CustomerID = ?", (int(customer_id),))
+    reasons = pd.DataFrame()
+    if REASON_CODES_TABLE in table_names(version, path):
+        reasons = query(version, path, f"""
+            SELECT rank, feature, contribution, feature_value
+            FROM {REASON_CODES_TABLE}
+            WHERE CustomerID = ? AND cutoff_date = CAST(? AS DATE)
+            ORDER BY rank
+        """, (int(customer_id), cutoff))
+    return pred, reasons
+
+
+def run_history(version: str, path: str) -> pd.DataFrame:
+    if RUNS_TABLE not in table_names(version, path):
+        return pd.DataFrame()
+    return query(version, path, f"""
+        SELECT run_id, strategy, cutoff_date, targeted_customers, total_cost,
+               expected_prevented_loss, net_uplift, roi, overlap_pct, model_version
+        FROM {RUNS_TABLE}
+        ORDER BY generated_at, strategy
+    """)
+
+
+# -------------------------
+# Targeting what-if (precomputed curves)
+# -------------------------
+@st.cache_resource(show_spinner="Precomputing ROI curves...", max_entries=8)
+def blend_curves(version: str, path: str, table: str) -> dict[float, RoiCurve]:
+    """
+    {w_loss: RoiCurve} for blended = w_loss * rank(expected_loss) + (1 - w_loss) * rank(expected_clv);
+    w_loss = 1.0 ranks by expected_loss alone. Only the two score columns are read.
+    """
+    with reading(path) as con:
+        cols = con.execute(f"SELECT expected_loss, expected_clv FROM {table}").fetchdf()
+
+    loss = cols["expected_loss"].to_numpy(dtype=float)
+    loss_rank = percentile_rank(loss)
+    clv_rank = percentile_rank(cols["expected_clv"].to_numpy(dtype=float))
+    return {w: RoiCurve.from_scores(w * loss_rank + (1.0 - w) * clv_rank, loss) for w in WEIGHT_GRID}
+
+
+@st.fragment
+def what_if_section(version: str, path: str, table: str) -> None:
+    st.subheader("Targeting what-if")
+    curves = blend_curves(version, path, table)
+    n = next(iter(curves.values())).n
+
+    c1, c2, c3 = st.columns(3)
+    cost_per_customer = c1.number_input("Cost per customer (EUR)", min_value=0.01, value=1.0, step=0.5)
+    budget_eur = c1.slider("Budget (EUR)", 0.0, max(float(n * cost_per_customer), 1.0), min(500.0, float(n * cost_per_customer)))
+    max_customers = c2.slider("Capacity (max customers)", 0, n, min(2000, n))
+    save_rate = c2.slider("Save rate", 0.0, 1.0, 0.15, step=0.01)
+    w_loss = c3.select_slider("Blend weight on expected_loss", options=WEIGHT_GRID, value=0.7)
+
+    t0 = time.perf_counter()
+    curve = curves[w_loss]
+    summary = curve.summary(budget_eur, cost_per_customer, max_customers, save_rate)
+    optimal = curve.optimal(cost_per_customer, save_rate, max_customers)
+    ks = np.unique(np.linspace(0, min(max_customers, n), CHART_POINTS).astype(int))
+    net = save_rate * curve.cum_expected_loss[ks] - cost_per_customer * ks  # chart points only
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    cols = st.columns(5)
+    cols[0].metric("Targeted", f"{summary.targeted_customers:,}")
+    cols[1].metric("Cost", f"{summary.total_cost:,.0f}")
+    cols[2].metric("Prevented loss", f"{summary.expected_prevented_loss:,.0f}")
+    cols[3].metric("Net uplift", f"{summary.net_uplift:,.0f}")
+    cols[4].metric("ROI", "n/a" if summary.roi is None else f"{summary.roi:.2f}")
+
+    c3.caption(
+        f"Best within capacity: {optimal['targeted_customers']:,} customers "
+        f"(budget {optimal['budget_eur']:,.0f}, net uplift {optimal['net_uplift']:,.0f})"
+    )
+    st.line_chart(pd.DataFrame({"targeted_customers": ks, "net_uplift": net}), x="targeted_customers", y="net_uplift")
+    st.caption(f"Computed in {elapsed_ms:.1f} ms from cached curves ({n:,} customers, {len(curves)} blend weights)")
+
+
+# -------------------------
+# Layout
+# -------------------------
+def cohorts_section(version: str, path: str) -> None:
+    if COHORTS_TABLE not in table_names(version, path):
+        return
+    st.subheader("Acquisition cohorts")
+    metric = st.selectbox("Cohort metric", ["retention", "cum_revenue_per_customer", "revenue_per_customer", "active_customers"])
+    cohorts = query(version, path, cohorts_query())  # one row per cohort x month
+    st.dataframe(cohort_matrix(cohorts, metric))
+
+
+def customers_section(version: str, path: str, table: str, cutoff: str) -> None:
+    st.subheader("Customers")
+    c1, c2 = st.columns(2)
+    sort_col = c1.selectbox("Sort by", SORT_COLS)
+    page_size = c2.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    # keyset cursors of the pages seen so far; reset when the listing changes
+    listing = (version, table, sort_col, page_size)
+    if st.session_state.get("listing") != listing:
+        st.session_state.listing = listing
+        st.session_state.page_keys = [None]
+
+    keys = st.session_state.page_keys
+    page = customer_page(version, path, table, sort_col, page_size, keys[-1])
+
+    prev_col, info_col, next_col = st.columns([1, 4, 1])
+    if prev_col.button("Previous", disabled=len(keys) == 1):
+        keys.pop()
+        st.rerun()
+    info_col.caption(f"Page {len(keys)}")
+    if next_col.button("Next", disabled=len(page) < page_size):
+        last = page.iloc[-1]
+        keys.append((float(last["_sort_key"]), int(last["CustomerID"])))
+        st.rerun()
+
+    st.dataframe(page.drop(columns="_sort_key"), hide_index=True)
+
+    customer_id = st.number_input("Customer lookup (CustomerID)", min_value=0, step=1, value=0)
+    if customer_id:
+        pred, reasons = customer_detail(version, path, table, customer_id, cutoff)
+        if pred.empty:
+            st.info(f"CustomerID {customer_id} not in the {cutoff} snapshot.")
+        else:
+            st.dataframe(pred, hide_index=True)
+            if not reasons.empty:
+                st.caption("Top churn drivers")
+                st.dataframe(reasons, hide_index=True)
+
+
+def main():
+    st.set_page_config(page_title="CLV decisioning", layout="wide")
+    st.title("CLV decisioning")
+
+    version, path = snapshot()
+    tables = cutoff_tables(version, path)
+    if not tables:
+        st.error(f"No {PRED_PREFIX}_YYYY_MM_DD tables in {path}. Run run_all.py first.")
+        st.stop()
+
+    cutoffs = list(tables)
+    cutoff = st.sidebar.selectbox("Cutoff", cutoffs[::-1])
+    table = tables[cutoff]
+    st.sidebar.caption(f"Snapshot: {version}")
+
+    # -------------------------
+    # KPIs + churn risk bands
+    # -------------------------
+    k = kpis(version, path, table)
+    cols = st.columns(5)
+    cols[0].metric("Customers", f"{int(k['customers']):,}")
+    cols[1].metric("Avg churn prob", f"{k['avg_churn_prob']:.3f}")
+    cols[2].metric("Avg spend prob", f"{k['avg_spend_prob']:.3f}")
+    cols[3].metric("Expected CLV", f"{k['total_expected_clv']:,.0f}")
+    cols[4].metric("Expected loss", f"{k['total_expected_loss']:,.0f}")
+
+    bands = risk_bands(version, path, table)
+    left, right = st.columns(2)
+    left.caption("Customers by churn probability band")
+    left.bar_chart(bands, x="churn_band", y="customers")
+    right.caption("Expected loss by churn probability band")
+    right.bar_chart(bands, x="churn_band", y="expected_loss")
+
+    # -------------------------
+    # History across cutoffs
+    # -------------------------
+    st.subheader("History")
+    hist = history(version, path, tables)
+    st.line_chart(hist, x="cutoff_date", y=["total_expected_clv", "total_expected_loss"])
+    st.dataframe(hist, hide_index=True)
+
+    # -------------------------
+    # Acquisition cohorts (retention / revenue by months since first purchase)
+    # -------------------------
+    cohorts_section(version, path)
+
+    # -------------------------
+    # Targeting what-if (budget / capacity / save_rate / blend weight)
+    # -------------------------
+    what_if_section(version, path, table)
+
+    # -------------------------
+    # Customers (one page at a time)
+    # -------------------------
+    customers_section(version, path, table, cutoff)
+
+    # -------------------------
+    # Report runs
+    # -------------------------
+    runs = run_history(version, path)
+    if not runs.empty:
+        st.subheader("Report runs")
+        st.dataframe(runs, hide_index=True)
+
+
+main()
@@ -0,0 +1,224 @@
+"""
+backtest.py
+
+Historical targeting-policy backtest against realized labels.
+
+For every cutoff in the prediction store (predictions_customer_YYYY_MM_DD) and
+every policy (score, weights, budget, capacity, save_rate), select the targets
+the policy would have picked at that cutoff and join them to what actually
+happened in the prediction window (customer_model_data_rollup):
+
+- churners_targeted / churn_precision / churn_recall   (churn_label)
+- revenue_targeted / revenue_capture                   (revenue_pred_window)
+- realized_uplift_proxy = save_rate * sum(expected_revenue of targeted churners) - cost
+  (a churner's realized revenue is 0 by definition, so the revenue a save would
+  have kept is valued at its predicted expected_revenue)
+
+All cutoffs x policies run as one SQL statement: ranks are windowed per
+cutoff, the policies table is cross-joined and QUALIFY keeps each policy's top k.
+
+In-sample cutoffs: the churn and revenue models are fit on the earliest 80% of
+cutoffs, so predictions stored for those cutoffs were scored on the rows the
+models learned from and their precision / capture / uplift are optimistic.
+Every result row carries in_sample (cutoff among the training cutoffs saved by
+train_churn / train_revenue); summarize_backtest pools the out-of-time cutoffs
+only unless asked otherwise.
+
+Run:
+    python src/clv/backtest.py
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import joblib
+import pandas as pd
+
+from clv.business import n_targetable
+from clv.db import DB_PATH, connect
+from clv.roi_curves import versioned_tables
+from clv.targeting_sql import pct_rank_sql
+
+
+PRED_PREFIX = "predictions_customer"
+LABELS_TABLE = "customer_model_data_rollup"
+TRAIN_CUTOFFS_PATHS = [
+    "artifacts/models/churn_train_cutoffs.joblib",
+    "artifacts/models/revenue_train_cutoffs.joblib",
+]
+
+
+@dataclass
+class Policy:
+    name: str
+    score: str = "expected_loss"  # or "blended_score"
+    w_loss: float = 0.7
+    w_clv: float = 0.3
+    budget_eur: float = 500.0
+    cost_per_customer: float = 1.0
+    max_customers: int = 2000
+    save_rate: float = 0.15
+
+
+def training_cutoffs(paths: list[str] = TRAIN_CUTOFFS_PATHS) -> set[str] | None:
+    """
+    YYYY-MM-DD cutoffs any of the models was trained on (None if no model saved them).
+    """
+    found = [p for p in paths if Path(p).exists()]
+    if not found:
+        return None
+    return {str(c) for p in found for c in joblib.load(p)}
+
+
+def backtest_policies(
+    policies: list[Policy],
+    cutoffs: list | None = None,
+    table_prefix: str = PRED_PREFIX,
+    labels_table: str = LABELS_TABLE,
+    db_path: str = DB_PATH,
+    train_cutoffs: set[str] | None = None,
+) -> pd.DataFrame:
+    """
+    One row per (policy, cutoff) with realized capture / uplift proxies,
+    ordered by policy then cutoff_date. in_sample marks training cutoffs
+    (train_cutoffs, default: training_cutoffs(); NULL when unknown).
+    """
+    if not policies:
+        raise ValueError("at least one policy is required")
+    if len({p.name for p in policies}) != len(policies):
+        raise ValueError("policy names must be unique")
+    for p in policies:
+        if p.score not in ("expected_loss", "blended_score"):
+            raise ValueError(f"Unknown score for policy {p.name}: {p.score}")
+        if p.cost_per_customer <= 0 or p.budget_eur < 0 or p.max_customers <= 0 or not (0 <= p.save_rate <= 1):
+            raise ValueError(f"invalid policy: {p}")
+
+    pol = pd.DataFrame([asdict(p) for p in policies]).rename(columns={"name": "policy"})
+    pol["k"] = [n_targetable(p.max_customers, p.budget_eur, p.cost_per_customer, p.max_customers) for p in policies]
+    pol["blend"] = pol["score"] == "blended_score"
+
+    con = connect(db_path, read_only=True)
+    tables = versioned_tables(con, table_prefix)
+    if cutoffs is not None:
+        wanted = {str(pd.to_datetime(c).date()) for c in cutoffs}
+        tables = {c: t for c, t in tables.items() if c in wanted}
+    if not tables:
+        con.close()
+        raise ValueError(f"No {table_prefix}_YYYY_MM_DD tables found")
+
+    preds = "\n        UNION ALL\n        ".join(
+        f"SELECT cutoff_date, CustomerID, expected_revenue, expected_clv, expected_loss FROM {t}"
+        for _, t in sorted(tables.items())
+    )
+    con.register("policies", pol[["policy", "blend", "w_loss", "w_clv", "k", "cost_per_customer", "save_rate"]])
+
+    out = con.execute(f"""
+        WITH preds AS (
+            {preds}
+        ),
+        labelled AS (
+            SELECT
+              p.*,
+              l.churn_label,
+              l.revenue_pred_window,
+              {pct_rank_sql("p.expected_loss", "p.cutoff_date")} AS loss_rank,
+              {pct_rank_sql("p.expected_clv", "p.cutoff_date")} AS clv_rank
+            FROM preds p
+            JOIN {labels_table} l
+              ON l.cutoff_date = p.cutoff_date AND l.CustomerID = p.CustomerID
+        ),
+        totals AS (
+            SELECT
+              cutoff_date,
+              COUNT(*) AS customers,
+              SUM(churn_label) AS churners,
+              SUM(revenue_pred_window) AS revenue_total
+            FROM labelled
+            GROUP BY cutoff_date
+        ),
+        selected AS (
+            SELECT
+              pol.policy, pol.cost_per_customer, pol.save_rate,
+              x.cutoff_date, x.churn_label, x.revenue_pred_window, x.expected_revenue, x.expected_loss
+            FROM labelled x
+            CROSS JOIN policies pol
+            QUALIFY row_number() OVER (
+                PARTITION BY pol.policy, x.cutoff_date
+                ORDER BY CASE WHEN pol.blend THEN pol.w_loss * x.loss_rank + pol.w_clv * x.clv_rank
+                              ELSE x.expected_loss END DESC NULLS LAST,
+                         x.CustomerID
+            ) <= pol.k
+        )
+        SELECT
+          s.policy,
+          s.cutoff_date,
+          t.customers,
+          COUNT(*) AS targeted_customers,
+          COUNT(*) * ANY_VALUE(s.cost_per_customer) AS total_cost,
+          ANY_VALUE(s.save_rate) * SUM(s.expected_loss) AS expected_prevented_loss,
+          SUM(s.churn_label) AS churners_targeted,
+          SUM(s.churn_label) / COUNT(*) AS churn_precision,
+          SUM(s.churn_label) / NULLIF(ANY_VALUE(t.churners), 0) AS churn_recall,
+          SUM(s.revenue_pred_window) AS revenue_targeted,
+          SUM(s.revenue_pred_window) / NULLIF(ANY_VALUE(t.revenue_total), 0) AS revenue_capture,
+          ANY_VALUE(s.save_rate) * SUM(s.churn_label * s.expected_revenue)
+            - COUNT(*) * ANY_VALUE(s.cost_per_customer) AS realized_uplift_proxy
+        FROM selected s
+        JOIN totals t USING (cutoff_date)
+        GROUP BY s.policy, s.cutoff_date, t.customers
+        ORDER BY s.policy, s.cutoff_date
+    """).fetchdf()
+    con.close()
+
+    out["roi_proxy"] = out["realized_uplift_proxy"] / out["total_cost"]
+
+    if train_cutoffs is None:
+        train_cutoffs = training_cutoffs()
+    days = pd.to_datetime(out["cutoff_date"]).dt.strftime("%Y-%m-%d")
+    out.insert(2, "in_sample", None if train_cutoffs is None else days.isin(train_cutoffs))
+    return out
+
+
+def summarize_backtest(results: pd.DataFrame, include_in_sample: bool = False) -> pd.DataFrame:
+    """
+    Pooled over cutoffs, one row per policy. In-sample cutoffs (optimistic) are
+    left out unless include_in_sample=True.
+    """
+    if not include_in_sample:
+        results = results[results["in_sample"].ne(True)]
+    g = results.groupby("policy")
+    out = pd.DataFrame({
+        "cutoffs": g["cutoff_date"].nunique(),
+        "targeted_customers": g["targeted_customers"].sum(),
+        "total_cost": g["total_cost"].sum(),
+        "churners_targeted": g["churners_targeted"].sum(),
+        "mean_churn_precision": g["churn_precision"].mean(),
+        "mean_churn_recall": g["churn_recall"].mean(),
+        "mean_revenue_capture": g["revenue_capture"].mean(),
+        "realized_uplift_proxy": g["realized_uplift_proxy"].sum(),
+    })
+    out["roi_proxy"] = out["realized_uplift_proxy"] / out["total_cost"]
+    return out.reset_index().sort_values("realized_uplift_proxy", ascending=False)
+
+
+if __name__ == "__main__":
+    policies = [
+        Policy("loss_only", score="expected_loss"),
+        Policy("blended_70_30", score="blended_score", w_loss=0.7, w_clv=0.3),
+        Policy("blended_50_50", score="blended_score", w_loss=0.5, w_clv=0.5),
+        Policy("clv_only", score="blended_score", w_loss=0.0, w_clv=1.0),
+    ]
+
+    results = backtest_policies(policies)
+
+    pd.set_option("display.width", 200)
+    print("\n=== Per cutoff (in_sample = training cutoff, optimistic) ===")
+    print(results.to_string(index=False))
+
+    print("\n=== Pooled (out-of-time cutoffs) ===")
+    print(summarize_backtest(results).to_string(index=False))
+
+    print("\n=== Pooled (all cutoffs, incl. in-sample) ===")
+    print(summarize_backtest(results, include_in_sample=True).to_string(index=False))
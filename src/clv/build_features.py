@@ -3,7 +3,7 @@ from clv.features_sql import build_customer_features_sql
 
 
 def build_features(windows):
-    con = get_connection()
+    con = get_connection(stage="build")
 
     sql = build_customer_features_sql(windows)
     con.execute(sql)
@@ -0,0 +1,234 @@
+"""
+bundle.py
+
+Single-file, versioned model bundle for scoring.
+
+Layout of artifacts/models/clv_models.bundle:
+- 8-byte magic + uint64 manifest length
+- JSON manifest: format version, feature list, per-component kind/params/hash,
+  churn calibration, and the dtype/shape/offset of every array payload
+- 64-byte aligned raw array payloads (the compiled models from clv.inference)
+
+Loading reads only the manifest. Each component (churn / spend / revenue) is
+rebuilt on first access from np.memmap views into the file, so startup does not
+import xgboost/sklearn and every process scoring from the same bundle shares
+the model pages through the OS page cache. The first access also checks the
+component against its manifest sha256 and raises on a mismatch (truncated or
+modified file).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+
+from clv.inference import (
+    CompiledLinearClassifier,
+    CompiledTreeClassifier,
+    CompiledTreeRegressor,
+    Preprocessor,
+    TreeEnsemble,
+    compile_model,
+)
+
+
+BUNDLE_PATH = "artifacts/models/clv_models.bundle"
+FORMAT_VERSION = 1
+
+_MAGIC = b"CLVBNDL\x00"
+_ALIGN = 64
+_COMPONENTS = ("churn", "spend", "revenue")
+_TYPES = {
+    cls.__name__: cls
+    for cls in (CompiledTreeClassifier, CompiledLinearClassifier, CompiledTreeRegressor, TreeEnsemble, Preprocessor)
+}
+
+
+def _flatten(obj, prefix: str, arrays: dict, params: dict, types: dict) -> None:
+    types[prefix] = type(obj).__name__
+    for f in fields(obj):
+        v = getattr(obj, f.name)
+        key = f"{prefix}.{f.name}" if prefix else f.name
+        if is_dataclass(v):
+            _flatten(v, key, arrays, params, types)
+        elif isinstance(v, np.ndarray):
+            arrays[key] = np.ascontiguousarray(v)
+        else:
+            params[key] = v.item() if isinstance(v, np.generic) else v
+
+
+def _unflatten(prefix: str, types: dict, arrays: dict, params: dict):
+    cls = _TYPES[types[prefix]]
+    kwargs = {}
+    for f in fields(cls):
+        key = f"{prefix}.{f.name}" if prefix else f.name
+        if key in types:
+            kwargs[f.name] = _unflatten(key, types, arrays, params)
+        elif key in arrays:
+            kwargs[f.name] = arrays[key]
+        elif key in params:
+            kwargs[f.name] = params[key]
+    return cls(**kwargs)
+
+
+def _component_hash(arrays: dict, params: dict) -> str:
+    h = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for name in sorted(arrays):
+        a = arrays[name]
+        h.update(f"{name}:{a.dtype.str}:{a.shape}".encode("utf-8"))
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def save_bundle(churn_model, spend_model, revenue_model, feature_cols: list[str], path: str = BUNDLE_PATH) -> dict:
+    """
+    Compile the three models and write them as one bundle file (atomically).
+    Returns the manifest.
+    """
+    payloads = []  # (component, name, array)
+    components = {}
+
+    for name, model in zip(_COMPONENTS, (churn_model, spend_model, revenue_model)):
+        compiled = compile_model(model)
+        arrays, params, types = {}, {}, {}
+        _flatten(compiled, "", arrays, params, types)
+
+        components[name] = {
+            "kind": types[""],
+            "types": types,
+            "params": params,
+            "sha256": _component_hash(arrays, params),
+            "arrays": {},
+        }
+        payloads.extend((name, k, a) for k, a in arrays.items())
+
+    version = hashlib.sha256(
+        json.dumps([list(feature_cols)] + [components[c]["sha256"] for c in _COMPONENTS]).encode("utf-8")
+    ).hexdigest()[:16]
+
+    churn_arrays = {k: a for c, k, a in payloads if c == "churn"}
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "feature_cols": list(feature_cols),
+        "calibration": None if "calib_a" not in churn_arrays else {
+            "method": "sigmoid",
+            "a": churn_arrays["calib_a"].tolist(),
+            "b": churn_arrays["calib_b"].tolist(),
+        },
+        "components": components,
+    }
+
+    # Offsets are relative to the (aligned) start of the payload section,
+    # so they do not depend on the manifest length.
+    offset = 0
+    for name, key, a in payloads:
+        manifest["components"][name]["arrays"][key] = {
+            "dtype": a.dtype.str,
+            "shape": list(a.shape),
+            "offset": offset,
+        }
+        offset += -(-a.nbytes // _ALIGN) * _ALIGN
+
+    header = json.dumps(manifest, indent=1).encode("utf-8")
+    data_start = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(out.suffix + ".tmp")
+
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, key, a in payloads:
+            f.seek(data_start + manifest["components"][name]["arrays"][key]["offset"])
+            f.write(a.tobytes())
+        f.truncate(data_start + offset)
+
+    os.replace(tmp, out)
+    return manifest
+
+
+def build_bundle_from_artifacts(model_dir: str = "artifacts/models", path: str = BUNDLE_PATH) -> dict:
+    """
+    Bundle the joblib artifacts written by train_churn / train_revenue.
+    """
+    import joblib
+
+    manifest = save_bundle(
+        churn_model=joblib.load(f"{model_dir}/churn_xgb.joblib"),
+        spend_model=joblib.load(f"{model_dir}/spend_clf.joblib"),
+        revenue_model=joblib.load(f"{model_dir}/revenue_reg.joblib"),
+        feature_cols=joblib.load(f"{model_dir}/feature_cols.joblib"),
+        path=path,
+    )
+    print(f"Saved model bundle: {path} (version={manifest['version']})")
+    return manifest
+
+
+class ModelBundle:
+    """
+    Read-only view of a bundle file. Components are built lazily on first use
+    from memory-mapped arrays.
+    """
+
+    def __init__(self, path: str = BUNDLE_PATH):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"Not a CLV model bundle: {self.path}")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            self.manifest = json.loads(f.read(header_len).decode("utf-8"))
+
+        if self.manifest["format_version"] > FORMAT_VERSION:
+            raise ValueError(
+                f"Bundle format {self.manifest['format_version']} is newer than supported ({FORMAT_VERSION})"
+            )
+        self._data_start = -(-(len(_MAGIC) + 8 + header_len) // _ALIGN) * _ALIGN
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def feature_cols(self) -> list[str]:
+        return list(self.manifest["feature_cols"])
+
+    def _load(self, name: str):
+        spec = self.manifest["components"][name]
+        arrays = {}
+        for key, a in spec["arrays"].items():
+            shape = tuple(a["shape"])
+            if int(np.prod(shape)) == 0:
+                arrays[key] = np.empty(shape, dtype=a["dtype"])
+            else:
+                arrays[key] = np.memmap(self.path, dtype=a["dtype"], mode="r", offset=self._data_start + a["offset"], shape=shape)
+        if _component_hash(arrays, spec["params"]) != spec["sha256"]:
+            raise ValueError(f"Bundle component '{name}' does not match its sha256: {self.path}")
+        return _unflatten("", spec["types"], arrays, spec["params"])
+
+    @cached_property
+    def churn(self) -> CompiledTreeClassifier:
+        return self._load("churn")
+
+    @cached_property
+    def spend(self) -> CompiledLinearClassifier:
+        return self._load("spend")
+
+    @cached_property
+    def revenue(self) -> CompiledTreeRegressor:
+        return self._load("revenue")
+
+
+def load_bundle(path: str = BUNDLE_PATH) -> ModelBundle:
+    return ModelBundle(path)
@@ -1,32 +1,98 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 
 
-def retention_simulation(df: pd.DataFrame, target_pct: float, save_rate: float, cost_per_customer: float):
+@dataclass
+class StrategySummary:
+    targeted_customers: int
+    total_cost: float
+    expected_prevented_loss: float
+    net_uplift: float
+    roi: float | None
+
+
+# -------------------------
+# Targeting engine (NumPy arrays, partial selection)
+# -------------------------
+def percentile_rank(values) -> np.ndarray:
     """
-    df must include: CustomerID, churn_prob, revenue_pred_window, risk_score
-    target_pct: 0.1 / 0.2 / 0.3 ...
-    save_rate: expected fraction of targeted churners you retain (0-1)
-    cost_per_customer: campaign cost per targeted customer
+    Percentile rank in (0, 1], ties averaged. Same as Series.rank(pct=True, method="average");
+    NaN stays NaN and is excluded from the denominator.
     """
-    df = df.sort_values("risk_score", ascending=False).copy()
-    top_n = int(len(df) * target_pct)
-    targeted = df.head(top_n).copy()
+    v = np.asarray(values, dtype=float)
+    out = np.full(len(v), np.nan)
+    valid = ~np.isnan(v)
+    if not valid.any():
+        return out
 
-    # Expected prevented loss = save_rate * sum(risk_score)
-    expected_prevented_revenue = save_rate * targeted["risk_score"].sum()
+    uniq, inv, counts = np.unique(v[valid], return_inverse=True, return_counts=True)
+    first = np.cumsum(counts) - counts  # rows strictly below each distinct value
+    out[valid] = (first[inv] + (counts[inv] + 1) / 2.0) / valid.sum()
+    return out
 
-    total_cost = cost_per_customer * len(targeted)
-    net_uplift = expected_prevented_revenue - total_cost
+
+def add_percentile_rank(df: pd.DataFrame, col: str, out_col: str) -> pd.DataFrame:
+    # percentile rank in [0,1]
+    df[out_col] = percentile_rank(df[col].to_numpy())
+    return df
+
+
+def blended_score(loss_rank: np.ndarray, clv_rank: np.ndarray, w_loss: float, w_clv: float) -> np.ndarray:
+    return w_loss * loss_rank + w_clv * clv_rank
+
+
+def n_targetable(n: int, budget_eur: float, cost_per_customer: float, max_customers: int) -> int:
+    """
+    How many customers both constraints allow (capacity, then budget).
+    """
+    affordable_n = int(budget_eur // cost_per_customer) if cost_per_customer > 0 else 0
+    return max(0, min(n, max_customers, affordable_n))
+
+
+def top_k_indices(scores, k: int) -> np.ndarray:
+    """
+    Positions of the k highest scores, best first. O(n + k log k): argpartition
+    then a sort of the selected k only. NaN scores rank last.
+    """
+    s = np.asarray(scores, dtype=float)
+    n = len(s)
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+
+    if np.isnan(s).any():
+        s = np.where(np.isnan(s), -np.inf, s)
+    idx = np.argpartition(s, n - k)[n - k:] if k < n else np.arange(n)
+    # sort the selected k by score (desc), ties by position (deterministic)
+    return idx[np.lexsort((idx, -s[idx]))]
+
+
+def select_targets(scores, budget_eur: float, cost_per_customer: float, max_customers: int) -> np.ndarray:
+    scores = np.asarray(scores)
+    return top_k_indices(scores, n_targetable(len(scores), budget_eur, cost_per_customer, max_customers))
+
+
+def summarize_targets(expected_loss, idx: np.ndarray, cost_per_customer: float, save_rate: float) -> StrategySummary:
+    """
+    Prevented loss is always based on expected_loss (business truth), whatever was used to rank.
+    """
+    total_cost = float(len(idx) * cost_per_customer)
+    expected_prevented_loss = float(save_rate * np.asarray(expected_loss, dtype=float)[idx].sum())
+    net_uplift = expected_prevented_loss - total_cost
     roi = (net_uplift / total_cost) if total_cost > 0 else None
 
-    return {
-        "targeted_customers": len(targeted),
-        "expected_prevented_revenue": float(expected_prevented_revenue),
-        "total_cost": float(total_cost),
-        "net_uplift": float(net_uplift),
-        "roi": None if roi is None else float(roi),
-        "target_list": targeted[["CustomerID", "churn_prob", "revenue_pred_window", "risk_score"]],
-    }
+    return StrategySummary(
+        targeted_customers=int(len(idx)),
+        total_cost=total_cost,
+        expected_prevented_loss=expected_prevented_loss,
+        net_uplift=float(net_uplift),
+        roi=None if roi is None else float(roi),
+    )
+
 
 def optimize_targeting(
     df: pd.DataFrame,
@@ -35,16 +101,18 @@ def optimize_targeting(
     max_customers: int,
     save_rate: float,
     score_col: str = "expected_loss",
-):
+    loss_col: str = "expected_loss",
+) -> tuple[pd.DataFrame, StrategySummary]:
     """
-    df must include: CustomerID and score_col (default expected_loss)
+    df must include: CustomerID, score_col and loss_col (default expected_loss)
     Optional: churn_prob, spend_prob, expected_revenue, expected_clv (for reporting)
 
     Select top customers by score_col under BOTH:
     - budget constraint
     - max_customers constraint
-    """
 
+    Returns (target rows ordered by score, summary). Only the selected rows are copied.
+    """
     if cost_per_customer <= 0:
         raise ValueError("cost_per_customer must be > 0")
     if budget_eur < 0:
@@ -54,28 +122,579 @@ def optimize_targeting(
     if not (0 <= save_rate <= 1):
         raise ValueError("save_rate must be between 0 and 1")
 
-    df = df.copy().sort_values(score_col, ascending=False)
+    idx = select_targets(df[score_col].to_numpy(), budget_eur, cost_per_customer, max_customers)
+    summary = summarize_targets(df[loss_col].to_numpy(), idx, cost_per_customer, save_rate)
+    return df.iloc[idx], summary
 
-    # Capacity constraint first
-    df = df.head(max_customers).copy()
 
-    # Budget constraint: how many can we afford?
-    affordable_n = int(budget_eur // cost_per_customer)
-    affordable_n = max(0, affordable_n)
+# -------------------------
+# Knapsack targeting (per-customer costs)
+# -------------------------
+@dataclass
+class KnapsackSummary(StrategySummary):
+    lp_upper_bound: float
+    optimality_gap: float | None
 
-    targeted = df.head(min(len(df), affordable_n)).copy()
 
-    total_cost = len(targeted) * cost_per_customer
-    expected_prevented = save_rate * targeted[score_col].sum()
-    net_uplift = expected_prevented - total_cost
+def _lp_upper_bound(value: np.ndarray, cost: np.ndarray, budget_eur: float, max_customers: int, iters: int = 60) -> tuple[float, float]:
+    """
+    LP relaxation optimum of max sum(value * x) s.t. sum(cost * x) <= budget, sum(x) <= max_customers,
+    0 <= x <= 1, via its Lagrangian dual over the budget constraint:
+        UB(lam) = lam * budget + sum of the max_customers largest positive (value - lam * cost)
+    UB is convex in lam and every lam gives a valid bound; golden-section search finds the minimum.
+    Returns (bound, lam) where lam is the budget's shadow price.
+    """
+    n = len(value)
+    k = min(max_customers, n)
+    if k <= 0:
+        return 0.0, 0.0
+
+    def ub(lam: float) -> float:
+        z = value - lam * cost
+        z = z[z > 0]
+        if len(z) > k:
+            z = np.partition(z, len(z) - k)[len(z) - k:]
+        return float(lam * budget_eur + z.sum())
+
+    paid = cost > 0
+    hi = float((value[paid] / cost[paid]).max()) if paid.any() else 0.0
+    lo, hi = 0.0, max(hi, 0.0)
+    best = min((ub(lo), lo), (ub(hi), hi))
+
+    g = (np.sqrt(5.0) - 1.0) / 2.0
+    a, b = hi - g * (hi - lo), lo + g * (hi - lo)
+    fa, fb = ub(a), ub(b)
+    for _ in range(iters):
+        if fa <= fb:
+            hi, b, fb = b, a, fa
+            a = hi - g * (hi - lo)
+            fa = ub(a)
+        else:
+            lo, a, fa = a, b, fb
+            b = lo + g * (hi - lo)
+            fb = ub(b)
+        best = min(best, (fa, a), (fb, b))
+    return best
+
+
+def knapsack_select(
+    value,
+    cost,
+    budget_eur: float,
+    max_customers: int,
+    priority=None,
+) -> np.ndarray:
+    """
+    Greedy by priority (default: value/cost ratio), best first, skipping customers
+    that no longer fit the remaining budget. Only customers with value > 0 are candidates.
+
+    Each pass takes the longest affordable prefix of the remaining candidates in
+    ratio order, then drops everything costlier than the remaining budget (it can
+    never fit again); this is the sequential skip-greedy, done in O(n) per pass.
+    The first remaining candidate always fits after the drop, so every pass takes
+    at least one customer and the loop ends when the pool (or capacity) runs out.
+    """
+    value = np.asarray(value, dtype=float)
+    cost = np.asarray(cost, dtype=float)
+
+    cand = np.flatnonzero(np.nan_to_num(value, nan=-np.inf) > 0)
+    if priority is None:
+        with np.errstate(divide="ignore"):
+            key = np.where(cost[cand] > 0, value[cand] / cost[cand], np.inf)
+    else:
+        key = np.asarray(priority, dtype=float)[cand]
+    pool = cand[np.lexsort((cand, -key))]
+
+    selected = []
+    budget_left, cap_left = float(budget_eur), int(max_customers)
+    while cap_left > 0 and len(pool) > 0:
+        pool = pool[cost[pool] <= budget_left]
+        if len(pool) == 0:
+            break
+
+        cum = np.cumsum(cost[pool])
+        take = min(int(np.searchsorted(cum, budget_left, side="right")), cap_left)
+        selected.append(pool[:take])
+        budget_left -= float(cum[take - 1]) if take else 0.0
+        cap_left -= take
+        pool = pool[take:]
+
+    return np.concatenate(selected) if selected else np.empty(0, dtype=np.intp)
+
+
+def optimize_targeting_knapsack(
+    df: pd.DataFrame,
+    budget_eur: float,
+    max_customers: int,
+    save_rate: float,
+    cost_col: str = "contact_cost",
+    loss_col: str = "expected_loss",
+) -> tuple[pd.DataFrame, KnapsackSummary]:
+    """
+    Targeting with a per-customer cost column: maximize sum(save_rate * expected_loss - cost)
+    under the budget (sum of cost) and max_customers constraints.
+
+    Two greedy passes are run and the better one kept: by value/cost ratio, and
+    by LP reduced value (value - lam * cost, lam = the budget's shadow price from
+    the LP bound), which does better when max_customers is the binding constraint.
+    Returns (target rows in greedy order, summary). The summary carries the LP
+    relaxation bound so the optimality gap is visible.
+    """
+    if budget_eur < 0:
+        raise ValueError("budget_eur must be >= 0")
+    if max_customers <= 0:
+        raise ValueError("max_customers must be > 0")
+    if not (0 <= save_rate <= 1):
+        raise ValueError("save_rate must be between 0 and 1")
+
+    cost = df[cost_col].to_numpy(dtype=float)
+    if np.isnan(cost).any() or (cost < 0).any():
+        raise ValueError(f"{cost_col} must be non-negative and not NaN")
+
+    prevented = save_rate * np.nan_to_num(df[loss_col].to_numpy(dtype=float))
+    value = prevented - cost
+
+    positive = value > 0
+    bound, lam = _lp_upper_bound(value[positive], cost[positive], budget_eur, max_customers)
+
+    idx = knapsack_select(value, cost, budget_eur, max_customers)
+    idx_dual = knapsack_select(value, cost, budget_eur, max_customers, priority=value - lam * cost)
+    if value[idx_dual].sum() > value[idx].sum():
+        idx = idx_dual
+
+    total_cost = float(cost[idx].sum())
+    expected_prevented_loss = float(prevented[idx].sum())
+    net_uplift = expected_prevented_loss - total_cost
+    roi = (net_uplift / total_cost) if total_cost > 0 else None
+
+    return df.iloc[idx], KnapsackSummary(
+        targeted_customers=int(len(idx)),
+        total_cost=total_cost,
+        expected_prevented_loss=expected_prevented_loss,
+        net_uplift=float(net_uplift),
+        roi=None if roi is None else float(roi),
+        lp_upper_bound=bound,
+        optimality_gap=max(0.0, float((bound - net_uplift) / bound)) if bound > 0 else None,
+    )
+
+
+# -------------------------
+# Multi-treatment allocation
+# -------------------------
+@dataclass
+class Treatment:
+    name: str
+    cost_per_customer: float
+    save_rate: float
+    capacity: int
+
+
+@dataclass
+class Allocation:
+    target_lists: dict[str, pd.DataFrame]
+    summaries: dict[str, StrategySummary]
+    total: StrategySummary
+
+
+def strategy_summary(cost: float, prevented: float, n: int) -> StrategySummary:
+    net_uplift = prevented - cost
+    roi = (net_uplift / cost) if cost > 0 else None
+    return StrategySummary(
+        targeted_customers=int(n),
+        total_cost=float(cost),
+        expected_prevented_loss=float(prevented),
+        net_uplift=float(net_uplift),
+        roi=None if roi is None else float(roi),
+    )
+
+
+def allocate_treatments(
+    df: pd.DataFrame,
+    treatments: list[Treatment],
+    loss_col: str = "expected_loss",
+) -> Allocation:
+    """
+    Assign each customer at most one treatment to maximize total expected net uplift
+    sum(save_rate_j * expected_loss_i - cost_j), subject to each treatment's capacity.
+
+    The value is supermodular in (save_rate, expected_loss), so by exchange some
+    optimal allocation gives the customers with the highest expected_loss to the
+    treatments in save_rate order, as consecutive blocks. With P the prefix sums of
+    the sorted losses and b_j the end of block j, the objective is
+        sum_j (s_j - s_{j+1}) * P[b_j] - (c_j - c_{j+1}) * b_j
+    which is separable and concave in the b_j, under 0 <= b_j - b_{j-1} <= capacity_j.
+    A DP over treatments solves it exactly: the best previous boundary within the
+    window [b - capacity_j, b] of a concave value function is its argmax, clipped.
+    One sort plus O(n) array work per treatment.
+    """
+    if not treatments:
+        raise ValueError("at least one treatment is required")
+    names = [t.name for t in treatments]
+    if len(set(names)) != len(names):
+        raise ValueError("treatment names must be unique")
+    for t in treatments:
+        if t.cost_per_customer < 0 or t.capacity < 0 or not (0 <= t.save_rate <= 1):
+            raise ValueError(f"invalid treatment: {t}")
+
+    loss = np.nan_to_num(df[loss_col].to_numpy(dtype=float))
+    n = len(loss)
+
+    # treatments by save_rate desc (cheaper first on ties), customers by loss desc
+    t_order = sorted(range(len(treatments)), key=lambda j: (-treatments[j].save_rate, treatments[j].cost_per_customer))
+    save = np.array([treatments[j].save_rate for j in t_order] + [0.0])
+    cost = np.array([treatments[j].cost_per_customer for j in t_order] + [0.0])
+    c_order = top_k_indices(loss, n)
+    P = np.zeros(n + 1)
+    np.cumsum(loss[c_order], out=P[1:])
+
+    # value[b] = best objective with the last processed block ending at b
+    value = np.zeros(1)
+    back = []
+    reach = 0
+    for pos, j in enumerate(t_order):
+        cap = int(treatments[j].capacity)
+        new_reach = min(n, reach + cap)
+        b = np.arange(new_reach + 1)
+        prev = np.clip(int(np.argmax(value)), np.maximum(b - cap, 0), np.minimum(b, reach))
+        value = value[prev] + (save[pos] - save[pos + 1]) * P[: new_reach + 1] - (cost[pos] - cost[pos + 1]) * b
+        back.append(prev)
+        reach = new_reach
+
+    # walk the boundaries back from the best end point
+    ends = [int(np.argmax(value))]
+    for prev in reversed(back[1:]):
+        ends.append(int(prev[ends[-1]]))
+    ends = ends[::-1]
+
+    target_lists, summaries = {}, {}
+    tot_cost = tot_prevented = 0.0
+    start = 0
+    for pos, j in enumerate(t_order):
+        t = treatments[j]
+        members = c_order[start:ends[pos]]
+        start = ends[pos]
+        prevented = float(t.save_rate * loss[members].sum())
+        c = float(t.cost_per_customer * len(members))
+        target_lists[t.name] = df.iloc[members]
+        summaries[t.name] = strategy_summary(c, prevented, len(members))
+        tot_cost += c
+        tot_prevented += prevented
+
+    return Allocation(
+        target_lists={name: target_lists[name] for name in names},
+        summaries={name: summaries[name] for name in names},
+        total=strategy_summary(tot_cost, tot_prevented, start),
+    )
+
+
+# -------------------------
+# Monte Carlo uncertainty
+# -------------------------
+@dataclass
+class SimulationSummary:
+    n_draws: int
+    targeted_customers: int
+    total_cost: float
+    expected_prevented_loss: float
+    net_uplift_mean: float
+    net_uplift_p5: float
+    net_uplift_p50: float
+    net_uplift_p95: float
+    roi_p5: float | None
+    roi_p50: float | None
+    roi_p95: float | None
+    prob_negative_uplift: float
+
+
+def save_rate_draws(save_rate: float, save_rate_sd: float, n_draws: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    One campaign-level save rate per scenario: Beta with the given mean and sd
+    (constant when save_rate_sd == 0).
+    """
+    if save_rate_sd == 0 or save_rate in (0.0, 1.0):
+        return np.full(n_draws, float(save_rate))
+    var = save_rate_sd ** 2
+    if var >= save_rate * (1 - save_rate):
+        raise ValueError("save_rate_sd too large for a Beta distribution around save_rate")
+    concentration = save_rate * (1 - save_rate) / var - 1
+    return rng.beta(save_rate * concentration, (1 - save_rate) * concentration, n_draws)
+
+
+def simulate_prevented_loss(
+    churn_prob,
+    spend_prob,
+    revenue_if_spend,
+    save_rates: np.ndarray,
+    seed: int = 42,
+    chunk_cells: int = 400_000,
+) -> np.ndarray:
+    """
+    Prevented loss per scenario: sum over targets of churn * spend * saved * revenue_if_spend,
+    with churn ~ Bernoulli(churn_prob), spend ~ Bernoulli(spend_prob) and
+    saved ~ Bernoulli(save_rates[d]), all independent.
+
+    The three Bernoullis multiply into one Bernoulli(churn_prob * spend_prob * save_rate),
+    so each (scenario, customer) cell costs one 32-bit random integer and a compare.
+    Scenarios are processed in blocks of ~chunk_cells cells (small enough to stay in cache).
+    """
+    p = np.asarray(churn_prob, dtype=np.float32) * np.asarray(spend_prob, dtype=np.float32)
+    rev = np.nan_to_num(np.asarray(revenue_if_spend, dtype=np.float32))
+    save_rates = np.asarray(save_rates, dtype=np.float32)
+    n, n_draws = len(p), len(save_rates)
+    out = np.zeros(n_draws)
+    if n == 0:
+        return out
+
+    # probability -> uint32 threshold (kept below 2**32 so the cast cannot wrap)
+    scale = np.clip(np.nan_to_num(p), 0, 1) * np.float32(2 ** 32 - 256)
+    bitgen = np.random.SFC64(seed)
+    step = max(1, chunk_cells // n)
+    thr_f = np.empty((step, n), dtype=np.float32)
+    thr = np.empty((step, n), dtype=np.uint32)
+    hit = np.empty((step, n), dtype=bool)
+
+    for a in range(0, n_draws, step):
+        m = min(step, n_draws - a)
+        raw = bitgen.random_raw((m * n + 1) // 2).view(np.uint32)[: m * n].reshape(m, n)
+        np.multiply(scale[None, :], save_rates[a:a + m, None], out=thr_f[:m])
+        thr[:m] = thr_f[:m]
+        np.less(raw, thr[:m], out=hit[:m])
+        out[a:a + m] = hit[:m] @ rev
+    return out
+
+
+def simulate_campaign(
+    targets: pd.DataFrame,
+    cost_per_customer: float,
+    save_rate: float,
+    save_rate_sd: float = 0.05,
+    n_draws: int = 10_000,
+    seed: int = 42,
+    chunk_cells: int = 400_000,
+) -> SimulationSummary:
+    """
+    Scenario intervals for a target list (e.g. the rows returned by optimize_targeting).
+    targets must include churn_prob, spend_prob and pred_revenue_if_spend
+    (or expected_revenue, from which it is derived).
+
+    Cost is fixed, so ROI percentiles are the net uplift percentiles / total_cost.
+    """
+    if n_draws <= 0:
+        raise ValueError("n_draws must be > 0")
+    if not (0 <= save_rate <= 1):
+        raise ValueError("save_rate must be between 0 and 1")
+
+    churn = targets["churn_prob"].to_numpy(dtype=float)
+    spend = targets["spend_prob"].to_numpy(dtype=float)
+    if "pred_revenue_if_spend" in targets.columns:
+        revenue = targets["pred_revenue_if_spend"].to_numpy(dtype=float)
+    else:
+        expected_revenue = targets["expected_revenue"].to_numpy(dtype=float)
+        revenue = np.divide(expected_revenue, spend, out=np.zeros_like(expected_revenue), where=spend > 0)
+
+    rng = np.random.default_rng(seed)
+    rates = save_rate_draws(save_rate, save_rate_sd, n_draws, rng)
+    prevented = simulate_prevented_loss(churn, spend, revenue, rates, seed=seed + 1, chunk_cells=chunk_cells)
+
+    total_cost = float(len(targets) * cost_per_customer)
+    net = prevented - total_cost
+    p5, p50, p95 = (float(v) for v in np.percentile(net, [5, 50, 95]))
+
+    def _roi(v):
+        return None if total_cost <= 0 else v / total_cost
+
+    return SimulationSummary(
+        n_draws=int(n_draws),
+        targeted_customers=int(len(targets)),
+        total_cost=total_cost,
+        expected_prevented_loss=float(save_rate * np.nansum(churn * spend * revenue)),
+        net_uplift_mean=float(net.mean()),
+        net_uplift_p5=p5,
+        net_uplift_p50=p50,
+        net_uplift_p95=p95,
+        roi_p5=_roi(p5),
+        roi_p50=_roi(p50),
+        roi_p95=_roi(p95),
+        prob_negative_uplift=float((net < 0).mean()),
+    )
+
+
+# -------------------------
+# ROI curves (one sort, prefix sums)
+# -------------------------
+@dataclass
+class RoiCurve:
+    """
+    cum_expected_loss[k] = sum of expected_loss over the top-k customers by score
+    (length n + 1). With a uniform cost, every budget / capacity / save_rate
+    question for this ranking is a lookup into it.
+    """
+    cum_expected_loss: np.ndarray
+
+    @classmethod
+    def from_scores(cls, scores, expected_loss) -> "RoiCurve":
+        order = top_k_indices(scores, len(scores))
+        cum = np.zeros(len(order) + 1)
+        np.cumsum(np.nan_to_num(np.asarray(expected_loss, dtype=float)[order]), out=cum[1:])
+        return cls(cum)
+
+    @property
+    def n(self) -> int:
+        return len(self.cum_expected_loss) - 1
+
+    def summary(self, budget_eur: float, cost_per_customer: float, max_customers: int, save_rate: float) -> StrategySummary:
+        k = n_targetable(self.n, budget_eur, cost_per_customer, max_customers)
+        total_cost = float(k * cost_per_customer)
+        prevented = float(save_rate * self.cum_expected_loss[k])
+        net_uplift = prevented - total_cost
+        roi = (net_uplift / total_cost) if total_cost > 0 else None
+        return StrategySummary(
+            targeted_customers=int(k),
+            total_cost=total_cost,
+            expected_prevented_loss=prevented,
+            net_uplift=float(net_uplift),
+            roi=None if roi is None else float(roi),
+        )
+
+    def net_uplift(self, cost_per_customer: float, save_rate: float) -> np.ndarray:
+        """
+        Net uplift when targeting the top k, for k = 0..n.
+        """
+        return save_rate * self.cum_expected_loss - cost_per_customer * np.arange(self.n + 1)
+
+    def optimal(self, cost_per_customer: float, save_rate: float, max_customers: int | None = None) -> dict:
+        """
+        k (and budget) with the highest net uplift, within max_customers.
+        """
+        net = self.net_uplift(cost_per_customer, save_rate)[: (max_customers if max_customers is not None else self.n) + 1]
+        k = int(np.argmax(net))
+        return {"targeted_customers": k, "budget_eur": float(k * cost_per_customer), "net_uplift": float(net[k])}
+
+    def breakeven(self, cost_per_customer: float, save_rate: float, max_customers: int | None = None) -> dict:
+        """
+        Largest k (and budget) whose net uplift is still >= 0; spending beyond it loses money overall.
+        """
+        net = self.net_uplift(cost_per_customer, save_rate)[: (max_customers if max_customers is not None else self.n) + 1]
+        k = int(np.flatnonzero(net >= 0)[-1])
+        return {"targeted_customers": k, "budget_eur": float(k * cost_per_customer), "net_uplift": float(net[k])}
+
+
+# -------------------------
+# Blend-weight sweep (batched over weights)
+# -------------------------
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row-wise top_k_indices for a (n_weights, n) score matrix.
+    """
+    n = scores.shape[1]
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    idx = np.argpartition(scores, n - k, axis=1)[:, n - k:] if k < n else np.broadcast_to(np.arange(n), scores.shape)
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.lexsort((idx, -vals), axis=-1)
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def sweep_blend_weights(
+    expected_loss,
+    expected_clv,
+    w_loss_grid,
+    budget_grid=(500.0,),
+    max_customers_grid=(2000,),
+    cost_per_customer: float = 1.0,
+    save_rate: float = 0.15,
+    max_block_cells: int = 20_000_000,
+) -> pd.DataFrame:
+    """
+    Evaluate blended targeting (w_loss * rank(loss) + (1 - w_loss) * rank(clv)) for
+    every point of w_loss_grid x budget_grid x max_customers_grid.
+
+    Ranks are computed once. Weights are processed in blocks of a (block, n) score
+    matrix; each row is partially selected once to the largest k any budget/capacity
+    pair allows, and smaller k are read from prefix sums over that sorted top-k.
+    Overlap with loss-only targeting at the same k uses a position mask.
+    """
+    loss = np.asarray(expected_loss, dtype=float)
+    clv = np.asarray(expected_clv, dtype=float)
+    n = len(loss)
+    w_grid = np.asarray(w_loss_grid, dtype=float)
+
+    pairs = [(float(b), int(m)) for b in budget_grid for m in max_customers_grid]
+    ks = np.array([n_targetable(n, b, cost_per_customer, m) for b, m in pairs])
+    K = int(ks.max()) if len(ks) else 0
+
+    loss_rank = percentile_rank(loss)
+    clv_rank = percentile_rank(clv)
+    loss0 = np.nan_to_num(loss)
+    clv0 = np.nan_to_num(clv)
+
+    # loss-only position of every customer (K = outside the top K)
+    base_pos = np.full(n, K, dtype=np.int64)
+    base_pos[top_k_indices(loss, K)] = np.arange(K)
+
+    block = max(1, max_block_cells // max(n, 1))
+    rows = []
+    for start in range(0, len(w_grid), block):
+        w = w_grid[start:start + block]
+        top = np.empty((len(w), 0), dtype=np.intp)
+        if K > 0:
+            scores = w[:, None] * loss_rank[None, :] + (1.0 - w)[:, None] * clv_rank[None, :]
+            top = _top_k_rows(scores, K)
+
+        # prefix sums along each weight's ranking; column j = first j customers
+        cum_loss = np.zeros((len(w), K + 1))
+        cum_clv = np.zeros((len(w), K + 1))
+        np.cumsum(loss0[top], axis=1, out=cum_loss[:, 1:])
+        np.cumsum(clv0[top], axis=1, out=cum_clv[:, 1:])
+        top_base_pos = base_pos[top]
+
+        for (budget_eur, max_customers), k in zip(pairs, ks):
+            total_cost = k * cost_per_customer
+            prevented = save_rate * cum_loss[:, k]
+            net_uplift = prevented - total_cost
+            overlap = (top_base_pos[:, :k] < k).sum(axis=1)
+
+            rows.append(pd.DataFrame({
+                "w_loss": w,
+                "w_clv": 1.0 - w,
+                "budget_eur": budget_eur,
+                "max_customers": max_customers,
+                "targeted": k,
+                "total_cost": float(total_cost),
+                "expected_prevented_loss": prevented,
+                "net_uplift": net_uplift,
+                "roi": net_uplift / total_cost if total_cost > 0 else np.nan,
+                "avg_expected_clv_targeted": cum_clv[:, k] / k if k > 0 else np.nan,
+                "avg_expected_loss_targeted": cum_loss[:, k] / k if k > 0 else np.nan,
+                "overlap_vs_loss_only": overlap / max(1, k),
+            }))
+
+    if not rows:
+        return pd.DataFrame()
+    return pd.concat(rows, ignore_index=True)
+
+
+def retention_simulation(df: pd.DataFrame, target_pct: float, save_rate: float, cost_per_customer: float):
+    """
+    df must include: CustomerID, churn_prob, revenue_pred_window, risk_score
+    target_pct: 0.1 / 0.2 / 0.3 ...
+    save_rate: expected fraction of targeted churners you retain (0-1)
+    cost_per_customer: campaign cost per targeted customer
+    """
+    top_n = int(len(df) * target_pct)
+    targeted = df.iloc[top_k_indices(df["risk_score"].to_numpy(), top_n)]
+
+    # Expected prevented loss = save_rate * sum(risk_score)
+    expected_prevented_revenue = save_rate * targeted["risk_score"].sum()
+
+    total_cost = cost_per_customer * len(targeted)
+    net_uplift = expected_prevented_revenue - total_cost
     roi = (net_uplift / total_cost) if total_cost > 0 else None
 
     return {
-        "targeted_customers": int(len(targeted)),
+        "targeted_customers": len(targeted),
+        "expected_prevented_revenue": float(expected_prevented_revenue),
         "total_cost": float(total_cost),
-        "expected_prevented_loss": float(expected_prevented),
         "net_uplift": float(net_uplift),
         "roi": None if roi is None else float(roi),
-        "target_list": targeted,
+        "target_list": targeted[["CustomerID", "churn_prob", "revenue_pred_window", "risk_score"]],
     }
-
@@ -1,9 +1,8 @@
-import duckdb
+from clv.db import DB_PATH, connect
 
-DB_PATH = "data/warehouse.duckdb"
 
 def main():
-    con = duckdb.connect(DB_PATH)
+    con = connect(DB_PATH)
 
     print("\n=== TABLES ===")
     print(con.execute("SHOW TABLES").fetchdf())
@@ -0,0 +1,181 @@
+"""
+cohorts.py
+
+Acquisition-cohort retention / revenue, materialized in DuckDB:
+
+    customer_cohorts(CustomerID, cohort_month)                first purchase month
+    cohort_activity(cohort_month, activity_month, months_since,
+                    active_customers, orders, net_revenue, updated_at)
+
+- a customer is active in a month with at least one non-cancelled invoice;
+  net_revenue includes that month's returns
+- fact_transactions is read once per build (customer-month aggregate in a temp
+  table); both tables are filled from it
+- incremental: only activity months from the last stored month onward
+  (trailing_months back) are deleted and recomputed; customers acquired in that
+  range are re-derived, older cohorts keep their month. full=True rebuilds all
+  (e.g. after history was corrected)
+
+load_cohorts adds cohort_size, retention and revenue per cohort customer;
+cohort_matrix pivots any of them to cohort_month x months_since.
+
+Run:
+    python src/clv/cohorts.py
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+from clv.db import DB_PATH, connect
+
+
+FACT_TABLE = "fact_transactions"
+CUSTOMERS_TABLE = "customer_cohorts"
+COHORTS_TABLE = "cohort_activity"
+
+
+def ensure_cohort_tables(con, table: str = COHORTS_TABLE, customers_table: str = CUSTOMERS_TABLE) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {customers_table} (
+            CustomerID BIGINT PRIMARY KEY,
+            cohort_month DATE
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            cohort_month DATE,
+            activity_month DATE,
+            months_since INTEGER,
+            active_customers BIGINT,
+            orders BIGINT,
+            net_revenue DOUBLE,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def build_cohorts(
+    trailing_months: int = 1,
+    full: bool = False,
+    source: str = FACT_TABLE,
+    table: str = COHORTS_TABLE,
+    customers_table: str = CUSTOMERS_TABLE,
+    db_path: str = DB_PATH,
+) -> int:
+    """
+    Refresh cohort_activity from the last `trailing_months` stored activity months on
+    (everything when the table is empty or full=True). Returns rows written.
+    """
+    if trailing_months < 1:
+        raise ValueError("trailing_months must be >= 1")
+
+    con = connect(db_path, stage="build")
+    ensure_cohort_tables(con, table, customers_table)
+
+    last = None if full else con.execute(f"SELECT MAX(activity_month) FROM {table}").fetchone()[0]
+    start = pd.Timestamp("1900-01-01") if last is None else pd.Timestamp(last) - pd.DateOffset(months=trailing_months - 1)
+    start = str(start.date())
+
+    # one pass over the source: customer x month
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE cohort_customer_months AS
+        SELECT
+          CustomerID,
+          CAST(date_trunc('month', InvoiceDate) AS DATE) AS activity_month,
+          COUNT(DISTINCT InvoiceNo) FILTER (WHERE NOT COALESCE(is_cancelled, FALSE)) AS orders,
+          SUM(net_revenue) AS net_revenue
+        FROM {source}
+        WHERE CustomerID IS NOT NULL
+          AND InvoiceDate >= CAST(? AS TIMESTAMP)
+        GROUP BY ALL
+    """, [start])
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        # customers first seen in the range (anyone with an earlier purchase keeps their cohort)
+        con.execute(f"DELETE FROM {customers_table} WHERE cohort_month >= CAST(? AS DATE)", [start])
+        con.execute(f"""
+            INSERT INTO {customers_table}
+            SELECT m.CustomerID, MIN(m.activity_month)
+            FROM cohort_customer_months m
+            ANTI JOIN {customers_table} c ON c.CustomerID = m.CustomerID
+            WHERE m.orders > 0
+            GROUP BY m.CustomerID
+        """)
+
+        con.execute(f"DELETE FROM {table} WHERE activity_month >= CAST(? AS DATE)", [start])
+        rows = con.execute(f"""
+            INSERT INTO {table}
+            SELECT
+              c.cohort_month,
+              m.activity_month,
+              datediff('month', c.cohort_month, m.activity_month) AS months_since,
+              COUNT(*) FILTER (WHERE m.orders > 0) AS active_customers,
+              SUM(m.orders) AS orders,
+              SUM(m.net_revenue) AS net_revenue,
+              now() AS updated_at
+            FROM cohort_customer_months m
+            JOIN {customers_table} c ON c.CustomerID = m.CustomerID
+            WHERE m.activity_month >= c.cohort_month
+            GROUP BY c.cohort_month, m.activity_month
+        """).fetchone()[0]
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        con.close()
+        raise
+
+    con.execute("DROP TABLE cohort_customer_months")
+    con.close()
+
+    print(f"Saved cohorts: {table} (from {start}, rows={rows})")
+    return int(rows)
+
+
+def cohorts_query(table: str = COHORTS_TABLE) -> str:
+    """
+    Long cohort table with cohort_size (active customers in month 0), retention,
+    revenue_per_customer and its cumulative sum (revenue-to-date per acquired customer).
+    """
+    return f"""
+        SELECT
+          cohort_month,
+          activity_month,
+          months_since,
+          active_customers,
+          orders,
+          net_revenue,
+          FIRST_VALUE(active_customers) OVER w AS cohort_size,
+          active_customers / FIRST_VALUE(active_customers) OVER w AS retention,
+          net_revenue / FIRST_VALUE(active_customers) OVER w AS revenue_per_customer,
+          SUM(net_revenue) OVER w / FIRST_VALUE(active_customers) OVER w AS cum_revenue_per_customer
+        FROM {table}
+        WINDOW w AS (PARTITION BY cohort_month ORDER BY months_since)
+        ORDER BY cohort_month, months_since
+    """
+
+
+def load_cohorts(table: str = COHORTS_TABLE, db_path: str = DB_PATH) -> pd.DataFrame:
+    con = connect(db_path, read_only=True)
+    out = con.execute(cohorts_query(table)).fetchdf()
+    con.close()
+    return out
+
+
+def cohort_matrix(cohorts: pd.DataFrame, value: str = "retention") -> pd.DataFrame:
+    """
+    cohort_month x months_since matrix of one column of load_cohorts.
+    """
+    return cohorts.pivot(index="cohort_month", columns="months_since", values=value)
+
+
+if __name__ == "__main__":
+    build_cohorts()
+    cohorts = load_cohorts()
+
+    print("\n=== Retention (share of cohort active) ===")
+    print(cohort_matrix(cohorts, "retention").round(3).to_string())
+
+    print("\n=== Cumulative net revenue per acquired customer ===")
+    print(cohort_matrix(cohorts, "cum_revenue_per_customer").round(1).to_string())
@@ -0,0 +1,16 @@
+from pathlib import Path
+
+import yaml
+
+
+PARAMS_PATH = "configs/params.yaml"
+
+
+def load_params(path: str = PARAMS_PATH) -> dict:
+    """
+    configs/params.yaml as a dict ({} when the file is missing).
+    """
+    if not Path(path).exists():
+        return {}
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
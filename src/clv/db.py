@@ -1,17 +1,140 @@
-import duckdb
+"""
+db.py
+
+Shared DuckDB session manager.
+
+- one root connection per database file per process (DuckDB allows a single
+  configuration per file per process, and a read-write handle locks the file
+  for other processes); every caller gets a cursor on it
+- cursors are cheap, have their own transactions / registered DataFrames /
+  temp tables, and are the unit to hand to threads (one cursor per thread)
+- closing a cursor leaves the database open for the next caller;
+  close_all() releases the file (e.g. before worker processes open it)
+- execution profiles per stage from configs/params.yaml (duckdb.profiles):
+  threads, memory_limit and preserve_insertion_order. These are instance-wide
+  settings, so the profile of the stage that connected last applies to the
+  whole process.
+  temp_directory (duckdb.temp_directory) is fixed when the root connection
+  opens: DuckDB refuses to switch it once anything has spilled there.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+from dataclasses import dataclass
 from pathlib import Path
 
+import duckdb
+
+from clv.config import load_params
+
+
+_DUCKDB_PARAMS = load_params().get("duckdb", {})
+
+DB_PATH = _DUCKDB_PARAMS.get("path", "data/warehouse.duckdb")
+TEMP_DIRECTORY = _DUCKDB_PARAMS.get("temp_directory")  # spill target; None = DuckDB default (<db>.tmp)
+
+_roots: dict[str, tuple[duckdb.DuckDBPyConnection, bool]] = {}
+_lock = threading.Lock()
+
+
+@dataclass
+class ExecutionProfile:
+    threads: int | None = None  # None = DuckDB default (all cores)
+    memory_limit: str | None = None  # e.g. "4GB"; None = DuckDB default (80% of RAM)
+    preserve_insertion_order: bool = True  # False lets scans / inserts run out of order (less memory)
+
+
+def load_profile(stage: str | None = None, params: dict | None = None) -> ExecutionProfile:
+    """
+    profiles.default overlaid with profiles[stage] (DuckDB defaults when nothing is configured).
+    """
+    profiles = (params if params is not None else _DUCKDB_PARAMS).get("profiles") or {}
+    if profiles and stage is not None and stage not in profiles:
+        raise ValueError(f"Unknown DuckDB profile: {stage} (configured: {sorted(profiles)})")
+
+    settings = {**(profiles.get("default") or {}), **(profiles.get(stage) or {})}
+    return ExecutionProfile(**settings)
+
+
+def apply_profile(con, profile: ExecutionProfile) -> None:
+    """
+    SET every option of the profile (RESET the ones left at None), so a
+    stage never inherits the previous stage's settings.
+    """
+    for name, value in [("threads", profile.threads), ("memory_limit", profile.memory_limit)]:
+        if value is None:
+            con.execute(f"RESET {name}")
+        elif isinstance(value, str):
+            con.execute(f"SET {name} = '{value}'")
+        else:
+            con.execute(f"SET {name} = {int(value)}")
+    con.execute(f"SET preserve_insertion_order = {str(bool(profile.preserve_insertion_order)).lower()}")
+
+
+def connect(db_path: str | None = None, read_only: bool = False, stage: str | None = None):
+    """
+    Cursor on this process's shared connection to db_path (default DB_PATH).
 
-DB_PATH = Path("data/warehouse.duckdb")
+    A read-only request reuses a read-write root if one is open; a write
+    request against a read-only root reopens it read-write (close any
+    read-only cursors first). stage applies that execution profile.
+    """
+    db_path = str(db_path or DB_PATH)
+    key = os.path.abspath(db_path)
 
+    with _lock:
+        root = _roots.get(key)
+        if root is not None and root[1] and not read_only:
+            root[0].close()
+            root = None
+        if root is None:
+            config = {}
+            if TEMP_DIRECTORY:
+                Path(TEMP_DIRECTORY).mkdir(parents=True, exist_ok=True)
+                config["temp_directory"] = TEMP_DIRECTORY
+            root = (duckdb.connect(db_path, read_only=read_only, config=config), read_only)
+            _roots[key] = root
+        cur = root[0].cursor()
 
-def get_connection():
-    return duckdb.connect(DB_PATH)
+    if stage is not None:
+        apply_profile(cur, load_profile(stage))
+    return cur
+
+
+def get_connection(stage: str | None = None):
+    return connect(DB_PATH, stage=stage)
+
+
+def close(db_path: str | None = None) -> None:
+    """
+    Close this process's connection to one database file (checkpoints its WAL).
+    """
+    key = os.path.abspath(str(db_path or DB_PATH))
+    with _lock:
+        root = _roots.pop(key, None)
+        if root is not None:
+            root[0].close()
+
+
+def close_all() -> None:
+    """
+    Close every root connection of this process (open cursors become invalid).
+    """
+    with _lock:
+        for con, _ in _roots.values():
+            con.close()
+        _roots.clear()
+
+
+atexit.register(close_all)
 
 
 def inspect_warehouse():
     con = get_connection()
-    
+
     print("\nTables:")
     print(con.execute("SHOW TABLES").fetchdf())
 
@@ -29,10 +152,3 @@ def inspect_warehouse():
 
 if __name__ == "__main__":
     inspect_warehouse()
-
-
-
-
-
-    
-
@@ -0,0 +1,209 @@
+"""
+evaluation.py
+
+Ranking evaluation curves for any score / value column:
+- value_capture   share of value (e.g. revenue_pred_window) in the top pct by score
+- gain            share of positives (e.g. churn_label) in the top pct
+- precision_at_k  positives / top_n
+- lift            precision_at_k / base rate
+
+Per cutoff and pooled: one sort per scope plus cumulative sums, then every
+percentile is a lookup, so the number of percentiles does not change the cost.
+top_n = int(n * pct), as in the train_churn Strategy A/B prints.
+
+Stored in DuckDB for comparing models later:
+
+    evaluation_curves(model_name, model_version, score_col, value_col, label_col, cutoff_date, pct,
+                      top_n, n, value_captured, value_capture, positives, gain, precision_at_k,
+                      lift, created_at)
+
+cutoff_date is NULL for the pooled curve. Rows are keyed by model_version
+(e.g. clv.explain.model_version), so each retrain adds curves next to the
+previous models' instead of replacing them.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from clv.db import DB_PATH, connect
+
+
+CURVES_TABLE = "evaluation_curves"
+DEFAULT_PCTS = np.round(np.arange(1, 101) / 100, 2)
+
+
+def _curve_points(order: np.ndarray, starts: np.ndarray, sizes: np.ndarray, value, labels, pcts) -> dict:
+    """
+    order sorts rows by (group, score desc); groups occupy [starts, starts + sizes) in that order.
+    Returns (n_groups, n_pcts) arrays.
+    """
+    cum_v = np.zeros(len(order) + 1)
+    np.cumsum(value[order], out=cum_v[1:])
+    top_n = (pcts[None, :] * sizes[:, None]).astype(int)
+    lo, hi = starts[:, None], starts[:, None] + top_n
+    total_v = (cum_v[starts + sizes] - cum_v[starts])[:, None]
+
+    out = {
+        "top_n": top_n,
+        "n": np.broadcast_to(sizes[:, None], top_n.shape),
+        "value_captured": cum_v[hi] - cum_v[lo],
+    }
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out["value_capture"] = out["value_captured"] / total_v
+        if labels is None:
+            nan = np.full(top_n.shape, np.nan)
+            out.update(positives=nan, gain=nan, precision_at_k=nan, lift=nan)
+        else:
+            cum_p = np.zeros(len(order) + 1)
+            np.cumsum(labels[order], out=cum_p[1:])
+            total_p = (cum_p[starts + sizes] - cum_p[starts])[:, None]
+            out["positives"] = cum_p[hi] - cum_p[lo]
+            out["gain"] = out["positives"] / total_p
+            out["precision_at_k"] = out["positives"] / top_n
+            out["lift"] = out["precision_at_k"] / (total_p / sizes[:, None])
+    return out
+
+
+def gains_curves(
+    df: pd.DataFrame,
+    score_col: str,
+    value_col: str,
+    label_col: str | None = None,
+    group_col: str | None = "cutoff_date",
+    pcts=DEFAULT_PCTS,
+    pooled: bool = True,
+) -> pd.DataFrame:
+    """
+    Long table: one row per (cutoff_date, pct); cutoff_date is NaT for the pooled rows.
+    NaN scores rank last, NaN values count as 0.
+    """
+    pcts = np.asarray(pcts, dtype=float)
+    score = np.nan_to_num(df[score_col].to_numpy(dtype=float), nan=-np.inf)
+    value = np.nan_to_num(df[value_col].to_numpy(dtype=float))
+    labels = None if label_col is None else np.nan_to_num(df[label_col].to_numpy(dtype=float))
+
+    frames = []
+    if group_col is not None:
+        codes, groups = pd.factorize(df[group_col], sort=True)
+        order = np.lexsort((-score, codes))
+        sizes = np.bincount(codes, minlength=len(groups))
+        starts = np.cumsum(sizes) - sizes
+        pts = _curve_points(order, starts, sizes, value, labels, pcts)
+        frame = pd.DataFrame({k: np.asarray(v).ravel() for k, v in pts.items()})
+        frame.insert(0, "pct", np.tile(pcts, len(groups)))
+        frame.insert(0, "cutoff_date", np.repeat(pd.to_datetime(groups), len(pcts)))
+        frames.append(frame)
+
+    if pooled or group_col is None:
+        order = np.argsort(-score, kind="stable")
+        pts = _curve_points(order, np.array([0]), np.array([len(df)]), value, labels, pcts)
+        frame = pd.DataFrame({k: np.asarray(v).ravel() for k, v in pts.items()})
+        frame.insert(0, "pct", pcts)
+        frame.insert(0, "cutoff_date", pd.NaT)
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def save_curves(
+    curves: pd.DataFrame,
+    model_name: str,
+    score_col: str,
+    value_col: str,
+    label_col: str | None = None,
+    model_version: str | None = None,
+    table: str = CURVES_TABLE,
+    db_path: str = DB_PATH,
+) -> int:
+    """
+    Replace the stored curves for (model_name, model_version, score_col, value_col);
+    other versions are kept. Returns rows written.
+    """
+    rows = curves.copy()
+    rows.insert(0, "label_col", label_col)
+    rows.insert(0, "value_col", value_col)
+    rows.insert(0, "score_col", score_col)
+    rows.insert(0, "model_version", model_version)
+    rows.insert(0, "model_name", model_name)
+    rows["cutoff_date"] = pd.to_datetime(rows["cutoff_date"]).dt.date
+
+    con = connect(db_path)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            model_name VARCHAR,
+            model_version VARCHAR,
+            score_col VARCHAR,
+            value_col VARCHAR,
+            label_col VARCHAR,
+            cutoff_date DATE,
+            pct DOUBLE,
+            top_n BIGINT,
+            n BIGINT,
+            value_captured DOUBLE,
+            value_capture DOUBLE,
+            positives DOUBLE,
+            gain DOUBLE,
+            precision_at_k DOUBLE,
+            lift DOUBLE,
+            created_at TIMESTAMP
+        )
+    """)
+    con.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS model_version VARCHAR")  # tables from before versioning
+    con.register("new_curves", rows)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(
+            f"""DELETE FROM {table}
+                WHERE model_name = ? AND model_version IS NOT DISTINCT FROM ?
+                  AND score_col = ? AND value_col = ?""",
+            [model_name, model_version, score_col, value_col],
+        )
+        con.execute(f"""
+            INSERT INTO {table} BY NAME
+            SELECT model_name, model_version, score_col, value_col, label_col, cutoff_date, pct, top_n, n,
+                   value_captured, value_capture, positives, gain, precision_at_k, lift, now() AS created_at
+            FROM new_curves
+        """)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        con.close()
+        raise
+    con.unregister("new_curves")
+    con.close()
+
+    print(f"Saved evaluation curves: {table} (model={model_name}@{model_version}, score={score_col}, rows={len(rows)})")
+    return len(rows)
+
+
+def load_curves(
+    model_name: str | None = None,
+    model_version: str | None = None,
+    pooled_only: bool = False,
+    table: str = CURVES_TABLE,
+    db_path: str = DB_PATH,
+) -> pd.DataFrame:
+    """
+    Stored curves (optionally one model / version / the pooled rows only) for side-by-side comparison.
+    """
+    where, params = [], []
+    if model_name is not None:
+        where.append("model_name = ?")
+        params.append(model_name)
+    if model_version is not None:
+        where.append("model_version = ?")
+        params.append(model_version)
+    if pooled_only:
+        where.append("cutoff_date IS NULL")
+
+    con = connect(db_path, read_only=True)
+    out = con.execute(f"""
+        SELECT *
+        FROM {table}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY model_name, created_at, model_version, score_col, value_col, cutoff_date NULLS LAST, pct
+    """, params).fetchdf()
+    con.close()
+    return out
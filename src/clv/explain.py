@@ -1,10 +1,443 @@
-import pandas as pd
-import shap
+"""
+explain.py
+
+Churn model explanations.
+
+- Reason codes (score_reason_codes): per-feature contributions for every
+  customer in a scored cutoff from XGBoost's built-in pred_contribs (exact
+  TreeSHAP on the booster, no shap package). Computed in parallel row chunks
+  on single-threaded booster copies (one core per chunk); the top-k drivers
+  per customer are stored in reason_codes_customer.
+- Global importance (global_shap_importance): mean |SHAP| per feature on a
+  stratified sample (by cutoff_date) sized from a pilot so the relative
+  standard error of each material feature's mean |SHAP| is within
+  target_rel_error. Chunks run across worker processes; the result is cached
+  as JSON per model version (hash of the booster bytes) and population (hash
+  of the sorted strata / cutoffs and the row count).
+- Plots (shap_global_local): SHAP summary + force plot. Optional and
+  separate from training (train_churn_model(render_shap=True) or call directly).
+
+Contributions are in log-odds (margin) space. For a calibrated model the
+fold boosters' contributions are averaged, which matches the averaged margin;
+the sigmoid calibration on top is monotone so the ranking of drivers holds.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-import matplotlib.pyplot as plt
+import hashlib
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+import pandas as pd
+
+from clv.db import DB_PATH, connect
+
+
+REASON_CODES_TABLE = "reason_codes_customer"
+SHAP_CACHE_DIR = "artifacts/reports/shap_global"
+
+
+# -------------------------
+# Reason codes
+# -------------------------
+def _boosters(model) -> list:
+    """
+    Underlying xgboost Boosters of an XGBClassifier or CalibratedClassifierCV over one.
+    """
+    if hasattr(model, "calibrated_classifiers_"):
+        return [c.estimator.get_booster() for c in model.calibrated_classifiers_]
+    if hasattr(model, "get_booster"):
+        return [model.get_booster()]
+    raise ValueError(f"Reason codes need an XGBoost churn model, got {type(model).__name__}")
+
+
+def _single_thread_boosters(model) -> list:
+    """
+    Copies of the model's boosters with nthread=1 (the model itself is left as is).
+    """
+    boosters = [b.copy() for b in _boosters(model)]
+    for b in boosters:
+        b.set_param({"nthread": 1})
+    return boosters
+
+
+def _contributions(boosters: list, X: pd.DataFrame) -> np.ndarray:
+    import xgboost as xgb
+
+    dm = xgb.DMatrix(X, missing=np.nan)
+    contribs = [b.predict(dm, pred_contribs=True) for b in boosters]
+    return np.mean(contribs, axis=0) if len(contribs) > 1 else contribs[0]
+
+
+def tree_contributions(model, X: pd.DataFrame) -> np.ndarray:
+    """
+    (n_rows, n_features + 1) contributions in margin space; last column is the bias.
+    """
+    return _contributions(_boosters(model), X)
+
+
+def top_k_reasons(contribs: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Column index and value of the k largest (most churn-increasing) contributions per row,
+    ordered rank 1..k. Bias column excluded.
+    """
+    c = contribs[:, :-1]
+    k = min(k, c.shape[1])
+    idx = np.argpartition(-c, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(c, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def reason_codes(
+    model,
+    df: pd.DataFrame,
+    feature_cols: list[str],
+    top_k: int = 3,
+    chunk_size: int = 50_000,
+    n_jobs: int | None = None,
+) -> pd.DataFrame:
+    """
+    Long-format reason codes: cutoff_date, CustomerID, rank, feature, contribution, feature_value.
+    """
+    values = df[feature_cols].apply(pd.to_numeric, errors="coerce").replace([np.inf, -np.inf], np.nan)
+    X = values.astype(np.float32)  # booster input only; feature_value keeps full precision
+
+    starts = list(range(0, len(X), chunk_size))
+    n_jobs = n_jobs or min(len(starts), os.cpu_count() or 1)
+    # parallel chunks: one xgboost thread each (its own pool per predict would
+    # oversubscribe the cores); a single job keeps xgboost's multi-threaded predict
+    boosters = _single_thread_boosters(model) if n_jobs > 1 else _boosters(model)
+
+    def run(start):
+        chunk = X.iloc[start:start + chunk_size]
+        return top_k_reasons(_contributions(boosters, chunk), top_k)
+
+    # xgboost releases the GIL during prediction, so threads scale across chunks
+    with ThreadPoolExecutor(max_workers=max(n_jobs, 1)) as ex:
+        results = list(ex.map(run, starts))
+
+    if not results:
+        return pd.DataFrame(columns=["cutoff_date", "CustomerID", "rank", "feature", "contribution", "feature_value"])
+
+    idx = np.vstack([r[0] for r in results])
+    vals = np.vstack([r[1] for r in results])
+    n, k = idx.shape
+
+    x = values.to_numpy(dtype=float)
+    rows = np.repeat(np.arange(n), k)
+    cols = idx.ravel()
+
+    return pd.DataFrame({
+        "cutoff_date": pd.to_datetime(np.repeat(df["cutoff_date"].to_numpy(), k)).date,
+        "CustomerID": np.repeat(df["CustomerID"].to_numpy(), k),
+        "rank": np.tile(np.arange(1, k + 1), n),
+        "feature": np.asarray(feature_cols, dtype=object)[cols],
+        "contribution": vals.ravel().astype(float),
+        "feature_value": x[rows, cols],
+    })
+
+
+def score_reason_codes(
+    churn_model,
+    feature_cols: list[str] | None = None,
+    cutoff_date=None,
+    top_k: int = 3,
+    chunk_size: int = 50_000,
+    n_jobs: int | None = None,
+    table_in: str = "customer_model_data_rollup",
+    table_out: str = REASON_CODES_TABLE,
+    db_path: str = DB_PATH,
+) -> int:
+    """
+    Compute reason codes for every customer at one cutoff (default: latest) and
+    replace that cutoff's rows in table_out. Returns the number of customers.
+    """
+    if feature_cols is None:
+        feature_cols = _boosters(churn_model)[0].feature_names
+    if not feature_cols:
+        raise ValueError("feature_cols not given and the booster has no feature names")
+
+    con = connect(db_path, stage="score")
+    if cutoff_date is None:
+        cutoff_date = con.execute(f"SELECT MAX(cutoff_date) FROM {table_in}").fetchone()[0]
+
+    cols = ", ".join(["cutoff_date", "CustomerID"] + list(feature_cols))
+    df = con.execute(
+        f"SELECT {cols} FROM {table_in} WHERE cutoff_date = CAST(? AS DATE)",
+        [cutoff_date],
+    ).fetchdf()
+
+    out = reason_codes(churn_model, df, feature_cols, top_k=top_k, chunk_size=chunk_size, n_jobs=n_jobs)
+
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_out} (
+            cutoff_date DATE,
+            CustomerID BIGINT,
+            rank INTEGER,
+            feature VARCHAR,
+            contribution DOUBLE,
+            feature_value DOUBLE
+        )
+    """)
+    con.register("reasons_df", out)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"DELETE FROM {table_out} WHERE cutoff_date = CAST(? AS DATE)", [cutoff_date])
+        con.execute(f"INSERT INTO {table_out} SELECT * FROM reasons_df")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        con.close()
+        raise
+    con.close()
+
+    print(f"Saved reason codes: {table_out} (cutoff={cutoff_date}, customers={len(df)}, top_k={top_k})")
+    return len(df)
+
+
+# -------------------------
+# Sampled global importance
+# -------------------------
+def model_version(model) -> str:
+    """
+    Short content hash of the booster(s); changes whenever the trees change.
+    """
+    h = hashlib.sha256()
+    for b in _boosters(model):
+        h.update(bytes(b.save_raw("ubj")))
+    return h.hexdigest()[:16]
+
 
+_worker_boosters = None
 
+
+def _init_shap_worker(raw_boosters: list[bytes], single_thread: bool = True):
+    global _worker_boosters
+    if single_thread:
+        # one process per core; no nested OpenMP pools
+        os.environ["OMP_NUM_THREADS"] = "1"
+    import xgboost as xgb
+
+    _worker_boosters = []
+    for raw in raw_boosters:
+        b = xgb.Booster(model_file=bytearray(raw))
+        if single_thread:
+            b.set_param({"nthread": 1})
+        _worker_boosters.append(b)
+
+
+def _population_key(strata: pd.Series | None, n_rows: int) -> str:
+    """
+    Short hash of the sorted strata values (cutoffs) and the row count the importance is computed over.
+    """
+    values = [] if strata is None else sorted(set(pd.Series(strata).astype(str)))
+    return hashlib.sha256(json.dumps([values, int(n_rows)]).encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_path(cache_dir: str, version: str, population: str) -> Path:
+    return Path(cache_dir) / f"{version}_{population}.json"
+
+
+def _cached_importance(version: str, population: str, cache_dir: str | None, target_rel_error: float) -> dict | None:
+    if not cache_dir:
+        return None
+    path = _cache_path(cache_dir, version, population)
+    if not path.exists():
+        return None
+    cached = json.loads(path.read_text(encoding="utf-8"))
+    # a tighter cached estimate is good enough for a looser request
+    return cached if cached.get("target_rel_error", np.inf) <= target_rel_error else None
+
+
+def _abs_shap_stats(X: np.ndarray, feature_names: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    import xgboost as xgb
+
+    dm = xgb.DMatrix(X, missing=np.nan, feature_names=feature_names)
+    contribs = [b.predict(dm, pred_contribs=True)[:, :-1] for b in _worker_boosters]
+    c = (np.mean(contribs, axis=0) if len(contribs) > 1 else contribs[0]).astype(np.float64)
+    a = np.abs(c)
+    return a.sum(axis=0), (a * a).sum(axis=0), c.sum(axis=0), len(c)
+
+
+def _shap_stats(X: np.ndarray, feature_names: list[str], chunk_size: int, n_workers: int, raw_boosters: list[bytes]):
+    """
+    Summed |SHAP|, |SHAP|^2 and signed SHAP per feature over the rows of X.
+    """
+    k = len(feature_names)
+    totals = [np.zeros(k), np.zeros(k), np.zeros(k), 0]
+    if len(X) == 0:
+        return totals
+
+    chunks = [X[i:i + chunk_size] for i in range(0, len(X), chunk_size)]
+    if n_workers <= 1 or len(chunks) == 1:
+        _init_shap_worker(raw_boosters, single_thread=False)
+        results = [_abs_shap_stats(c, feature_names) for c in chunks]
+    else:
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=min(n_workers, len(chunks)),
+            mp_context=ctx,
+            initializer=_init_shap_worker,
+            initargs=(raw_boosters,),
+        ) as ex:
+            results = list(ex.map(_abs_shap_stats, chunks, [feature_names] * len(chunks)))
+
+    for r in results:
+        for i in range(3):
+            totals[i] += r[i]
+        totals[3] += r[3]
+    return totals
+
+
+def _required_sample_size(sum_abs, sum_sq, n, target_rel_error: float, min_share: float) -> int:
+    # n needed so that std(|SHAP_j|) / (sqrt(n) * mean(|SHAP_j|)) <= target for every
+    # feature carrying at least min_share of the total mean |SHAP|
+    mean = sum_abs / n
+    var = np.maximum(sum_sq / n - mean * mean, 0.0) * n / max(n - 1, 1)
+    material = mean >= min_share * mean.sum()
+    if not material.any():
+        return n
+    need = var[material] / (target_rel_error * mean[material]) ** 2
+    return int(np.ceil(need.max()))
+
+
+def global_shap_importance(
+    model,
+    X: pd.DataFrame,
+    strata: pd.Series | None = None,
+    target_rel_error: float = 0.02,
+    min_share: float = 0.01,
+    pilot_size: int = 2_000,
+    max_rows: int = 200_000,
+    chunk_size: int = 5_000,
+    n_workers: int | None = None,
+    cache_dir: str | None = SHAP_CACHE_DIR,
+    seed: int = 42,
+) -> dict:
+    """
+    Mean |SHAP| per feature from a stratified sample. Rows are ordered randomly
+    within each stratum and the sample is the first fraction of every stratum,
+    so the pilot is a subset of the final sample and is not recomputed.
+    """
+    version = model_version(model)
+    population = _population_key(strata, len(X))
+    cached = _cached_importance(version, population, cache_dir, target_rel_error)
+    if cached is not None:
+        return cached
+
+    feature_names = list(X.columns)
+    values = X.apply(pd.to_numeric, errors="coerce").replace([np.inf, -np.inf], np.nan).to_numpy(dtype=np.float32)
+    N = len(values)
+
+    # position of each row within its stratum, in random order, as a fraction in (0, 1)
+    rng = np.random.default_rng(seed)
+    u = pd.Series(rng.random(N))
+    groups = pd.Series(np.zeros(N, dtype=np.int8) if strata is None else strata.to_numpy())
+    pos = u.groupby(groups).rank(method="first").to_numpy()
+    size = groups.map(groups.value_counts()).to_numpy()
+    q = (pos - 0.5) / size
+
+    raw = [bytes(b.save_raw("ubj")) for b in _boosters(model)]
+    n_workers = n_workers or os.cpu_count() or 1
+
+    f0 = min(1.0, pilot_size / max(N, 1))
+    pilot = q < f0
+    stats = _shap_stats(values[pilot], feature_names, chunk_size, n_workers, raw)
+
+    n_target = _required_sample_size(stats[0], stats[1], max(stats[3], 1), target_rel_error, min_share)
+    n_target = min(max(n_target, stats[3]), max_rows, N)
+
+    f1 = n_target / max(N, 1)
+    if f1 > f0:
+        extra = _shap_stats(values[(q >= f0) & (q < f1)], feature_names, chunk_size, n_workers, raw)
+        stats = [stats[i] + extra[i] for i in range(3)] + [stats[3] + extra[3]]
+
+    sum_abs, sum_sq, sum_signed, n = stats
+    n = max(n, 1)
+    mean_abs = sum_abs / n
+    std_err = np.sqrt(np.maximum(sum_sq / n - mean_abs ** 2, 0.0) / max(n - 1, 1))
+
+    order = np.argsort(-mean_abs, kind="stable")
+    result = {
+        "model_version": version,
+        "population_key": population,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "population_rows": int(N),
+        "sample_rows": int(n),
+        "pilot_rows": int(pilot.sum()),
+        "n_strata": int(groups.nunique()),
+        "target_rel_error": target_rel_error,
+        "features": [
+            {
+                "feature": feature_names[j],
+                "mean_abs_shap": float(mean_abs[j]),
+                "std_err": float(std_err[j]),
+                "rel_error": float(std_err[j] / mean_abs[j]) if mean_abs[j] > 0 else None,
+                "mean_shap": float(sum_signed[j] / n),
+            }
+            for j in order
+        ],
+    }
+
+    if cache_dir:
+        cache_path = _cache_path(cache_dir, version, population)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(result, indent=2), encoding="utf-8")
+        os.replace(tmp, cache_path)
+
+    return result
+
+
+def churn_global_importance(
+    churn_model,
+    cutoffs: list | None = None,
+    table_in: str = "customer_model_data_rollup",
+    db_path: str = DB_PATH,
+    **kwargs,
+) -> dict:
+    """
+    global_shap_importance over the rollup (optionally restricted to some cutoffs),
+    stratified by cutoff_date. A cached result for this model version and the same
+    cutoffs / row count skips the feature query.
+    """
+    feature_cols = _boosters(churn_model)[0].feature_names
+    cols = ", ".join(["cutoff_date"] + list(feature_cols))
+    where = ""
+    params = []
+    if cutoffs:
+        where = "WHERE cutoff_date IN (SELECT CAST(UNNEST(?) AS DATE))"
+        params = [[str(c) for c in cutoffs]]
+
+    con = connect(db_path, read_only=True)
+    counts = con.execute(f"SELECT cutoff_date, COUNT(*) AS n FROM {table_in} {where} GROUP BY 1", params).fetchdf()
+    cached = _cached_importance(
+        model_version(churn_model),
+        _population_key(counts["cutoff_date"], int(counts["n"].sum())),
+        kwargs.get("cache_dir", SHAP_CACHE_DIR),
+        kwargs.get("target_rel_error", 0.02),
+    )
+    if cached is not None:
+        con.close()
+        return cached
+
+    df = con.execute(f"SELECT {cols} FROM {table_in} {where}", params).fetchdf()
+    con.close()
+
+    return global_shap_importance(churn_model, df[feature_cols], strata=df["cutoff_date"], **kwargs)
+
+
+# -------------------------
+# Plots
+# -------------------------
 def shap_global_local(xgb_model, X_train: pd.DataFrame, X_test: pd.DataFrame, customer_ids_test: pd.Series):
+    import shap
+    import matplotlib.pyplot as plt
+
     Path("artifacts/reports").mkdir(parents=True, exist_ok=True)
 
     explainer = shap.TreeExplainer(xgb_model)
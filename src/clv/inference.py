@@ -0,0 +1,397 @@
+"""
+inference.py
+
+Compiled inference for the fitted CLV models:
+- churn: XGBClassifier (optionally wrapped in a sigmoid CalibratedClassifierCV)
+- spend: Pipeline(imputer + scaler + LogisticRegression)
+- revenue: Pipeline(imputer + HistGradientBoostingRegressor)
+
+Tree ensembles are exported into one flat, array-backed node layout
+(feature index, threshold, child offsets, default direction, leaf values)
+and evaluated over row batches with vectorized NumPy traversal.
+
+Compiled models expose the same predict_proba / predict interface as the
+reference estimators, so they can be passed straight into
+score_clv_and_write_to_db. Evaluating them only needs numpy: xgboost and
+sklearn are needed to *compile* (they unpickle the reference models), not
+to score.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+
+
+DEFAULT_BATCH_SIZE = 512
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _as_matrix(X) -> np.ndarray:
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2:
+        raise ValueError(f"Expected a 2D feature matrix, got shape {X.shape}")
+    return X
+
+
+# =========================
+# Flat tree layout
+# =========================
+@dataclass
+class TreeEnsemble:
+    """
+    All trees of an ensemble concatenated into flat node arrays.
+
+    Conventions:
+    - split rule is always `x < threshold` -> children[node, 0], else children[node, 1]
+    - NaN goes to children[node, 0] when default_left is set, else children[node, 1]
+    - leaves have feature == -1 and point to themselves, so a fixed number of
+      traversal steps (max_depth) lands every row on a leaf
+    - trees are stored contiguously per output group; group_offsets[g] is the
+      index of the first tree of group g (groups = calibration folds)
+    """
+    feature: np.ndarray        # int32 (n_nodes,)
+    threshold: np.ndarray      # float64 (n_nodes,)
+    children: np.ndarray       # int32 (n_nodes, 2), absolute node offsets
+    default_left: np.ndarray   # bool (n_nodes,)
+    value: np.ndarray          # float64 (n_nodes,), leaf values
+    roots: np.ndarray          # int32 (n_trees,)
+    group_offsets: np.ndarray  # int64 (n_groups,)
+    base_margin: np.ndarray    # float64 (n_groups,)
+    max_depth: int
+    float32_inputs: bool = False
+
+    @property
+    def n_trees(self) -> int:
+        return int(len(self.roots))
+
+    @property
+    def n_groups(self) -> int:
+        return int(len(self.group_offsets))
+
+    def predict_margin(self, X, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """
+        Raw margin per group: base_margin + sum of leaf values.
+        Returns shape (n_rows, n_groups).
+        """
+        X = _as_matrix(X)
+        if self.float32_inputs:
+            # XGBoost compares features in float32
+            X = X.astype(np.float32).astype(np.float64)
+
+        # Missing values are routed without a per-node NaN test: the matrix is
+        # widened to [X with NaN=-inf | X with NaN=+inf] and default-right
+        # nodes read from the second half, so `x >= threshold` picks the child.
+        n_features = X.shape[1]
+        nan = np.isnan(X)
+        Xw = np.concatenate([np.where(nan, -np.inf, X), np.where(nan, np.inf, X)], axis=1)
+
+        is_leaf = self.feature < 0
+        feature = np.where(is_leaf, 0, self.feature + n_features * ~self.default_left).astype(np.intp)
+        children = self.children.astype(np.intp).ravel()
+        roots = self.roots.astype(np.intp)
+
+        out = np.empty((X.shape[0], self.n_groups), dtype=np.float64)
+        for start in range(0, X.shape[0], batch_size):
+            xb = Xw[start:start + batch_size]
+            n = xb.shape[0]
+
+            # tree-major node matrix (n_trees, n_rows); row offsets into flat xb
+            row_offset = (np.arange(n, dtype=np.intp) * xb.shape[1])[None, :]
+            node = np.repeat(roots[:, None], n, axis=1)
+
+            for _ in range(self.max_depth):
+                x = np.take(xb, row_offset + np.take(feature, node))
+                node = np.take(children, 2 * node + (x >= np.take(self.threshold, node)))
+
+            leaf = np.take(self.value, node)
+            out[start:start + n] = np.add.reduceat(leaf, self.group_offsets, axis=0).T
+
+        return out + self.base_margin
+
+
+def _concat_trees(trees: list[dict], group_sizes: list[int], base_margin: list[float], float32_inputs: bool) -> TreeEnsemble:
+    """
+    trees: per-tree dicts with local arrays
+      feature, threshold, left, right, default_left, value, depth
+    (left/right == -1 marks a leaf)
+    """
+    feature, threshold, children, default_left, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for t in trees:
+        n = len(t["feature"])
+        is_leaf = np.asarray(t["left"]) < 0
+        local = np.arange(n)
+
+        feature.append(np.where(is_leaf, -1, t["feature"]).astype(np.int32))
+        threshold.append(np.where(is_leaf, np.inf, t["threshold"]).astype(np.float64))
+        children.append(np.column_stack([
+            np.where(is_leaf, local, t["left"]),
+            np.where(is_leaf, local, t["right"]),
+        ]).astype(np.int32) + offset)
+        default_left.append(np.asarray(t["default_left"], dtype=bool) | is_leaf)
+        value.append(np.where(is_leaf, t["value"], 0.0).astype(np.float64))
+        roots.append(offset)
+
+        max_depth = max(max_depth, int(np.max(t["depth"])))
+        offset += n
+
+    return TreeEnsemble(
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        children=np.concatenate(children),
+        default_left=np.concatenate(default_left),
+        value=np.concatenate(value),
+        roots=np.asarray(roots, dtype=np.int32),
+        group_offsets=np.concatenate([[0], np.cumsum(group_sizes)[:-1]]).astype(np.int64),
+        base_margin=np.asarray(base_margin, dtype=np.float64),
+        max_depth=max_depth,
+        float32_inputs=float32_inputs,
+    )
+
+
+# =========================
+# Exporters
+# =========================
+def _xgb_trees(xgb_model) -> tuple[list[dict], float]:
+    booster = xgb_model.get_booster() if hasattr(xgb_model, "get_booster") else xgb_model
+    learner = json.loads(booster.save_raw("json"))["learner"]
+
+    objective = learner["objective"]["name"]
+    if objective not in ("binary:logistic", "reg:logistic"):
+        raise ValueError(f"Unsupported XGBoost objective for compilation: {objective}")
+
+    # base_score is stored in probability space ("0.35" or "[3.5E-1]" depending on version)
+    base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]").split(",")[0])
+    base_margin = float(np.log(base_score / (1.0 - base_score)))
+
+    trees = []
+    for t in learner["gradient_booster"]["model"]["trees"]:
+        if any(t.get("split_type", [])):
+            raise ValueError("Categorical XGBoost splits are not supported by the compiled engine")
+
+        left = np.asarray(t["left_children"], dtype=np.int64)
+        right = np.asarray(t["right_children"], dtype=np.int64)
+
+        depth = np.zeros(len(left), dtype=np.int64)
+        for i in range(len(left)):  # parents always precede children
+            if left[i] >= 0:
+                depth[left[i]] = depth[i] + 1
+                depth[right[i]] = depth[i] + 1
+
+        # split_conditions holds the threshold for splits and the leaf value for leaves
+        cond = np.asarray(t["split_conditions"], dtype=np.float32).astype(np.float64)
+        trees.append({
+            "feature": np.asarray(t["split_indices"], dtype=np.int64),
+            "threshold": cond,
+            "left": left,
+            "right": right,
+            "default_left": np.asarray(t["default_left"], dtype=bool),
+            "value": cond,
+            "depth": depth,
+        })
+
+    return trees, base_margin
+
+
+def _hgb_trees(hgb_model) -> tuple[list[dict], float]:
+    if getattr(hgb_model, "is_categorical_", None) is not None:
+        raise ValueError("Categorical HistGradientBoosting features are not supported by the compiled engine")
+
+    trees = []
+    for iteration in hgb_model._predictors:
+        if len(iteration) != 1:
+            raise ValueError("Only single-output HistGradientBoosting models can be compiled")
+        nodes = iteration[0].nodes
+        is_leaf = nodes["is_leaf"].astype(bool)
+
+        trees.append({
+            "feature": nodes["feature_idx"],
+            # sklearn splits on x <= t; the flat layout uses x < t
+            "threshold": np.nextafter(nodes["num_threshold"], np.inf),
+            "left": np.where(is_leaf, -1, nodes["left"].astype(np.int64)),
+            "right": np.where(is_leaf, -1, nodes["right"].astype(np.int64)),
+            "default_left": nodes["missing_go_to_left"].astype(bool),
+            "value": nodes["value"],
+            "depth": nodes["depth"],
+        })
+
+    base_margin = float(np.ravel(hgb_model._baseline_prediction)[0])
+    return trees, base_margin
+
+
+def compile_xgboost(models: list) -> TreeEnsemble:
+    """
+    One output group per XGBoost model (e.g. one per calibration fold).
+    """
+    trees, group_sizes, base_margin = [], [], []
+    for m in models:
+        t, b = _xgb_trees(m)
+        trees.extend(t)
+        group_sizes.append(len(t))
+        base_margin.append(b)
+    return _concat_trees(trees, group_sizes, base_margin, float32_inputs=True)
+
+
+def compile_hist_gbm(model) -> TreeEnsemble:
+    trees, base_margin = _hgb_trees(model)
+    return _concat_trees(trees, [len(trees)], [base_margin], float32_inputs=False)
+
+
+# =========================
+# Compiled models
+# =========================
+@dataclass
+class Preprocessor:
+    """
+    SimpleImputer(median) + StandardScaler, as plain arrays.
+    """
+    fill: np.ndarray | None = None
+    mean: np.ndarray | None = None
+    scale: np.ndarray | None = None
+
+    def transform(self, X) -> np.ndarray:
+        X = _as_matrix(X)
+        if self.fill is not None:
+            X = np.where(np.isnan(X), self.fill, X)
+        if self.mean is not None:
+            X = X - self.mean
+        if self.scale is not None:
+            X = X / self.scale
+        return X
+
+
+@dataclass
+class CompiledTreeClassifier:
+    """
+    Churn model: sigmoid(margin) per group, then (optionally) the per-fold
+    sigmoid calibration expit(-(a * p + b)), averaged across folds.
+    """
+    trees: TreeEnsemble
+    calib_a: np.ndarray | None = None
+    calib_b: np.ndarray | None = None
+
+    def predict_proba(self, X, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        p = _sigmoid(self.trees.predict_margin(X, batch_size=batch_size))
+        if self.calib_a is not None:
+            p = _sigmoid(-(self.calib_a * p + self.calib_b))
+        p = p.mean(axis=1)
+        return np.column_stack([1.0 - p, p])
+
+
+@dataclass
+class CompiledLinearClassifier:
+    """
+    Spend model: imputer + scaler + logistic regression.
+    """
+    prep: Preprocessor
+    coef: np.ndarray
+    intercept: float
+
+    def predict_proba(self, X, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        p = _sigmoid(self.prep.transform(X) @ self.coef + self.intercept)
+        return np.column_stack([1.0 - p, p])
+
+
+@dataclass
+class CompiledTreeRegressor:
+    """
+    Revenue model: imputer + gradient boosted trees (identity link).
+    """
+    prep: Preprocessor
+    trees: TreeEnsemble
+
+    def predict(self, X, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        return self.trees.predict_margin(self.prep.transform(X), batch_size=batch_size)[:, 0]
+
+
+def _compile_preprocessing(steps) -> Preprocessor:
+    prep = Preprocessor()
+    for name, step in steps:
+        kind = type(step).__name__
+        if kind == "SimpleImputer":
+            if step.strategy not in ("median", "mean") or np.isnan(step.statistics_).any():
+                raise ValueError(f"Unsupported imputer for compilation (step '{name}')")
+            prep.fill = np.asarray(step.statistics_, dtype=np.float64)
+        elif kind == "StandardScaler":
+            if step.mean_ is not None:
+                prep.mean = np.asarray(step.mean_, dtype=np.float64)
+            if step.scale_ is not None:
+                prep.scale = np.asarray(step.scale_, dtype=np.float64)
+        elif step is not None and step != "passthrough":
+            raise ValueError(f"Unsupported pipeline step for compilation: {name} ({kind})")
+    return prep
+
+
+def compile_model(model):
+    """
+    Compile a fitted churn / spend / revenue model into its NumPy equivalent.
+    Already-compiled models are returned unchanged.
+    """
+    if isinstance(model, (CompiledTreeClassifier, CompiledLinearClassifier, CompiledTreeRegressor)):
+        return model
+
+    kind = type(model).__name__
+
+    if kind == "XGBClassifier":
+        return CompiledTreeClassifier(trees=compile_xgboost([model]))
+
+    if kind == "CalibratedClassifierCV":
+        folds = model.calibrated_classifiers_
+        if model.method != "sigmoid":
+            raise ValueError(f"Only sigmoid calibration can be compiled (got {model.method})")
+        if type(folds[0].estimator).__name__ != "XGBClassifier":
+            raise ValueError("Only XGBoost base estimators can be compiled under calibration")
+        return CompiledTreeClassifier(
+            trees=compile_xgboost([f.estimator for f in folds]),
+            calib_a=np.array([f.calibrators[0].a_ for f in folds], dtype=np.float64),
+            calib_b=np.array([f.calibrators[0].b_ for f in folds], dtype=np.float64),
+        )
+
+    if kind == "Pipeline":
+        final = model.steps[-1][1]
+        prep = _compile_preprocessing(model.steps[:-1])
+        final_kind = type(final).__name__
+
+        if final_kind == "LogisticRegression":
+            if final.coef_.shape[0] != 1:
+                raise ValueError("Only binary LogisticRegression can be compiled")
+            return CompiledLinearClassifier(
+                prep=prep,
+                coef=np.asarray(final.coef_[0], dtype=np.float64),
+                intercept=float(final.intercept_[0]),
+            )
+
+        if final_kind == "HistGradientBoostingRegressor":
+            if type(final._loss).__name__ != "HalfSquaredError":
+                raise ValueError("Only squared-error HistGradientBoostingRegressor can be compiled")
+            return CompiledTreeRegressor(prep=prep, trees=compile_hist_gbm(final))
+
+        raise ValueError(f"Unsupported pipeline estimator for compilation: {final_kind}")
+
+    raise ValueError(f"Unsupported model type for compilation: {kind}")
+
+
+def check_compiled(reference, compiled, X, atol: float = 1e-5) -> float:
+    """
+    Compare compiled predictions with the reference model on X.
+    Returns max absolute difference; raises ValueError above atol.
+    """
+    if hasattr(reference, "predict_proba"):
+        ref = reference.predict_proba(X)[:, 1]
+        got = compiled.predict_proba(X)[:, 1]
+    else:
+        ref = reference.predict(X)
+        got = compiled.predict(X)
+
+    max_diff = float(np.max(np.abs(np.asarray(ref, dtype=np.float64) - got))) if len(got) else 0.0
+    if max_diff > atol:
+        raise ValueError(f"Compiled model differs from reference: max |diff| = {max_diff:.3g} > {atol}")
+    return max_diff
@@ -16,7 +16,7 @@ def ingest():
 
     print("Rows after cleaning:", len(df_clean))
 
-    con = get_connection()
+    con = get_connection(stage="build")
 
     print("Writing to DuckDB...")
     con.execute("DROP TABLE IF EXISTS fact_transactions")
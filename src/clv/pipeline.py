@@ -1,23 +1,18 @@
+from clv.config import load_params
 from clv.db import get_connection
 from clv.windows import compute_windows
-import yaml
 from clv.build_features import build_features
 from clv.labels import build_labels_sql
 from clv.rolling import build_rolling_dataset
 
 
 def test_windows():
-    from clv.db import get_connection
-    from clv.windows import compute_windows
-    import yaml
-
-    con = get_connection()
+    con = get_connection(stage="build")
     max_date = con.execute("SELECT MAX(InvoiceDate) FROM fact_transactions").fetchone()[0]
     con.close()
 
-    with open("configs/params.yaml") as f:
-        config = yaml.safe_load(f)
-    
+    config = load_params()
+
     if config.get("rolling", {}).get("enabled", False):
         build_rolling_dataset(config)
         return
@@ -0,0 +1,138 @@
+"""
+pred_cache.py
+
+Persistent prediction cache for re-scoring.
+
+Each feature row is hashed (pandas row hashing, uint64) together with the model
+version; the model outputs (churn_prob, spend_prob, pred_revenue_if_spend) are
+stored in a DuckDB table under that key. On the next scoring pass only cache
+misses go through the models.
+
+- size-bounded: least-recently-used keys are evicted above max_entries
+- optional recency bucketing for dormant customers (no invoices in the last
+  30 days): recency_days_obs / tenure_days_obs are floored to
+  recency_bucket_days before hashing, so a customer whose only change is the
+  passage of time keeps hitting the cache. This is an approximation: the cached
+  prediction is the one for the first recency seen in the bucket.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from clv.db import DB_PATH, connect
+
+
+CACHE_TABLE = "prediction_cache"
+CACHED_COLS = ["churn_prob", "spend_prob", "pred_revenue_if_spend"]
+
+_TIME_SHIFTED_COLS = ["recency_days_obs", "tenure_days_obs"]
+_DORMANT_COL = "invoice_count_30d"
+
+
+class PredictionCache:
+    def __init__(
+        self,
+        model_version: str,
+        db_path: str = DB_PATH,
+        table: str = CACHE_TABLE,
+        max_entries: int = 5_000_000,
+        recency_bucket_days: int | None = None,
+    ):
+        self.model_version = model_version
+        self.db_path = db_path
+        self.table = table
+        self.max_entries = max_entries
+        self.recency_bucket_days = recency_bucket_days
+
+        self._version_salt = np.uint64(int(hashlib.sha256(model_version.encode("utf-8")).hexdigest()[:16], 16))
+
+    def keys_for(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        uint64 key per row of the (already cleaned) feature matrix.
+        """
+        X = X.reset_index(drop=True)
+
+        if self.recency_bucket_days:
+            cols = [c for c in _TIME_SHIFTED_COLS if c in X.columns]
+            if cols and _DORMANT_COL in X.columns:
+                dormant = X[_DORMANT_COL].fillna(0).to_numpy() == 0
+                if dormant.any():
+                    X = X.copy()
+                    for c in cols:
+                        v = X[c].to_numpy(dtype=float)
+                        X[c] = np.where(dormant, np.floor(v / self.recency_bucket_days), v)
+
+        row_hash = pd.util.hash_pandas_object(X, index=False).to_numpy()
+        return pd.util.hash_array(row_hash ^ self._version_salt)
+
+    def _connect(self):
+        con = connect(self.db_path)
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key UBIGINT,
+                model_version VARCHAR,
+                churn_prob DOUBLE,
+                spend_prob DOUBLE,
+                pred_revenue_if_spend DOUBLE,
+                last_used TIMESTAMP
+            )
+        """)
+        return con
+
+    def lookup(self, keys: np.ndarray) -> pd.DataFrame:
+        """
+        Cached model outputs for the given keys (hits only), indexed by key.
+        Touches last_used for every hit.
+        """
+        con = self._connect()
+        con.register("keys_df", pd.DataFrame({"key": np.unique(keys)}))
+
+        hits = con.execute(f"""
+            SELECT c.key, c.churn_prob, c.spend_prob, c.pred_revenue_if_spend
+            FROM {self.table} c
+            JOIN keys_df k ON c.key = k.key
+            WHERE c.model_version = ?
+        """, [self.model_version]).fetchdf()
+
+        if not hits.empty:
+            con.register("hit_df", hits[["key"]])
+            con.execute(f"""
+                UPDATE {self.table} SET last_used = now()
+                WHERE key IN (SELECT key FROM hit_df)
+            """)
+
+        con.close()
+        return hits.set_index("key")
+
+    def store(self, keys: np.ndarray, preds: pd.DataFrame) -> None:
+        """
+        Insert new entries (keys not already cached), then evict down to max_entries.
+        """
+        new = preds[CACHED_COLS].copy()
+        new.insert(0, "key", keys)
+        new = new.drop_duplicates(subset=["key"])
+
+        con = self._connect()
+        con.register("new_df", new)
+        con.execute(f"""
+            INSERT INTO {self.table}
+            SELECT n.key, ?, n.churn_prob, n.spend_prob, n.pred_revenue_if_spend, now()
+            FROM new_df n
+            ANTI JOIN {self.table} c ON c.key = n.key
+        """, [self.model_version])
+
+        n = con.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if n > self.max_entries:
+            con.execute(f"""
+                DELETE FROM {self.table}
+                WHERE key IN (
+                    SELECT key FROM {self.table}
+                    ORDER BY last_used ASC
+                    LIMIT {n - self.max_entries}
+                )
+            """)
+        con.close()
@@ -1,12 +1,29 @@
+"""
+reporting.py
+
+Run-report artifacts written straight from DuckDB:
+- target lists: COPY (<targets query>) TO <file> as zstd Parquet (or CSV), so a
+  target list streams to disk without becoming a pandas object
+- JSON summary: strategy totals, overlap and the top-N preview come from small
+  aggregate queries over the exported files
+"""
+
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass, asdict
-from datetime import datetime
+from dataclasses import asdict
+from datetime import date, datetime
 from pathlib import Path
 import pandas as pd
 import numpy as np
 
+from clv.business import StrategySummary, strategy_summary
+
+
+PREVIEW_COLS = ["CustomerID", "expected_loss", "expected_clv", "churn_prob", "spend_prob"]
+BLENDED_PREVIEW_COLS = ["CustomerID", "blended_score"] + PREVIEW_COLS[1:]
+
+
 def _json_sanitize(obj):
     """
     Convert pandas/numpy objects to JSON-safe Python types.
@@ -14,8 +31,8 @@ def _json_sanitize(obj):
     - numpy scalars -> Python scalars
     - NaN/NaT -> None
     """
-    # pandas Timestamp / datetime-like
-    if isinstance(obj, (pd.Timestamp, datetime)):
+    # pandas Timestamp / datetime-like / date
+    if isinstance(obj, (pd.Timestamp, datetime, date)):
         return obj.isoformat()
 
     # numpy scalar types (np.float64, np.int64, etc.)
@@ -30,6 +47,10 @@ def _json_sanitize(obj):
     if obj is pd.NaT or (isinstance(obj, float) and pd.isna(obj)):
         return None
 
+    # dataclass summaries
+    if hasattr(obj, "__dataclass_fields__"):
+        return _json_sanitize(asdict(obj))
+
     # dict
     if isinstance(obj, dict):
         return {str(k): _json_sanitize(v) for k, v in obj.items()}
@@ -42,78 +63,146 @@ def _json_sanitize(obj):
     return obj
 
 
+# -------------------------
+# DuckDB-side export + aggregates
+# -------------------------
+def _reader(path) -> str:
+    path = str(path).replace("\\", "/").replace("'", "''")
+    return f"read_csv_auto('{path}')" if path.endswith(".csv") else f"read_parquet('{path}')"
+
+
+def export_targets(con, query: str, path, fmt: str = "parquet") -> Path:
+    """
+    COPY (query) TO path. fmt: "parquet" (zstd) or "csv" (with header).
+    """
+    if fmt == "parquet":
+        options = "FORMAT PARQUET, COMPRESSION ZSTD"
+    elif fmt == "csv":
+        options = "FORMAT CSV, HEADER"
+    else:
+        raise ValueError(f"Unknown export format: {fmt} (expected 'parquet' or 'csv')")
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    target = str(path).replace("\\", "/").replace("'", "''")
+    con.execute(f"COPY ({query}) TO '{target}' ({options})")
+    return path
+
+
+def file_summary(con, path, cost_per_customer: float, save_rate: float, loss_col: str = "expected_loss") -> StrategySummary:
+    """
+    StrategySummary of an exported target list from one aggregate query.
+    """
+    n, loss = con.execute(f"SELECT COUNT(*), COALESCE(SUM({loss_col}), 0) FROM {_reader(path)}").fetchone()
+    return strategy_summary(float(n * cost_per_customer), float(save_rate * loss), int(n))
+
+
+def file_overlap_pct(con, path_a, path_b, key: str = "CustomerID") -> float:
+    """
+    Share of the customers in path_b that are also in path_a.
+    """
+    shared, n_b = con.execute(f"""
+        SELECT
+          (SELECT COUNT(*) FROM (SELECT DISTINCT {key} FROM {_reader(path_a)}) a
+             JOIN (SELECT DISTINCT {key} FROM {_reader(path_b)}) b USING ({key})),
+          (SELECT COUNT(DISTINCT {key}) FROM {_reader(path_b)})
+    """).fetchone()
+    return float(shared / max(1, n_b))
+
+
+def file_preview(con, path, columns: list[str] = PREVIEW_COLS, top_n: int = 20) -> list[dict]:
+    """
+    First top_n rows (file order = rank order) as JSON-ready records.
+    """
+    cur = con.execute(f"SELECT {', '.join(columns)} FROM {_reader(path)} LIMIT {int(top_n)}")
+    names = [d[0] for d in cur.description]
+    return [_json_sanitize(dict(zip(names, row))) for row in cur.fetchall()]
+
 
-@dataclass
-class StrategySummary:
-    targeted_customers: int
-    total_cost: float
-    expected_prevented_loss: float
-    net_uplift: float
-    roi: float | None
+def file_columns(con, path, columns: list[str]) -> pd.DataFrame:
+    """
+    A few columns of an exported target list (e.g. the inputs of clv.business.simulate_campaign).
+    """
+    return con.execute(f"SELECT {', '.join(columns)} FROM {_reader(path)}").fetchdf()
+
+
+def ranked_file_sql(path, columns: list[str]) -> str:
+    """
+    SELECT rank (1-based file order = rank order), columns FROM an exported target list.
+    """
+    cols = ", ".join(columns)
+    if str(path).endswith(".csv"):
+        return f"SELECT row_number() OVER () AS rank, {cols} FROM {_reader(path)}"
+    path = str(path).replace("\\", "/").replace("'", "''")
+    return f"SELECT file_row_number + 1 AS rank, {cols} FROM read_parquet('{path}', file_row_number = true)"
+
+
+def write_report_json(report: dict, path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(_json_sanitize(report), indent=2), encoding="utf-8")
+    return path
 
 
 def save_run_artifacts(
     *,
+    con,
     latest_cutoff: pd.Timestamp,
     assumptions: dict,
-    summary_loss: dict | StrategySummary,
-    summary_blend: dict | StrategySummary,
-    overlap_pct: float,
-    targets_loss: pd.DataFrame,
-    targets_blend: pd.DataFrame,
+    query_loss: str,
+    query_blend: str,
+    cost_per_customer: float,
+    save_rate: float,
     top_n_preview: int = 20,
     out_dir: str = "artifacts/reports",
+    fmt: str = "parquet",
+    write_json: bool = True,
 ) -> dict:
     """
     Saves:
-      - run_report_<cutoff>_<timestamp>.json
-      - top_loss_<cutoff>_<timestamp>.csv
-      - top_blended_<cutoff>_<timestamp>.csv
+      - top_loss_<cutoff>_<timestamp>.parquet|csv     (COPY from query_loss)
+      - top_blended_<cutoff>_<timestamp>.parquet|csv  (COPY from query_blend, with blended_score)
+      - run_report_<cutoff>_<timestamp>.json          (aggregates over the two files)
+
+    write_json=False leaves the JSON to the caller (e.g. to add sections computed
+    from the exported files, then write_report_json(report, report_json)).
 
-    Returns dict with file paths.
+    Returns dict with file paths, the run id (<cutoff>_<timestamp>) and the report.
     """
     out_path = Path(out_dir)
-    out_path.mkdir(parents=True, exist_ok=True)
-
     cutoff_str = str(pd.to_datetime(latest_cutoff).date())
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")  # microseconds: unique run id for back-to-back runs
     base = f"{cutoff_str}_{ts}"
 
-    loss_csv = out_path / f"top_loss_{base}.csv"
-    blend_csv = out_path / f"top_blended_{base}.csv"
+    loss_file = export_targets(con, query_loss, out_path / f"top_loss_{base}.{fmt}", fmt)
+    blend_file = export_targets(con, query_blend, out_path / f"top_blended_{base}.{fmt}", fmt)
     report_json = out_path / f"run_report_{base}.json"
 
-    targets_loss.to_csv(loss_csv, index=False)
-    targets_blend.to_csv(blend_csv, index=False)
-
-    def _to_dict(x):
-        if hasattr(x, "__dataclass_fields__"):
-            return asdict(x)
-        return dict(x)
-
     report = {
         "cutoff_date": cutoff_str,
         "generated_at": ts,
         "assumptions": assumptions,
-        "strategy_loss_only": _to_dict(summary_loss),
-        "strategy_blended": _to_dict(summary_blend),
-        "overlap_pct_blended_vs_loss_only": float(overlap_pct),
+        "strategy_loss_only": file_summary(con, loss_file, cost_per_customer, save_rate),
+        "strategy_blended": file_summary(con, blend_file, cost_per_customer, save_rate),
+        "overlap_pct_blended_vs_loss_only": file_overlap_pct(con, loss_file, blend_file),
         "files": {
-            "loss_csv": str(loss_csv).replace("\\", "/"),
-            "blended_csv": str(blend_csv).replace("\\", "/"),
+            "loss_targets": str(loss_file).replace("\\", "/"),
+            "blended_targets": str(blend_file).replace("\\", "/"),
             "report_json": str(report_json).replace("\\", "/"),
         },
         "top_preview": {
-            "loss_only_top": targets_loss.head(top_n_preview).to_dict(orient="records"),
-            "blended_top": targets_blend.head(top_n_preview).to_dict(orient="records"),
+            "loss_only_top": file_preview(con, loss_file, top_n=top_n_preview),
+            "blended_top": file_preview(con, blend_file, BLENDED_PREVIEW_COLS, top_n=top_n_preview),
         },
     }
 
-    report_json.write_text(json.dumps(_json_sanitize(report), indent=2), encoding="utf-8")
-
+    if write_json:
+        write_report_json(report, report_json)
 
     return {
-        "loss_csv": loss_csv,
-        "blended_csv": blend_csv,
+        "run_id": base,
+        "loss_file": loss_file,
+        "blended_file": blend_file,
         "report_json": report_json,
+        "report": report,
     }
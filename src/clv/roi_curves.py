@@ -0,0 +1,155 @@
+"""
+roi_curves.py
+
+Precomputed ROI / uplift curves per (cutoff, score, blend weight).
+
+For a fixed ranking and a uniform cost per customer, every budget /
+max_customers / save_rate what-if follows from the cumulative expected_loss by
+rank (see clv.business.RoiCurve). The curves are built once from the versioned
+predictions tables and stored in DuckDB as DOUBLE[] lists:
+
+    roi_curves(cutoff_date, score_col, w_loss, n_customers, cum_expected_loss, created_at)
+
+score_col is "expected_loss" (w_loss NULL) or "blended_score" with
+w_loss * rank(expected_loss) + (1 - w_loss) * rank(expected_clv).
+
+Run:
+    python src/clv/roi_curves.py
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from clv.business import RoiCurve, percentile_rank
+from clv.db import DB_PATH, connect
+
+
+CURVES_TABLE = "roi_curves"
+PRED_PREFIX = "predictions_customer"
+
+
+def versioned_tables(con, prefix: str) -> dict:
+    """
+    cutoff_date (str, YYYY-MM-DD) -> table name for <prefix>_YYYY_MM_DD tables.
+    """
+    names = con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE regexp_matches(table_name, ?)",
+        [f"^{prefix}_[0-9]{{4}}_[0-9]{{2}}_[0-9]{{2}}$"],
+    ).fetchall()
+    return {n[len(prefix) + 1:].replace("_", "-"): n for (n,) in names}
+
+
+def build_roi_curves(
+    cutoffs: list | None = None,
+    w_loss_grid=(0.7,),
+    table_prefix: str = PRED_PREFIX,
+    table_out: str = CURVES_TABLE,
+    db_path: str = DB_PATH,
+) -> int:
+    """
+    (Re)build curves for the given cutoffs (default: every versioned predictions table).
+    Returns the number of curves written.
+    """
+    con = connect(db_path, stage="score")
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_out} (
+            cutoff_date DATE,
+            score_col VARCHAR,
+            w_loss DOUBLE,
+            n_customers INTEGER,
+            cum_expected_loss DOUBLE[],
+            created_at TIMESTAMP
+        )
+    """)
+
+    tables = versioned_tables(con, table_prefix)
+    if cutoffs is not None:
+        wanted = {str(pd.to_datetime(c).date()) for c in cutoffs}
+        tables = {c: t for c, t in tables.items() if c in wanted}
+
+    rows = []
+    for cutoff, table in sorted(tables.items()):
+        snap = con.execute(f"SELECT expected_loss, expected_clv FROM {table}").fetchdf()
+        loss = snap["expected_loss"].to_numpy(dtype=float)
+        clv = snap["expected_clv"].to_numpy(dtype=float)
+
+        curves = [("expected_loss", None, RoiCurve.from_scores(loss, loss))]
+        if len(w_loss_grid):
+            loss_rank, clv_rank = percentile_rank(loss), percentile_rank(clv)
+            for w in w_loss_grid:
+                blended = w * loss_rank + (1.0 - w) * clv_rank
+                curves.append(("blended_score", float(w), RoiCurve.from_scores(blended, loss)))
+
+        rows.extend((cutoff, name, w, curve.n, curve.cum_expected_loss.tolist()) for name, w, curve in curves)
+
+    if rows:
+        new = pd.DataFrame(rows, columns=["cutoff_date", "score_col", "w_loss", "n_customers", "cum_expected_loss"])
+        new["cutoff_date"] = pd.to_datetime(new["cutoff_date"]).dt.date
+        con.register("new_curves", new)
+        con.execute("BEGIN TRANSACTION")
+        try:
+            con.execute(f"""
+                DELETE FROM {table_out} t
+                USING new_curves n
+                WHERE t.cutoff_date = n.cutoff_date
+                  AND t.score_col = n.score_col
+                  AND t.w_loss IS NOT DISTINCT FROM n.w_loss
+            """)
+            con.execute(f"""
+                INSERT INTO {table_out}
+                SELECT cutoff_date, score_col, w_loss, n_customers, cum_expected_loss, now()
+                FROM new_curves
+            """)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            con.close()
+            raise
+
+    con.close()
+    print(f"Saved ROI curves: {table_out} (cutoffs={len(tables)}, curves={len(rows)})")
+    return len(rows)
+
+
+def load_roi_curve(
+    cutoff_date=None,
+    score_col: str = "expected_loss",
+    w_loss: float | None = None,
+    table: str = CURVES_TABLE,
+    db_path: str = DB_PATH,
+) -> RoiCurve:
+    """
+    One stored curve; cutoff_date defaults to the latest cutoff in the table.
+    """
+    con = connect(db_path, read_only=True)
+    if cutoff_date is None:
+        cutoff_date = con.execute(f"SELECT MAX(cutoff_date) FROM {table}").fetchone()[0]
+
+    row = con.execute(
+        f"""
+        SELECT cum_expected_loss
+        FROM {table}
+        WHERE cutoff_date = CAST(? AS DATE)
+          AND score_col = ?
+          AND w_loss IS NOT DISTINCT FROM ?
+        """,
+        [str(cutoff_date), score_col, w_loss],
+    ).fetchone()
+    con.close()
+
+    if row is None:
+        raise ValueError(f"No ROI curve for cutoff={cutoff_date}, score_col={score_col}, w_loss={w_loss}")
+    return RoiCurve(np.asarray(row[0], dtype=float))
+
+
+if __name__ == "__main__":
+    build_roi_curves()
+
+    curve = load_roi_curve()
+    cost_per_customer, save_rate = 1.0, 0.15
+    print("\n=== Latest cutoff, loss-only ===")
+    print("budget 500 / max 2000:", curve.summary(500.0, cost_per_customer, 2000, save_rate))
+    print("optimal  :", curve.optimal(cost_per_customer, save_rate))
+    print("breakeven:", curve.breakeven(cost_per_customer, save_rate))
@@ -4,7 +4,7 @@ from clv.features_sql import build_customer_features_sql
 from clv.labels import build_labels_sql
 
 def build_rolling_dataset(config):
-    con = get_connection()
+    con = get_connection(stage="build")
 
     min_date = con.execute("SELECT MIN(InvoiceDate) FROM fact_transactions").fetchone()[0]
     max_date = con.execute("SELECT MAX(InvoiceDate) FROM fact_transactions").fetchone()[0]
@@ -3,19 +3,34 @@ run_all.py
 
 One-command end-to-end runner:
 - Builds rolling dataset (via pipeline.py config switch)
+- Refreshes acquisition-cohort retention / revenue (cohort_activity, trailing months only)
 - Trains churn model
 - Trains revenue hurdle models (spend + conditional revenue)
-- Scores & writes predictions_customer to DuckDB
+- Bundles the trained models into one versioned file (serving / run_score_all)
+- Scores & writes predictions_customer to DuckDB with the native models
+  (XGBoost's multi-threaded predict beats the compiled models on full batches)
+- Writes top churn drivers per customer (reason_codes_customer)
+- Writes RFM segments per customer (customer_segments + predictions_segments_latest)
+- Builds budget ROI curves per cutoff (roi_curves)
+- Writes the run report, then publishes the warehouse as a read-only snapshot
+  (readers: clv.snapshots.reader_path)
 
 Run:
     python src/clv/run_all.py
 """
 
 from clv.pipeline import test_windows
+from clv.cohorts import build_cohorts
 from clv.train_churn import train_churn_model
 from clv.train_revenue import train_revenue_models
+from clv.bundle import build_bundle_from_artifacts
 from clv.score import load_model, score_clv_and_write_to_db
+from clv.explain import score_reason_codes
+from clv.segments import build_segments
+from clv.roi_curves import build_roi_curves
 from clv.run_report import main as run_report
+from clv.db import DB_PATH
+from clv.snapshots import publish_snapshot
 
 
 
@@ -23,13 +38,19 @@ def main():
     # 1) Build data tables (rolling enabled in configs/params.yaml triggers rolling build)
     test_windows()
 
+    # 1b) Acquisition cohorts (incremental: trailing months only)
+    build_cohorts()
+
     # 2) Train churn model (+ writes churn model artifact)
     train_churn_model()
 
     # 3) Train revenue models (+ writes spend/revenue/feature_cols artifacts)
     train_revenue_models()
 
-    # 4) Score and write predictions store
+    # 4) Bundle models (one file: manifest + memory-mappable arrays) for the service
+    build_bundle_from_artifacts()
+
+    # 5) Score and write predictions store (native models: full batch)
     churn = load_model("artifacts/models/churn_xgb.joblib")
     spend = load_model("artifacts/models/spend_clf.joblib")
     rev = load_model("artifacts/models/revenue_reg.joblib")
@@ -44,11 +65,24 @@ def main():
         table_out_prefix="predictions_customer",
     )
 
+    # 6) Reason codes for the latest cutoff (native tree contributions)
+    score_reason_codes(churn)
+
+    # 6b) RFM segments for the latest cutoff (n_clusters=k adds mini-batch k-means clusters)
+    build_segments()
+
+    # 7) ROI curves (budget what-ifs without re-running targeting)
+    build_roi_curves()
+
+    # 8) Run report on the freshly built warehouse (recorded in run history)
+    run_report(db_path=DB_PATH)
+
+    # 9) Publish: readers switch to the new snapshot atomically
+    version = publish_snapshot()
 
-    print("\n✅ run_all complete. DuckDB table ready: predictions_customer_latest")
+    print(f"\n✅ run_all complete. Snapshot {version} ready: predictions_customer_latest")
 
 
 if __name__ == "__main__":
     main()
-    run_report()
 
@@ -0,0 +1,239 @@
+"""
+run_history.py
+
+Queryable history of run reports in DuckDB (instead of globbing JSON files):
+
+    report_runs(run_id, strategy, cutoff_date, generated_at, source,
+                budget_eur, cost_per_customer, max_customers, save_rate, w_loss, w_clv,
+                targeted_customers, total_cost, expected_prevented_loss, net_uplift, roi,
+                overlap_pct, model_version, feature_version, churn_model_version,
+                assumptions JSON, report_json)                       one row per (run, strategy)
+
+    report_run_targets(run_id, strategy, rank, CustomerID,
+                       expected_loss, expected_clv, churn_prob, spend_prob)
+
+Indexed on run_id and cutoff_date, so trend queries and "targets of run X"
+lookups do not scan every stored run. Target lists are copied straight from the
+exported Parquet/CSV files (clv.reporting), never through pandas.
+
+Run:
+    python src/clv/run_history.py
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict
+from pathlib import Path
+
+import pandas as pd
+
+from clv.db import DB_PATH, connect
+from clv.reporting import ranked_file_sql
+
+
+RUNS_TABLE = "report_runs"
+TARGETS_TABLE = "report_run_targets"
+BUNDLE_PATH = "artifacts/models/clv_models.bundle"
+FEATURE_COLS_PATH = "artifacts/models/feature_cols.joblib"
+TARGET_COLS = ["CustomerID", "expected_loss", "expected_clv", "churn_prob", "spend_prob"]
+
+
+def ensure_history_tables(con, runs_table: str = RUNS_TABLE, targets_table: str = TARGETS_TABLE) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {runs_table} (
+            run_id VARCHAR,
+            strategy VARCHAR,
+            cutoff_date DATE,
+            generated_at TIMESTAMP,
+            source VARCHAR,
+            budget_eur DOUBLE,
+            cost_per_customer DOUBLE,
+            max_customers INTEGER,
+            save_rate DOUBLE,
+            w_loss DOUBLE,
+            w_clv DOUBLE,
+            targeted_customers INTEGER,
+            total_cost DOUBLE,
+            expected_prevented_loss DOUBLE,
+            net_uplift DOUBLE,
+            roi DOUBLE,
+            overlap_pct DOUBLE,
+            model_version VARCHAR,
+            feature_version VARCHAR,
+            churn_model_version VARCHAR,
+            assumptions JSON,
+            report_json VARCHAR,
+            PRIMARY KEY (run_id, strategy)
+        )
+    """)
+    con.execute(f"CREATE INDEX IF NOT EXISTS {runs_table}_cutoff_idx ON {runs_table} (cutoff_date)")
+
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {targets_table} (
+            run_id VARCHAR,
+            strategy VARCHAR,
+            rank INTEGER,
+            CustomerID BIGINT,
+            expected_loss DOUBLE,
+            expected_clv DOUBLE,
+            churn_prob DOUBLE,
+            spend_prob DOUBLE
+        )
+    """)
+    con.execute(f"CREATE INDEX IF NOT EXISTS {targets_table}_run_idx ON {targets_table} (run_id, strategy)")
+
+
+def artifact_versions(bundle_path: str = BUNDLE_PATH, feature_cols_path: str = FEATURE_COLS_PATH) -> dict:
+    """
+    model_version = scoring bundle version (manifest only, no arrays loaded);
+    feature_version = sha256 of the ordered feature list (16 hex). None when missing.
+    """
+    model_version, feature_cols = None, None
+    if Path(bundle_path).exists():
+        from clv.bundle import load_bundle
+
+        bundle = load_bundle(bundle_path)
+        model_version, feature_cols = bundle.version, bundle.feature_cols
+    elif Path(feature_cols_path).exists():
+        from joblib import load
+
+        feature_cols = list(load(feature_cols_path))
+
+    feature_version = None
+    if feature_cols is not None:
+        feature_version = hashlib.sha256(json.dumps(feature_cols).encode("utf-8")).hexdigest()[:16]
+    return {"model_version": model_version, "feature_version": feature_version}
+
+
+def record_run(
+    con,
+    *,
+    run_id: str,
+    cutoff_date,
+    generated_at,
+    assumptions: dict,
+    summaries: dict,
+    target_files: dict,
+    overlap_pct: float | None = None,
+    versions: dict | None = None,
+    churn_model_version: str | None = None,
+    report_json=None,
+    runs_table: str = RUNS_TABLE,
+    targets_table: str = TARGETS_TABLE,
+) -> None:
+    """
+    Append one run: a report_runs row per strategy in summaries (StrategySummary or dict)
+    and its target list copied from target_files[strategy] (rank = file order).
+    """
+    ensure_history_tables(con, runs_table, targets_table)
+    versions = versions or {}
+    if isinstance(generated_at, str):
+        generated_at = pd.to_datetime(generated_at, format="%Y%m%d_%H%M%S_%f")  # run_report timestamp
+
+    rows = []
+    for strategy, summary in summaries.items():
+        s = asdict(summary) if hasattr(summary, "__dataclass_fields__") else dict(summary)
+        rows.append({
+            "run_id": run_id,
+            "strategy": strategy,
+            "cutoff_date": pd.to_datetime(cutoff_date).date(),
+            "generated_at": pd.to_datetime(generated_at),
+            "source": assumptions.get("source"),
+            "budget_eur": assumptions.get("budget_eur"),
+            "cost_per_customer": assumptions.get("cost_per_customer"),
+            "max_customers": assumptions.get("max_customers"),
+            "save_rate": assumptions.get("save_rate"),
+            "w_loss": assumptions.get("w_loss"),
+            "w_clv": assumptions.get("w_clv"),
+            **{k: s.get(k) for k in ["targeted_customers", "total_cost", "expected_prevented_loss", "net_uplift", "roi"]},
+            "overlap_pct": overlap_pct,
+            "model_version": versions.get("model_version"),
+            "feature_version": versions.get("feature_version"),
+            "churn_model_version": churn_model_version,
+            "assumptions": json.dumps(assumptions, default=str),
+            "report_json": None if report_json is None else str(report_json).replace("\\", "/"),
+        })
+    new = pd.DataFrame(rows)
+    con.register("new_runs", new)
+
+    cols = ", ".join(TARGET_COLS)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"INSERT INTO {runs_table} BY NAME SELECT * FROM new_runs")
+        for strategy, path in target_files.items():
+            con.execute(f"""
+                INSERT INTO {targets_table}
+                SELECT ?, ?, rank, {cols}
+                FROM ({ranked_file_sql(path, TARGET_COLS)})
+            """, [run_id, strategy])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister("new_runs")
+
+    print(f"Recorded run {run_id}: {runs_table} (+{len(rows)}), {targets_table} ({len(target_files)} lists)")
+
+
+def load_run_history(
+    strategy: str | None = None,
+    since=None,
+    runs_table: str = RUNS_TABLE,
+    db_path: str = DB_PATH,
+) -> pd.DataFrame:
+    """
+    Stored run summaries, oldest first (optionally one strategy / cutoffs since a date).
+    """
+    where, params = [], []
+    if strategy is not None:
+        where.append("strategy = ?")
+        params.append(strategy)
+    if since is not None:
+        where.append("cutoff_date >= CAST(? AS DATE)")
+        params.append(str(pd.to_datetime(since).date()))
+
+    con = connect(db_path, read_only=True)
+    out = con.execute(f"""
+        SELECT * EXCLUDE (assumptions)
+        FROM {runs_table}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY generated_at, strategy
+    """, params).fetchdf()
+    con.close()
+    return out
+
+
+def load_run_targets(
+    run_id: str,
+    strategy: str | None = None,
+    targets_table: str = TARGETS_TABLE,
+    db_path: str = DB_PATH,
+) -> pd.DataFrame:
+    """
+    Target list(s) of one run, in rank order.
+    """
+    params = [run_id] + ([strategy] if strategy is not None else [])
+    con = connect(db_path, read_only=True)
+    out = con.execute(f"""
+        SELECT *
+        FROM {targets_table}
+        WHERE run_id = ? {"AND strategy = ?" if strategy is not None else ""}
+        ORDER BY strategy, rank
+    """, params).fetchdf()
+    con.close()
+    return out
+
+
+if __name__ == "__main__":
+    history = load_run_history()
+    print("\n=== Run history ===")
+    print(history[["run_id", "strategy", "cutoff_date", "targeted_customers", "net_uplift", "roi", "overlap_pct", "model_version"]]
+          .to_string(index=False))
+
+    if not history.empty:
+        last = history["run_id"].iloc[-1]
+        print(f"\n=== Targets of {last} (top 5 per strategy) ===")
+        print(load_run_targets(last).groupby("strategy").head(5).to_string(index=False))
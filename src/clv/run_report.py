@@ -3,15 +3,24 @@ run_report.py
 
 Standardized run report artifact:
 - Loads predictions_customer_latest (latest snapshot)
-- Computes:
+- Computes (ranking + budget/capacity cut inside DuckDB, see clv.targeting_sql):
   1) Loss-only targeting (expected_loss)
   2) Blended targeting (rank-normalized expected_loss + expected_clv)
 - Applies BOTH constraints:
   - budget
   - max_customers
-- Saves:
-  - JSON run summary to artifacts/reports/
-  - CSV target lists (loss-only + blended)
+- Saves (clv.reporting.save_run_artifacts, plus the sections below):
+  - JSON run summary to artifacts/reports/ (built from aggregate queries)
+  - target lists (loss-only + blended) streamed from DuckDB via COPY TO
+    as zstd Parquet (EXPORT_FORMAT = "csv" for CSV)
+  - budget what-if (optimal / breakeven budget per strategy)
+  - Monte Carlo P5/P50/P95 net uplift + ROI per strategy
+  - global churn drivers (sampled mean |SHAP|, cached per model version)
+  - run history rows in DuckDB (report_runs + report_run_targets, see clv.run_history)
+
+Reads the current published snapshot (clv.snapshots), so it runs alongside a
+pipeline rebuild; run_all passes the working DB instead. Run history is written
+to the working DB and skipped while a pipeline run holds its write lock.
 
 Run:
     python src/clv/run_report.py
@@ -19,98 +28,39 @@ Run:
 
 from __future__ import annotations
 
-import json
-from dataclasses import asdict, dataclass
-from datetime import datetime
+from dataclasses import asdict
 from pathlib import Path
 
 import duckdb
 import pandas as pd
 
-DB_PATH = "data/warehouse.duckdb"
-PRED_VIEW = "predictions_customer_latest"
-
-
-@dataclass
-class StrategySummary:
-    targeted_customers: int
-    total_cost: float
-    expected_prevented_loss: float
-    net_uplift: float
-    roi: float | None
-
-
-def add_percentile_rank(df: pd.DataFrame, col: str, out_col: str) -> pd.DataFrame:
-    # percentile rank in [0,1]
-    df[out_col] = df[col].rank(pct=True, method="average")
-    return df
-
-
-def optimize_targeting(
-    df: pd.DataFrame,
-    budget_eur: float,
-    cost_per_customer: float,
-    max_customers: int,
-    save_rate: float,
-    score_col: str,
-) -> tuple[pd.DataFrame, StrategySummary]:
-    df = df.copy().sort_values(score_col, ascending=False)
-
-    # capacity constraint
-    df = df.head(max_customers).copy()
+from clv.business import simulate_campaign
+from clv.db import DB_PATH, connect
+from clv.reporting import file_columns, save_run_artifacts, write_report_json
+from clv.run_history import artifact_versions, record_run
+from clv.snapshots import reader_path
+from clv.targeting_sql import roi_curve_sql, snapshot_info, targets_limit, targets_query
 
-    # budget constraint
-    affordable_n = int(budget_eur // cost_per_customer) if cost_per_customer > 0 else 0
-    affordable_n = max(0, affordable_n)
-
-    targeted = df.head(min(len(df), affordable_n)).copy()
-
-    total_cost = float(len(targeted) * cost_per_customer)
+PRED_VIEW = "predictions_customer_latest"
+CHURN_MODEL_PATH = "artifacts/models/churn_xgb.joblib"
+EXPORT_FORMAT = "parquet"  # or "csv"
 
-    # prevented loss must always be based on expected_loss (business truth)
-    expected_prevented_loss = float(save_rate * targeted["expected_loss"].sum())
-    net_uplift = float(expected_prevented_loss - total_cost)
-    roi = (net_uplift / total_cost) if total_cost > 0 else None
 
-    return targeted, StrategySummary(
-        targeted_customers=int(len(targeted)),
-        total_cost=total_cost,
-        expected_prevented_loss=expected_prevented_loss,
-        net_uplift=net_uplift,
-        roi=None if roi is None else float(roi),
-    )
+def main(db_path: str | None = None):
+    db_path = db_path or reader_path()
 
-
-def main():
     # -------------------------
-    # 1) Load latest snapshot
+    # 1) Latest snapshot (aggregates only; ranking + selection run in DuckDB)
     # -------------------------
-    con = duckdb.connect(DB_PATH)
-    df = con.execute(f"""
-        SELECT
-          cutoff_date,
-          CustomerID,
-          churn_prob,
-          spend_prob,
-          expected_revenue,
-          expected_clv,
-          expected_loss
-        FROM {PRED_VIEW}
-    """).fetchdf()
-    con.close()
-
-    if df.empty:
+    info = snapshot_info(PRED_VIEW, db_path)
+    if info["rows"] == 0:
         raise ValueError(f"{PRED_VIEW} returned 0 rows. Run run_all.py first.")
 
-    # Safety: one row per customer
-    df = df.drop_duplicates(subset=["cutoff_date", "CustomerID"]).copy()
-
-    latest_cutoff = pd.to_datetime(df["cutoff_date"]).max()
-    cutoff_str = str(latest_cutoff.date())
+    latest_cutoff = pd.to_datetime(info["latest_cutoff"])
 
     print("\n=== Snapshot ===")
     print("latest_cutoff:", latest_cutoff)
-    print("rows:", len(df), "| customers:", df["CustomerID"].nunique())
+    print("rows:", info["rows"], "| customers:", info["customers"])
 
     # -------------------------
     # 2) Assumptions / knobs
@@ -119,6 +69,8 @@ def main():
     cost_per_customer = 1.0
     max_customers = 2000
     save_rate = 0.15
+    save_rate_sd = 0.05  # uncertainty around save_rate for the scenario draws
+    n_draws = 10_000
 
     # Strategy weights (your chosen default)
     w_loss, w_clv = 0.7, 0.3
@@ -129,90 +81,124 @@ def main():
         "cost_per_customer": cost_per_customer,
         "max_customers": max_customers,
         "save_rate": save_rate,
+        "save_rate_sd": save_rate_sd,
+        "n_draws": n_draws,
         "w_loss": w_loss,
         "w_clv": w_clv,
         "source": PRED_VIEW,
-        "db_path": DB_PATH,
+        "db_path": str(db_path).replace("\\", "/"),
     }
 
+    k = targets_limit(budget_eur, cost_per_customer, max_customers, save_rate)
+
+    con = connect(db_path, read_only=True, stage="report")
+
     # -------------------------
-    # 3) Strategy A: loss-only
+    # 3) Strategies A (loss-only) + B (blended, percentile ranks in SQL):
+    #    ranked + cut in DuckDB, streamed to disk; totals, overlap, preview
     # -------------------------
-    targets_loss, summary_loss = optimize_targeting(
-        df, budget_eur, cost_per_customer, max_customers, save_rate, score_col="expected_loss"
+    artifacts = save_run_artifacts(
+        con=con,
+        latest_cutoff=latest_cutoff,
+        assumptions=assumptions,
+        query_loss=targets_query(k, "expected_loss", source=PRED_VIEW),
+        query_blend=targets_query(k, "blended_score", w_loss, w_clv, source=PRED_VIEW),
+        cost_per_customer=cost_per_customer,
+        save_rate=save_rate,
+        top_n_preview=top_n_preview,
+        out_dir="artifacts/reports",
+        fmt=EXPORT_FORMAT,
+        write_json=False,  # written below with the sections added on top
     )
+    report = artifacts["report"]
+    loss_file, blend_file, report_json = artifacts["loss_file"], artifacts["blended_file"], artifacts["report_json"]
+    summary_loss, summary_blend = report["strategy_loss_only"], report["strategy_blended"]
+    overlap_pct = report["overlap_pct_blended_vs_loss_only"]
 
     # -------------------------
-    # 4) Strategy B: blended
+    # 4) Budget what-if: optimal / breakeven budgets from prefix-sum ROI curves
+    #    (only the top max_customers prefix matters, so only that comes back)
     # -------------------------
-    df2 = df.copy()
-    df2 = add_percentile_rank(df2, "expected_loss", "loss_rank")
-    df2 = add_percentile_rank(df2, "expected_clv", "clv_rank")
-    df2["blended_score"] = w_loss * df2["loss_rank"] + w_clv * df2["clv_rank"]
+    budget_curves = {}
+    for name, score in [("loss_only", "expected_loss"), ("blended", "blended_score")]:
+        curve = roi_curve_sql(max_customers, score, w_loss, w_clv, source=PRED_VIEW, db_path=db_path)
+        budget_curves[name] = {
+            "optimal": curve.optimal(cost_per_customer, save_rate, max_customers),
+            "breakeven": curve.breakeven(cost_per_customer, save_rate, max_customers),
+        }
 
-    targets_blend, summary_blend = optimize_targeting(
-        df2, budget_eur, cost_per_customer, max_customers, save_rate, score_col="blended_score"
-    )
+    # -------------------------
+    # 5) Uncertainty: scenario draws over churn / spend / save outcomes
+    # -------------------------
+    uncertainty = {}
+    for name, path in [("loss_only", loss_file), ("blended", blend_file)]:
+        inputs = file_columns(con, path, ["churn_prob", "spend_prob", "pred_revenue_if_spend"])
+        uncertainty[name] = asdict(simulate_campaign(inputs, cost_per_customer, save_rate, save_rate_sd, n_draws))
+    con.close()
 
     # -------------------------
-    # 5) Overlap
-    # -------------------------
-    overlap = set(targets_loss["CustomerID"]).intersection(set(targets_blend["CustomerID"]))
-    overlap_pct = float(len(overlap) / max(1, len(targets_blend)))
-
-    # -------------------------
-    # 6) Save artifacts
-    # -------------------------
-    out_dir = Path("artifacts/reports")
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    base = f"{cutoff_str}_{ts}"
-
-    loss_csv = out_dir / f"top_loss_{base}.csv"
-    blend_csv = out_dir / f"top_blended_{base}.csv"
-    report_json = out_dir / f"run_report_{base}.json"
-
-    # Keep the CSVs “analysis-ready”
-    targets_loss.to_csv(loss_csv, index=False)
-    targets_blend.to_csv(blend_csv, index=False)
-
-    report = {
-        "cutoff_date": cutoff_str,
-        "generated_at": ts,
-        "assumptions": assumptions,
-        "strategy_loss_only": asdict(summary_loss),
-        "strategy_blended": asdict(summary_blend),
-        "overlap_pct_blended_vs_loss_only": overlap_pct,
-        "files": {
-            "loss_csv": str(loss_csv).replace("\\", "/"),
-            "blended_csv": str(blend_csv).replace("\\", "/"),
-            "report_json": str(report_json).replace("\\", "/"),
-        },
-        "top_preview": {
-            "loss_only_top": targets_loss[["CustomerID", "expected_loss", "expected_clv", "churn_prob", "spend_prob"]]
-                .head(top_n_preview)
-                .to_dict(orient="records"),
-            "blended_top": targets_blend[["CustomerID", "expected_loss", "expected_clv", "churn_prob", "spend_prob"]]
-                .head(top_n_preview)
-                .to_dict(orient="records"),
-        },
-    }
+    # 6) Global churn drivers (computed once per model version)
+    # -------------------------
+    churn_drivers = None
+    if Path(CHURN_MODEL_PATH).exists():
+        from clv.explain import churn_global_importance
+        from clv.score import load_model
+
+        importance = churn_global_importance(load_model(CHURN_MODEL_PATH), db_path=db_path)
+        churn_drivers = {
+            "model_version": importance["model_version"],
+            "sample_rows": importance["sample_rows"],
+            "top_features": importance["features"][:10],
+        }
 
-    report_json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    # -------------------------
+    # 7) Save JSON: the standard artifacts report + the sections above
+    # -------------------------
+    report["budget_what_if"] = budget_curves
+    report["uncertainty"] = uncertainty
+    report["churn_drivers_global"] = churn_drivers
+    write_report_json(report, report_json)
+
+    # -------------------------
+    # 7b) Append to the queryable run history (report_runs / report_run_targets)
+    # -------------------------
+    try:
+        con = connect(DB_PATH)
+    except duckdb.IOException as e:  # a pipeline run holds the write lock
+        con = None
+        print("Run history not recorded (warehouse busy):", e)
+
+    if con is not None:
+        record_run(
+            con,
+            run_id=artifacts["run_id"],
+            cutoff_date=latest_cutoff,
+            generated_at=report["generated_at"],
+            assumptions=assumptions,
+            summaries={"loss_only": summary_loss, "blended": summary_blend},
+            target_files={"loss_only": loss_file, "blended": blend_file},
+            overlap_pct=overlap_pct,
+            versions=artifact_versions(),
+            churn_model_version=None if churn_drivers is None else churn_drivers["model_version"],
+            report_json=report_json,
+        )
+        con.close()
 
     # -------------------------
-    # 7) Console output
+    # 8) Console output
     # -------------------------
     print("\n=== Report saved ===")
-    print("loss CSV   :", loss_csv)
-    print("blended CSV:", blend_csv)
+    print("loss targets   :", loss_file)
+    print("blended targets:", blend_file)
     print("JSON report:", report_json)
 
     print("\n=== Summary ===")
     print("Loss-only:", asdict(summary_loss))
     print("Blended  :", asdict(summary_blend))
     print("Overlap %:", round(overlap_pct, 3))
+    print("Budget what-if:", budget_curves)
+    for name, sim in uncertainty.items():
+        print(f"Net uplift P5/P50/P95 ({name}):", round(sim["net_uplift_p5"], 2), round(sim["net_uplift_p50"], 2), round(sim["net_uplift_p95"], 2))
 
 
 if __name__ == "__main__":
@@ -1,18 +1,18 @@
-from clv.score import load_model, score_clv_and_write_to_db
+from clv.bundle import load_bundle
+from clv.score import score_clv_in_db
 
 def main():
-    churn = load_model("artifacts/models/churn_xgb.joblib")
-    spend = load_model("artifacts/models/spend_clf.joblib")
-    rev   = load_model("artifacts/models/revenue_reg.joblib")
-    feature_cols = load_model("artifacts/models/feature_cols.joblib")
+    # Single versioned bundle: manifest read now, models mapped lazily on first use
+    bundle = load_bundle("artifacts/models/clv_models.bundle")
 
-    score_clv_and_write_to_db(
-        churn_model=churn,
-        spend_model=spend,
-        revenue_model=rev,
-        feature_cols=feature_cols,
+    # Models are exported as DuckDB macros; scoring never leaves the database
+    score_clv_in_db(
+        churn_model=bundle.churn,
+        spend_model=bundle.spend,
+        revenue_model=bundle.revenue,
+        feature_cols=bundle.feature_cols,
         table_in="customer_model_data_rollup",
-        table_out="predictions_customer"
+        table_out_prefix="predictions_customer",
     )
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
-import duckdb
 import joblib
 import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from clv.db import DB_PATH, close_all, connect
+
 
 def save_model(model, path: str):
     Path(path).parent.mkdir(parents=True, exist_ok=True)
@@ -23,7 +24,7 @@ def score_and_write_to_db(
     """
     Legacy churn-only scoring (kept for backward compatibility).
     """
-    con = duckdb.connect("data/warehouse.duckdb")
+    con = connect(stage="score")
     df = con.execute(f"SELECT * FROM {table_in}").fetchdf()
 
     missing = [c for c in feature_cols if c not in df.columns]
@@ -53,45 +54,77 @@ def score_and_write_to_db(
 
 
 import numpy as np
-import duckdb
 import pandas as pd
 
 
-def score_clv_and_write_to_db(
+def _predict_components(X: pd.DataFrame, churn_model, spend_model, revenue_model):
+    churn_prob = churn_model.predict_proba(X)[:, 1]
+    spend_prob = spend_model.predict_proba(X)[:, 1]
+
+    # Revenue model predicts log1p(revenue | spend>0)
+    pred_rev_log = revenue_model.predict(X)
+    pred_rev_if_spend = np.expm1(pred_rev_log)
+    pred_rev_if_spend = np.clip(pred_rev_if_spend, 0, None)
+
+    return churn_prob, spend_prob, pred_rev_if_spend
+
+
+def predict_clv(
+    df: pd.DataFrame,
     churn_model,
     spend_model,
     revenue_model,
     feature_cols: list[str],
-    table_in: str = "customer_model_data_rollup",
-    table_out_prefix: str = "predictions_customer",
-):
-    con = duckdb.connect("data/warehouse.duckdb")
-    df = con.execute(f"SELECT * FROM {table_in}").fetchdf()
+    cache=None,
+) -> pd.DataFrame:
+    """
+    Score one frame of feature rows (must include cutoff_date, CustomerID and
+    feature_cols). Returns the prediction-store columns.
 
+    cache: optional clv.pred_cache.PredictionCache; only rows whose feature
+    hash is not cached for the cache's model version go through the models.
+    """
     # Ensure required columns exist
     missing = [c for c in feature_cols if c not in df.columns]
     if missing:
-        con.close()
-        raise ValueError(f"Missing feature columns in {table_in}: {missing}")
+        raise ValueError(f"Missing feature columns: {missing}")
 
     # Build X with exact feature list and order
     X = df[feature_cols].copy()
     X = X.apply(pd.to_numeric, errors="coerce")
     X.replace([np.inf, -np.inf], np.nan, inplace=True)
 
-    churn_prob = churn_model.predict_proba(X)[:, 1]
-    spend_prob = spend_model.predict_proba(X)[:, 1]
+    if cache is None:
+        churn_prob, spend_prob, pred_rev_if_spend = _predict_components(X, churn_model, spend_model, revenue_model)
+    else:
+        keys = cache.keys_for(X)
+        hits = cache.lookup(keys)
+        miss = ~np.isin(keys, hits.index.to_numpy())
 
-    # Revenue model predicts log1p(revenue | spend>0)
-    pred_rev_log = revenue_model.predict(X)
-    pred_rev_if_spend = np.expm1(pred_rev_log)
-    pred_rev_if_spend = np.clip(pred_rev_if_spend, 0, None)
+        cached = hits.reindex(keys[~miss])
+        churn_prob = np.empty(len(X))
+        spend_prob = np.empty(len(X))
+        pred_rev_if_spend = np.empty(len(X))
+        churn_prob[~miss] = cached["churn_prob"].to_numpy()
+        spend_prob[~miss] = cached["spend_prob"].to_numpy()
+        pred_rev_if_spend[~miss] = cached["pred_revenue_if_spend"].to_numpy()
+
+        if miss.any():
+            c, s, r = _predict_components(X.loc[miss], churn_model, spend_model, revenue_model)
+            churn_prob[miss], spend_prob[miss], pred_rev_if_spend[miss] = c, s, r
+            cache.store(keys[miss], pd.DataFrame({
+                "churn_prob": c,
+                "spend_prob": s,
+                "pred_revenue_if_spend": r,
+            }))
+
+        print(f"Prediction cache: {int((~miss).sum())} hits / {int(miss.sum())} misses")
 
     expected_revenue = spend_prob * pred_rev_if_spend
     expected_clv = (1 - churn_prob) * expected_revenue
     expected_loss = churn_prob * expected_revenue
 
-    out = pd.DataFrame({
+    return pd.DataFrame({
         "cutoff_date": pd.to_datetime(df["cutoff_date"]).dt.date,
         "CustomerID": df["CustomerID"],
         "churn_prob": churn_prob,
@@ -102,6 +135,27 @@ def score_clv_and_write_to_db(
         "expected_loss": expected_loss
     })
 
+
+def score_clv_and_write_to_db(
+    churn_model,
+    spend_model,
+    revenue_model,
+    feature_cols: list[str],
+    table_in: str = "customer_model_data_rollup",
+    table_out_prefix: str = "predictions_customer",
+    cache=None,
+):
+    con = connect(stage="score")
+    df = con.execute(f"SELECT * FROM {table_in}").fetchdf()
+
+    # Ensure required columns exist
+    missing = [c for c in feature_cols if c not in df.columns]
+    if missing:
+        con.close()
+        raise ValueError(f"Missing feature columns in {table_in}: {missing}")
+
+    out = predict_clv(df, churn_model, spend_model, revenue_model, feature_cols, cache=cache)
+
     # =========================
     # Versioned write (B)
     # =========================
@@ -129,3 +183,234 @@ def score_clv_and_write_to_db(
     print(f"Created view: {table_out_prefix}_latest -> {latest_table}")
 
     con.close()
+
+
+def score_clv_in_db(
+    churn_model,
+    spend_model,
+    revenue_model,
+    feature_cols: list[str],
+    table_in: str = "customer_model_data_rollup",
+    table_out_prefix: str = "predictions_customer",
+):
+    """
+    Same outputs as score_clv_and_write_to_db, but scoring runs inside DuckDB:
+    the models are exported as SQL macros (clv.score_sql) and each versioned
+    table is built with one CREATE TABLE ... AS SELECT, so feature rows never
+    leave the engine.
+    """
+    from clv.score_sql import build_clean_feature_sql, create_scoring_macros
+
+    con = connect(stage="score")
+
+    cols_in = {r[0] for r in con.execute(f"DESCRIBE {table_in}").fetchall()}
+    missing = [c for c in feature_cols if c not in cols_in]
+    if missing:
+        con.close()
+        raise ValueError(f"Missing feature columns in {table_in}: {missing}")
+
+    create_scoring_macros(con, churn_model, spend_model, revenue_model, feature_cols)
+
+    # Score every cutoff in one pass (one bind of the model expressions),
+    # then split into the versioned tables.
+    args = ", ".join(feature_cols)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE scored_tmp AS
+        WITH x AS (
+            SELECT
+                CAST(cutoff_date AS DATE) AS cutoff_date,
+                CustomerID,
+                {build_clean_feature_sql(feature_cols)}
+            FROM {table_in}
+        ),
+        p AS (
+            SELECT
+                cutoff_date,
+                CustomerID,
+                churn_prob({args}) AS churn_prob,
+                spend_prob({args}) AS spend_prob,
+                pred_revenue_if_spend({args}) AS pred_revenue_if_spend
+            FROM x
+        )
+        SELECT
+            cutoff_date,
+            CustomerID,
+            churn_prob,
+            spend_prob,
+            pred_revenue_if_spend,
+            spend_prob * pred_revenue_if_spend AS expected_revenue,
+            (1 - churn_prob) * spend_prob * pred_revenue_if_spend AS expected_clv,
+            churn_prob * spend_prob * pred_revenue_if_spend AS expected_loss
+        FROM p
+    """)
+
+    cutoffs = [r[0] for r in con.execute(
+        "SELECT DISTINCT cutoff_date FROM scored_tmp ORDER BY 1"
+    ).fetchall()]
+
+    for c in cutoffs:
+        suffix = str(c).replace("-", "_")  # YYYY_MM_DD
+        table_name = f"{table_out_prefix}_{suffix}"
+
+        con.execute(f"DROP TABLE IF EXISTS {table_name}")
+        con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM scored_tmp WHERE cutoff_date = ?", [c])
+
+        rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        print(f"Saved versioned predictions table: {table_name} (rows={rows})")
+
+    # latest view
+    latest_table = f"{table_out_prefix}_{str(max(cutoffs)).replace('-', '_')}"
+
+    con.execute(f"DROP VIEW IF EXISTS {table_out_prefix}_latest")
+    con.execute(f"CREATE VIEW {table_out_prefix}_latest AS SELECT * FROM {latest_table}")
+    print(f"Created view: {table_out_prefix}_latest -> {latest_table}")
+
+    con.close()
+
+
+# =========================
+# Sharded multi-process scoring
+# =========================
+DEFAULT_MODEL_PATHS = {
+    "churn": "artifacts/models/churn_xgb.joblib",
+    "spend": "artifacts/models/spend_clf.joblib",
+    "revenue": "artifacts/models/revenue_reg.joblib",
+    "feature_cols": "artifacts/models/feature_cols.joblib",
+}
+
+_worker_models = None
+
+
+def _single_threaded(model):
+    """
+    n_jobs=1 on the XGBoost estimator(s) of a model (plain or calibrated); other models are returned as is.
+    """
+    estimators = [c.estimator for c in getattr(model, "calibrated_classifiers_", [])] or [model]
+    for est in estimators:
+        if hasattr(est, "get_booster"):
+            est.set_params(n_jobs=1)  # also sets the fitted booster's nthread
+    return model
+
+
+def _init_shard_worker(model_paths: dict | None, bundle_path: str | None):
+    """
+    Runs once per worker process: load the models a single time and keep the
+    tree libraries single-threaded (parallelism comes from the shards).
+    """
+    global _worker_models
+    from threadpoolctl import threadpool_limits
+
+    # OpenMP (HistGradientBoosting) / BLAS pools are already initialized by the
+    # imports at this point, so limit them explicitly rather than via env vars
+    threadpool_limits(limits=1)
+
+    if bundle_path:
+        # memory-mapped: all workers share the same model pages
+        from clv.bundle import load_bundle
+        b = load_bundle(bundle_path)
+        _worker_models = {"churn": b.churn, "spend": b.spend, "revenue": b.revenue, "feature_cols": b.feature_cols}
+    else:
+        _worker_models = {k: load_model(v) for k, v in model_paths.items()}
+        _worker_models["churn"] = _single_threaded(_worker_models["churn"])
+
+
+def _score_shard(db_path: str, table_in: str, shard: int, n_shards: int, out_path: str) -> int:
+    m = _worker_models
+
+    con = connect(db_path, read_only=True, stage="shard")  # threads = 1: one worker per core
+    df = con.execute(
+        f"SELECT * FROM {table_in} WHERE hash(CustomerID) % ? = ?", [n_shards, shard]
+    ).fetchdf()
+
+    if df.empty:
+        con.close()
+        return 0
+
+    out = predict_clv(df, m["churn"], m["spend"], m["revenue"], m["feature_cols"])
+    con.register("out_df", out)
+    con.execute(f"COPY out_df TO '{out_path}' (FORMAT PARQUET)")
+    con.close()
+    return len(out)
+
+
+def score_clv_sharded(
+    model_paths: dict | None = None,
+    bundle_path: str | None = None,
+    n_shards: int | None = None,
+    table_in: str = "customer_model_data_rollup",
+    table_out_prefix: str = "predictions_customer",
+    staging_dir: str = "artifacts/scoring",
+):
+    """
+    Parallel version of score_clv_and_write_to_db:
+    - rows are partitioned by hash(CustomerID) % n_shards
+    - each shard is scored in a worker process (models loaded once per worker,
+      from the joblib artifacts or from a model bundle if bundle_path is given)
+      and staged as a Parquet file
+    - the versioned tables + latest view are then published in ONE transaction,
+      so readers see either the previous predictions or the new ones
+    """
+    import multiprocessing
+    import os
+    import shutil
+    from concurrent.futures import ProcessPoolExecutor
+    from datetime import datetime
+
+    db_path = DB_PATH
+    model_paths = model_paths or DEFAULT_MODEL_PATHS
+    n_shards = n_shards or os.cpu_count() or 1
+
+    run_dir = Path(staging_dir) / datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    run_dir.mkdir(parents=True, exist_ok=True)
+
+    # Workers open the database read-only; no connection is held here meanwhile
+    # (a read-write handle from an earlier stage of this process would lock them out).
+    close_all()
+    with ProcessPoolExecutor(
+        max_workers=min(n_shards, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_shard_worker,
+        initargs=(model_paths, bundle_path),
+    ) as pool:
+        futures = [
+            pool.submit(_score_shard, db_path, table_in, k, n_shards, str(run_dir / f"shard_{k:04d}.parquet"))
+            for k in range(n_shards)
+        ]
+        rows_scored = sum(f.result() for f in futures)
+
+    print(f"Scored {rows_scored} rows in {n_shards} shards -> {run_dir}")
+    if rows_scored == 0:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise ValueError(f"{table_in} returned 0 rows to score.")
+
+    # =========================
+    # Atomic publish
+    # =========================
+    shards = f"read_parquet('{run_dir.as_posix()}/*.parquet')"
+
+    con = connect(db_path, stage="score")
+    con.execute("BEGIN TRANSACTION")
+    try:
+        cutoffs = [r[0] for r in con.execute(f"SELECT DISTINCT cutoff_date FROM {shards} ORDER BY 1").fetchall()]
+
+        for c in cutoffs:
+            suffix = str(c).replace("-", "_")  # YYYY_MM_DD
+            table_name = f"{table_out_prefix}_{suffix}"
+
+            con.execute(f"DROP TABLE IF EXISTS {table_name}")
+            con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM {shards} WHERE cutoff_date = ?", [c])
+
+        latest_table = f"{table_out_prefix}_{str(max(cutoffs)).replace('-', '_')}"
+        con.execute(f"DROP VIEW IF EXISTS {table_out_prefix}_latest")
+        con.execute(f"CREATE VIEW {table_out_prefix}_latest AS SELECT * FROM {latest_table}")
+
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        con.close()
+        raise
+
+    con.close()
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    print(f"Published {len(cutoffs)} versioned prediction tables; {table_out_prefix}_latest -> {latest_table}")
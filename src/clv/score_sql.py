@@ -0,0 +1,166 @@
+"""
+score_sql.py
+
+Export the fitted CLV models as DuckDB SQL so batch scoring runs entirely
+inside the engine:
+- churn_prob(<features>)            XGBoost trees as CASE expressions (+ sigmoid calibration)
+- spend_prob(<features>)            imputer + scaler + logistic regression, folded into one linear term
+- pred_revenue_if_spend(<features>) HistGradientBoosting trees as CASE expressions, back-transformed
+
+Models are first compiled with clv.inference, so the SQL follows the same flat
+tree layout. Macro arguments are the feature columns in feature_cols order;
+missing values must be passed as NULL (see build_clean_feature_sql).
+"""
+
+from __future__ import annotations
+
+import re
+
+import numpy as np
+
+from clv.inference import (
+    CompiledLinearClassifier,
+    CompiledTreeClassifier,
+    CompiledTreeRegressor,
+    TreeEnsemble,
+    compile_model,
+)
+
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_identifiers(feature_cols: list[str]) -> None:
+    bad = [c for c in feature_cols if not _IDENTIFIER.match(c)]
+    if bad:
+        raise ValueError(f"Feature names cannot be used as SQL macro parameters: {bad}")
+
+
+def _literal(x: float) -> str:
+    # exponent form is parsed as an exact DOUBLE (plain decimals become DECIMAL
+    # and can round differently); float32 thresholds are exactly representable
+    return f"{float(x):.17e}"
+
+
+def _balanced_sum(terms: list[str]) -> str:
+    # pairwise sum keeps expression depth at log2(n_trees)
+    while len(terms) > 1:
+        terms = [f"({terms[i]} + {terms[i + 1]})" if i + 1 < len(terms) else terms[i]
+                 for i in range(0, len(terms), 2)]
+    return terms[0]
+
+
+def _tree_sql(trees: TreeEnsemble, node: int, feature_cols: list[str]) -> str:
+    f = int(trees.feature[node])
+    if f < 0:
+        return _literal(trees.value[node])
+
+    x = feature_cols[f]
+    if trees.float32_inputs:
+        x = f"CAST({x} AS FLOAT)"
+    cond = f"{x} < {_literal(trees.threshold[node])}"
+    if trees.default_left[node]:
+        # NULL < t is NULL -> ELSE branch, which is already the default-right case
+        cond = f"({cond} OR {x} IS NULL)"
+
+    left, right = (int(c) for c in trees.children[node])
+    return f"CASE WHEN {cond} THEN {_tree_sql(trees, left, feature_cols)} ELSE {_tree_sql(trees, right, feature_cols)} END"
+
+
+def build_margin_sql(trees: TreeEnsemble, feature_cols: list[str]) -> list[str]:
+    """
+    One SQL expression per output group: base_margin + sum of tree outputs.
+    """
+    bounds = list(trees.group_offsets) + [trees.n_trees]
+    out = []
+    for g in range(trees.n_groups):
+        terms = [_tree_sql(trees, int(trees.roots[t]), feature_cols) for t in range(bounds[g], bounds[g + 1])]
+        out.append(f"({_literal(trees.base_margin[g])} + {_balanced_sum(terms)})")
+    return out
+
+
+def build_churn_prob_sql(model, feature_cols: list[str]) -> str:
+    model = compile_model(model)
+    if not isinstance(model, CompiledTreeClassifier):
+        raise ValueError("churn model must compile to a tree classifier")
+
+    probs = [f"(1.0 / (1.0 + exp(-{m})))" for m in build_margin_sql(model.trees, feature_cols)]
+    if model.calib_a is not None:
+        probs = [
+            f"(1.0 / (1.0 + exp({_literal(a)} * {p} + {_literal(b)})))"
+            for p, a, b in zip(probs, model.calib_a, model.calib_b)
+        ]
+    return f"({_balanced_sum(probs)}) / {len(probs)}"
+
+
+def build_spend_prob_sql(model, feature_cols: list[str]) -> str:
+    model = compile_model(model)
+    if not isinstance(model, CompiledLinearClassifier):
+        raise ValueError("spend model must compile to a linear classifier")
+
+    prep = model.prep
+    n = len(feature_cols)
+    mean = prep.mean if prep.mean is not None else np.zeros(n)
+    scale = prep.scale if prep.scale is not None else np.ones(n)
+
+    # coef * (x - mean) / scale  ->  w * x + const
+    w = model.coef / scale
+    intercept = model.intercept - float(np.sum(w * mean))
+
+    terms = []
+    for j, col in enumerate(feature_cols):
+        x = col if prep.fill is None else f"COALESCE({col}, {_literal(prep.fill[j])})"
+        terms.append(f"{_literal(w[j])} * {x}")
+    return f"(1.0 / (1.0 + exp(-({_literal(intercept)} + {_balanced_sum(terms)}))))"
+
+
+def build_pred_revenue_sql(model, feature_cols: list[str]) -> str:
+    model = compile_model(model)
+    if not isinstance(model, CompiledTreeRegressor):
+        raise ValueError("revenue model must compile to a tree regressor")
+
+    cols = feature_cols
+    if model.prep.fill is not None:
+        cols = [f"COALESCE({c}, {_literal(v)})" for c, v in zip(feature_cols, model.prep.fill)]
+
+    # model predicts log1p(revenue | spend>0)
+    margin = build_margin_sql(model.trees, cols)[0]
+    return f"greatest(exp({margin}) - 1.0, 0.0)"
+
+
+def build_clean_feature_sql(feature_cols: list[str]) -> str:
+    """
+    Same cleaning as the pandas path: numeric cast, +/-inf and NaN -> NULL.
+    """
+    return ",\n".join(
+        f"CASE WHEN isfinite(TRY_CAST({c} AS DOUBLE)) THEN TRY_CAST({c} AS DOUBLE) END AS {c}"
+        for c in feature_cols
+    )
+
+
+def create_scoring_macros(con, churn_model, spend_model, revenue_model, feature_cols: list[str]) -> None:
+    """
+    (Re)create churn_prob / spend_prob / pred_revenue_if_spend as TEMP macros: they
+    live only in this connection (cursor), so they never reach the catalog or
+    the published snapshots.
+    """
+    _check_identifiers(feature_cols)
+    params = ", ".join(feature_cols)
+
+    macros = {
+        "churn_prob": build_churn_prob_sql(churn_model, feature_cols),
+        "spend_prob": build_spend_prob_sql(spend_model, feature_cols),
+        "pred_revenue_if_spend": build_pred_revenue_sql(revenue_model, feature_cols),
+    }
+    # persistent copies left by earlier builds
+    db = con.execute("SELECT current_database()").fetchone()[0]
+    stale = con.execute(
+        "SELECT DISTINCT function_name FROM duckdb_functions() "
+        "WHERE database_name = ? AND function_type = 'macro' AND list_contains(?, function_name)",
+        [db, list(macros)],
+    ).fetchall()
+    for (name,) in stale:
+        con.execute(f'DROP MACRO "{db}".main.{name}')
+
+    for name, body in macros.items():
+        con.execute(f"CREATE OR REPLACE TEMP MACRO {name}({params}) AS {body}")
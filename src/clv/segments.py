@@ -0,0 +1,329 @@
+"""
+segments.py
+
+Customer segments per cutoff, stored next to the predictions:
+
+    customer_segments(cutoff_date, CustomerID, r_score, f_score, m_score,
+                      rfm_cell, rfm_segment, cluster, created_at)
+    predictions_segments_latest  = predictions_customer_latest + its segment columns
+
+- RFM: quintile bins of recency_days_obs (reversed: recent = 5),
+  invoice_count_obs and net_revenue_obs. Edges come from one quantile_cont
+  aggregate per cutoff and the bins are assigned in the same INSERT, so no
+  customer rows leave DuckDB. Values on an edge go to the lower bin.
+- cluster (optional, n_clusters): MiniBatchKMeans on signed-log, standardized
+  CLUSTER_FEATURES. Mean / std come from one SQL aggregate; the model is fit
+  with partial_fit on batches streamed from DuckDB (shuffled by hash), then a
+  second streamed pass assigns clusters, so memory is one batch at a time.
+  The fitted scaler + model are saved and can be reused for later cutoffs
+  (same cluster ids).
+
+Run:
+    python src/clv/segments.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from clv.db import DB_PATH, connect
+
+
+TABLE_IN = "customer_model_data_rollup"
+SEGMENTS_TABLE = "customer_segments"
+PRED_VIEW = "predictions_customer_latest"
+SEGMENTS_VIEW = "predictions_segments_latest"
+SEGMENT_MODEL_PATH = "artifacts/models/segments_kmeans.joblib"
+
+RFM_COLS = {"r": "recency_days_obs", "f": "invoice_count_obs", "m": "net_revenue_obs"}
+RFM_BINS = 5
+CLUSTER_FEATURES = [
+    "recency_days_obs",
+    "invoice_count_obs",
+    "net_revenue_obs",
+    "tenure_days_obs",
+    "active_days_obs",
+]
+
+# first match wins; scores are 1..5 (5 = most recent / most frequent / highest revenue)
+RFM_SEGMENTS = [
+    ("champions", "r_score >= 4 AND f_score >= 4 AND m_score >= 4"),
+    ("loyal", "r_score >= 3 AND f_score >= 4"),
+    ("new_or_promising", "r_score >= 4 AND f_score <= 2"),
+    ("cannot_lose", "r_score <= 2 AND f_score >= 4"),
+    ("at_risk", "r_score <= 2 AND f_score >= 3"),
+    ("hibernating", "r_score <= 2 AND f_score <= 2"),
+]
+DEFAULT_SEGMENT = "needs_attention"
+
+
+# -------------------------
+# RFM bins (SQL)
+# -------------------------
+def _bin_sql(col: str, edges: str, reverse: bool = False) -> str:
+    """
+    1 + number of quantile edges below the value (reversed for recency); NULL -> 1.
+    """
+    score = " + ".join(["1"] + [f"CAST({col} > {edges}[{i}] AS INTEGER)" for i in range(1, RFM_BINS)])
+    if reverse:
+        score = f"{RFM_BINS + 1} - ({score})"
+    return f"CASE WHEN {col} IS NULL THEN 1 ELSE {score} END"
+
+
+def _segment_sql() -> str:
+    cases = "\n".join(f"            WHEN {cond} THEN '{name}'" for name, cond in RFM_SEGMENTS)
+    return f"CASE\n{cases}\n            ELSE '{DEFAULT_SEGMENT}' END"
+
+
+def rfm_query(table_in: str = TABLE_IN) -> str:
+    """
+    One row per customer at cutoff ?: r/f/m scores, rfm_cell ('R5F3M4'), rfm_segment.
+    """
+    qs = [round(i / RFM_BINS, 6) for i in range(1, RFM_BINS)]
+    edges = ",\n              ".join(f"quantile_cont({c}, {qs}) AS {k}_edges" for k, c in RFM_COLS.items())
+    return f"""
+        WITH base AS (
+            SELECT cutoff_date, CustomerID, {", ".join(RFM_COLS.values())}
+            FROM {table_in}
+            WHERE cutoff_date = CAST(? AS DATE)
+        ),
+        edges AS (
+            SELECT
+              {edges}
+            FROM base
+        ),
+        scored AS (
+            SELECT
+              b.cutoff_date,
+              b.CustomerID,
+              {_bin_sql("b." + RFM_COLS["r"], "e.r_edges", reverse=True)} AS r_score,
+              {_bin_sql("b." + RFM_COLS["f"], "e.f_edges")} AS f_score,
+              {_bin_sql("b." + RFM_COLS["m"], "e.m_edges")} AS m_score
+            FROM base b CROSS JOIN edges e
+        )
+        SELECT
+          *,
+          'R' || r_score || 'F' || f_score || 'M' || m_score AS rfm_cell,
+          {_segment_sql()} AS rfm_segment
+        FROM scored
+    """
+
+
+# -------------------------
+# Streamed mini-batch k-means
+# -------------------------
+def _feature_exprs(features: list[str]) -> list[str]:
+    # signed log1p: revenue can be negative (returns), counts / days are skewed
+    return [f"sign(COALESCE({c}, 0)) * ln(1 + abs(COALESCE({c}, 0)))" for c in features]
+
+
+def _scaled_sql(features: list[str], mean: np.ndarray, std: np.ndarray, table_in: str) -> str:
+    cols = ",\n              ".join(
+        f"({e} - {m!r}) / {s!r} AS f{i}"
+        for i, (e, m, s) in enumerate(zip(_feature_exprs(features), mean.tolist(), std.tolist()))
+    )
+    return f"""
+        SELECT
+          CustomerID,
+          {cols}
+        FROM {table_in}
+        WHERE cutoff_date = CAST(? AS DATE)
+    """
+
+
+def _batches(con, sql: str, params: list, batch_rows: int):
+    """
+    DataFrames of ~batch_rows rows from one streamed result.
+    """
+    result = con.execute(sql, params)
+    vectors = max(1, batch_rows // 2048)  # DuckDB vector = 2048 rows
+    while True:
+        chunk = result.fetch_df_chunk(vectors)
+        if chunk.empty:
+            return
+        yield chunk
+
+
+def fit_segment_clusters(
+    cutoff_date,
+    n_clusters: int = 8,
+    features: list[str] = CLUSTER_FEATURES,
+    batch_rows: int = 100_000,
+    n_epochs: int = 3,
+    seed: int = 42,
+    table_in: str = TABLE_IN,
+    db_path: str = DB_PATH,
+) -> dict:
+    """
+    {"features", "mean", "std", "kmeans"} fitted on one cutoff without loading it whole.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    con = connect(db_path, read_only=True)
+    aggs = ", ".join(f"AVG({e}), STDDEV_POP({e})" for e in _feature_exprs(features))
+    stats = np.array(
+        con.execute(f"SELECT {aggs} FROM {table_in} WHERE cutoff_date = CAST(? AS DATE)", [str(cutoff_date)]).fetchone(),
+        dtype=float,
+    )
+    mean = np.nan_to_num(stats[0::2])
+    std = np.nan_to_num(stats[1::2])
+    std[std == 0] = 1.0
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, batch_size=min(batch_rows, 4096), n_init=3)
+    fit_cols = [f"f{i}" for i in range(len(features))]
+    scaled = _scaled_sql(features, mean, std, table_in)
+
+    # partial_fit needs at least n_clusters rows: small blocks are carried into the
+    # next one, and each full block is held back one step so a short final block
+    # can be folded into it instead of being dropped
+    held, pending = None, None
+    for epoch in range(n_epochs):
+        # hash order mixes customers across batches (stored order is by cutoff / id),
+        # reshuffled every epoch
+        sql = scaled + f" ORDER BY hash(CustomerID + {int(seed) + epoch})"
+        for batch in _batches(con, sql, [str(cutoff_date)], batch_rows):
+            X = batch[fit_cols].to_numpy(dtype=float)
+            pending = X if pending is None else np.vstack([pending, X])
+            if len(pending) >= n_clusters:
+                if held is not None:
+                    kmeans.partial_fit(held)
+                held, pending = pending, None
+    con.close()
+
+    tail = [b for b in (held, pending) if b is not None]
+    if tail and sum(len(b) for b in tail) >= n_clusters:
+        kmeans.partial_fit(np.vstack(tail))
+
+    if not hasattr(kmeans, "cluster_centers_"):
+        raise ValueError(f"Fewer than n_clusters={n_clusters} customers at cutoff {cutoff_date}")
+    return {"features": list(features), "mean": mean, "std": std, "kmeans": kmeans}
+
+
+# -------------------------
+# Build + persist
+# -------------------------
+def build_segments(
+    cutoff_date=None,
+    n_clusters: int | None = None,
+    model: dict | None = None,
+    batch_rows: int = 100_000,
+    table_in: str = TABLE_IN,
+    table_out: str = SEGMENTS_TABLE,
+    model_path: str = SEGMENT_MODEL_PATH,
+    db_path: str = DB_PATH,
+) -> int:
+    """
+    Replace the segments of one cutoff (default: latest) in table_out.
+    Clusters are assigned when n_clusters (fit + save to model_path) or model (reuse) is given.
+    Returns the number of customers.
+    """
+    con = connect(db_path, stage="build")
+    if cutoff_date is None:
+        cutoff_date = con.execute(f"SELECT MAX(cutoff_date) FROM {table_in}").fetchone()[0]
+    cutoff = str(pd.to_datetime(cutoff_date).date())
+
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_out} (
+            cutoff_date DATE,
+            CustomerID BIGINT,
+            r_score INTEGER,
+            f_score INTEGER,
+            m_score INTEGER,
+            rfm_cell VARCHAR,
+            rfm_segment VARCHAR,
+            cluster INTEGER,
+            created_at TIMESTAMP
+        )
+    """)
+
+    con.execute("CREATE OR REPLACE TEMP TABLE segment_clusters (CustomerID BIGINT, cluster INTEGER)")
+    if model is None and n_clusters:
+        model = fit_segment_clusters(cutoff, n_clusters, batch_rows=batch_rows, table_in=table_in, db_path=db_path)
+        from clv.score import save_model
+
+        save_model(model, model_path)
+    if model is not None:
+        # second cursor streams features while this one writes the assignments
+        reader = connect(db_path)
+        sql = _scaled_sql(model["features"], model["mean"], model["std"], table_in)
+        fit_cols = [f"f{i}" for i in range(len(model["features"]))]
+        for batch in _batches(reader, sql, [cutoff], batch_rows):
+            labels = model["kmeans"].predict(batch[fit_cols].to_numpy(dtype=float))
+            con.register("cluster_batch", pd.DataFrame({"CustomerID": batch["CustomerID"], "cluster": labels.astype("int32")}))
+            con.execute("INSERT INTO segment_clusters SELECT * FROM cluster_batch")
+            con.unregister("cluster_batch")
+        reader.close()
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"DELETE FROM {table_out} WHERE cutoff_date = CAST(? AS DATE)", [cutoff])
+        n = con.execute(f"""
+            INSERT INTO {table_out}
+            SELECT r.cutoff_date, r.CustomerID, r.r_score, r.f_score, r.m_score, r.rfm_cell, r.rfm_segment,
+                   c.cluster, now()
+            FROM ({rfm_query(table_in)}) r
+            LEFT JOIN segment_clusters c ON c.CustomerID = r.CustomerID
+        """, [cutoff]).fetchone()[0]
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        con.close()
+        raise
+    con.execute("DROP TABLE segment_clusters")
+
+    if _exists(con, PRED_VIEW):
+        con.execute(f"""
+            CREATE OR REPLACE VIEW {SEGMENTS_VIEW} AS
+            SELECT p.*, s.r_score, s.f_score, s.m_score, s.rfm_cell, s.rfm_segment, s.cluster
+            FROM {PRED_VIEW} p
+            LEFT JOIN {table_out} s
+              ON s.cutoff_date = p.cutoff_date AND s.CustomerID = p.CustomerID
+        """)
+    con.close()
+
+    print(f"Saved segments: {table_out} (cutoff={cutoff}, customers={n}, clusters={'yes' if model else 'no'})")
+    return int(n)
+
+
+def _exists(con, name: str) -> bool:
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [name]
+    ).fetchone()[0] > 0
+
+
+def segment_summary(by: str = "rfm_segment", view: str = SEGMENTS_VIEW, db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    Customers, mean churn_prob and total expected_clv / expected_loss per segment (latest cutoff).
+    """
+    con = connect(db_path, read_only=True)
+    out = con.execute(f"""
+        SELECT
+          {by},
+          COUNT(*) AS customers,
+          AVG(churn_prob) AS avg_churn_prob,
+          SUM(expected_clv) AS expected_clv,
+          SUM(expected_loss) AS expected_loss
+        FROM {view}
+        GROUP BY {by}
+        ORDER BY expected_loss DESC
+    """).fetchdf()
+    con.close()
+    return out
+
+
+if __name__ == "__main__":
+    model = None
+    if Path(SEGMENT_MODEL_PATH).exists():
+        from clv.score import load_model
+
+        model = load_model(SEGMENT_MODEL_PATH)
+    build_segments(n_clusters=None if model else 6, model=model)
+
+    print("\n=== RFM segments (latest) ===")
+    print(segment_summary("rfm_segment").to_string(index=False))
+
+    print("\n=== Clusters (latest) ===")
+    print(segment_summary("cluster").to_string(index=False))
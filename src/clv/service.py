@@ -0,0 +1,277 @@
+"""
+service.py
+
+Local low-latency CLV scoring service (stdlib asyncio, no web framework).
+
+- Loads the model bundle once at startup
+- POST /score   {"customer_ids": [12345, ...], "cutoff_date": "YYYY-MM-DD" (optional)}
+    -> churn_prob, spend_prob, expected_revenue, expected_clv, expected_loss per customer
+- GET  /metrics  request count, batch stats, p50/p99 latency (ms)
+- GET  /health
+
+Concurrent requests are coalesced into micro-batches (up to max_batch customers
+or max_wait_ms, whichever comes first): one feature query + one model pass per
+batch. Features are read from customer_model_data_rollup at the latest cutoff
+(or the requested one) through a read-only DuckDB connection to the current
+published snapshot (clv.snapshots), unless db_path is given.
+
+Run:
+    python src/clv/service.py
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import date
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from clv.bundle import BUNDLE_PATH, load_bundle
+from clv.db import connect
+from clv.score import predict_clv
+from clv.snapshots import reader_path
+
+
+TABLE_IN = "customer_model_data_rollup"
+
+RESPONSE_COLS = ["churn_prob", "spend_prob", "expected_revenue", "expected_clv", "expected_loss"]
+
+
+def _parse_cutoff(value) -> str | None:
+    """
+    Request cutoff_date as a normalized YYYY-MM-DD string (ValueError -> 400 instead of a DuckDB error).
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError("cutoff_date must be a YYYY-MM-DD string")
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"cutoff_date must be a YYYY-MM-DD date, got {value!r}") from None
+
+
+@dataclass
+class _Pending:
+    customer_ids: list[int]
+    cutoff_date: str | None
+    future: asyncio.Future
+    enqueued_at: float = field(default=0.0)
+
+
+class ScoringService:
+    def __init__(
+        self,
+        db_path: str | None = None,
+        bundle_path: str = BUNDLE_PATH,
+        table_in: str = TABLE_IN,
+        max_batch: int = 512,
+        max_wait_ms: float = 5.0,
+        latency_window: int = 10_000,
+    ):
+        self.db_path = db_path
+        self.table_in = table_in
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.bundle = load_bundle(bundle_path)
+        # touch components once so the first request does not pay for it
+        self.models = (self.bundle.churn, self.bundle.spend, self.bundle.revenue)
+
+        self._con = None
+        self._latest_cutoff = None
+        self._queue: asyncio.Queue | None = None
+        self._batcher: asyncio.Task | None = None
+        # one thread: DuckDB + model calls run off the event loop, one batch at a time
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self._latencies_ms = deque(maxlen=latency_window)
+        self._requests = 0
+        self._batches = 0
+        self._batched_customers = 0
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    async def start(self):
+        self._con = connect(self.db_path or reader_path(), read_only=True, stage="serve")
+        self._latest_cutoff = self._con.execute(f"SELECT MAX(cutoff_date) FROM {self.table_in}").fetchone()[0]
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def stop(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+        self._executor.shutdown(wait=False)
+
+    # -------------------------
+    # Scoring
+    # -------------------------
+    async def score(self, customer_ids: list[int], cutoff_date: str | None = None) -> dict:
+        loop = asyncio.get_running_loop()
+        pending = _Pending([int(c) for c in customer_ids], cutoff_date, loop.create_future(), loop.time())
+        await self._queue.put(pending)
+
+        rows = await pending.future
+        self._latencies_ms.append((loop.time() - pending.enqueued_at) * 1000.0)
+        self._requests += 1
+
+        predictions = [rows[c] for c in pending.customer_ids if c in rows]
+        return {
+            "cutoff_date": str(cutoff_date or self._latest_cutoff),
+            "model_version": self.bundle.version,
+            "predictions": predictions,
+            "missing": [c for c in pending.customer_ids if c not in rows],
+        }
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            n = len(batch[0].customer_ids)
+            deadline = loop.time() + self.max_wait
+
+            while n < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                n += len(item.customer_ids)
+
+            # one feature query + model pass per cutoff in the batch
+            by_cutoff = {}
+            for item in batch:
+                by_cutoff.setdefault(item.cutoff_date, []).append(item)
+
+            for cutoff, items in by_cutoff.items():
+                ids = sorted({c for item in items for c in item.customer_ids})
+                try:
+                    rows = await loop.run_in_executor(self._executor, self._score_ids, ids, cutoff)
+                except Exception as e:
+                    for item in items:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                    continue
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_result(rows)
+
+            self._batches += 1
+            self._batched_customers += n
+
+    def _score_ids(self, customer_ids: list[int], cutoff_date: str | None) -> dict:
+        df = self._con.execute(
+            f"""
+            SELECT *
+            FROM {self.table_in}
+            WHERE cutoff_date = CAST(? AS DATE)
+              AND CustomerID IN (SELECT UNNEST(?))
+            """,
+            [cutoff_date or self._latest_cutoff, customer_ids],
+        ).fetchdf()
+
+        if df.empty:
+            return {}
+
+        churn, spend, revenue = self.models
+        out = predict_clv(df, churn, spend, revenue, self.bundle.feature_cols)
+
+        values = out[RESPONSE_COLS].to_numpy(dtype=float)
+        return {
+            int(cid): {"CustomerID": int(cid), **dict(zip(RESPONSE_COLS, map(float, row)))}
+            for cid, row in zip(out["CustomerID"], values)
+        }
+
+    def metrics(self) -> dict:
+        lat = np.fromiter(self._latencies_ms, dtype=float)
+        return {
+            "requests": self._requests,
+            "batches": self._batches,
+            "avg_batch_customers": (self._batched_customers / self._batches) if self._batches else None,
+            "latency_p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+            "latency_p99_ms": float(np.percentile(lat, 99)) if len(lat) else None,
+            "model_version": self.bundle.version,
+        }
+
+    # -------------------------
+    # HTTP
+    # -------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        status, payload = 200, None
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if len(request_line) < 2:
+                raise ValueError("malformed request line")
+            method, path = request_line[0], request_line[1]
+
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                k, _, v = line.partition(":")
+                headers[k.strip().lower()] = v.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if method == "GET" and path == "/health":
+                payload = {"status": "ok", "model_version": self.bundle.version}
+            elif method == "GET" and path == "/metrics":
+                payload = self.metrics()
+            elif method == "POST" and path == "/score":
+                req = json.loads(body or b"{}")
+                ids = req.get("customer_ids")
+                if not isinstance(ids, list):
+                    raise ValueError("customer_ids must be a list")
+                payload = await self.score(ids, _parse_cutoff(req.get("cutoff_date")))
+            else:
+                status, payload = 404, {"error": f"unknown route {method} {path}"}
+
+        except (ValueError, TypeError, json.JSONDecodeError) as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+
+        data = json.dumps(payload).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        await self.start()
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"CLV scoring service on http://{host}:{port} (model_version={self.bundle.version})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def main():
+    asyncio.run(ScoringService().serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+snapshots.py
+
+Published read-only snapshots of the warehouse, so readers never open the
+database the pipeline is writing to:
+
+    data/warehouse.duckdb                          working DB (pipeline writes here)
+    data/snapshots/warehouse_<ts>.duckdb           published, never modified again
+    data/snapshots/CURRENT                         name of the current snapshot
+
+publish_snapshot() closes this process's connection to the working DB (which
+checkpoints it), copies the file under a temporary name, checks the copy, then
+renames it and swaps CURRENT with os.replace. Both renames are atomic, so a
+reader sees either the previous snapshot or the new one, never a half-built
+table. Readers resolve CURRENT once per connection (reader_path /
+connect_snapshot) and keep reading their snapshot until they reconnect.
+
+Old snapshots are pruned after each publish (current one always kept; files
+still open elsewhere on Windows are skipped and retried next time).
+
+Run:
+    python src/clv/snapshots.py
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+from clv.db import DB_PATH, close, connect
+
+
+SNAPSHOT_DIR = "data/snapshots"
+POINTER_FILE = "CURRENT"
+SNAPSHOT_PREFIX = "warehouse_"
+KEEP_SNAPSHOTS = 3
+CHECK_VIEW = "predictions_customer_latest"
+
+
+def list_snapshots(snapshot_dir: str = SNAPSHOT_DIR) -> list[str]:
+    """
+    Published snapshot versions, oldest first.
+    """
+    return sorted(p.stem for p in Path(snapshot_dir).glob(f"{SNAPSHOT_PREFIX}*.duckdb"))
+
+
+def snapshot_path(version: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    return str(Path(snapshot_dir) / f"{version}.duckdb")
+
+
+def current_snapshot(snapshot_dir: str = SNAPSHOT_DIR) -> str | None:
+    """
+    Version CURRENT points to (None before the first publish).
+    """
+    pointer = Path(snapshot_dir) / POINTER_FILE
+    if not pointer.exists():
+        return None
+    version = pointer.read_text().strip()
+    return version or None
+
+
+def reader_path(snapshot_dir: str = SNAPSHOT_DIR, fallback: str = DB_PATH) -> str:
+    """
+    Database file readers should open: the current snapshot, or the working DB
+    when nothing has been published yet.
+    """
+    version = current_snapshot(snapshot_dir)
+    return snapshot_path(version, snapshot_dir) if version else str(fallback)
+
+
+def connect_snapshot(snapshot_dir: str = SNAPSHOT_DIR, stage: str | None = None):
+    """
+    Read-only cursor on the current snapshot.
+    """
+    return connect(reader_path(snapshot_dir), read_only=True, stage=stage)
+
+
+def _write_pointer(version: str, snapshot_dir: str) -> None:
+    pointer = Path(snapshot_dir) / POINTER_FILE
+    tmp = pointer.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+
+
+def prune_snapshots(keep: int = KEEP_SNAPSHOTS, snapshot_dir: str = SNAPSHOT_DIR) -> list[str]:
+    """
+    Delete all but the newest `keep` snapshots (never the current one). Returns removed versions.
+    """
+    current = current_snapshot(snapshot_dir)
+    versions = list_snapshots(snapshot_dir)
+    stale = [v for v in versions[:max(len(versions) - keep, 0)] if v != current]
+
+    removed = []
+    for version in stale:
+        close(snapshot_path(version, snapshot_dir))
+        try:
+            os.remove(snapshot_path(version, snapshot_dir))
+        except PermissionError:
+            continue  # still open in another process (Windows); next prune retries
+        removed.append(version)
+    return removed
+
+
+def publish_snapshot(
+    db_path: str = DB_PATH,
+    snapshot_dir: str = SNAPSHOT_DIR,
+    keep: int = KEEP_SNAPSHOTS,
+    check_view: str | None = CHECK_VIEW,
+) -> str:
+    """
+    Copy the working DB into a new snapshot and make it current. Returns the version.
+    Raises (and leaves CURRENT untouched) if the copy lacks rows in check_view.
+    """
+    Path(snapshot_dir).mkdir(parents=True, exist_ok=True)
+    version = f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    path = snapshot_path(version, snapshot_dir)
+    tmp = path + ".tmp"
+
+    # no open handle = WAL merged into the file; cursors on it must be finished
+    close(db_path)
+    if Path(db_path + ".wal").exists():
+        raise RuntimeError(f"{db_path} has an open write-ahead log (in use by another process?); not published.")
+    shutil.copyfile(db_path, tmp)
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+
+    try:
+        if check_view is not None:
+            con = connect(tmp, read_only=True)
+            rows = con.execute(f"SELECT COUNT(*) FROM {check_view}").fetchone()[0]
+            con.close()
+            if rows == 0:
+                raise ValueError(f"{check_view} is empty in {db_path}; snapshot not published.")
+    except Exception:
+        close(tmp)
+        os.remove(tmp)
+        raise
+    close(tmp)
+
+    os.replace(tmp, path)
+    _write_pointer(version, snapshot_dir)
+
+    removed = prune_snapshots(keep, snapshot_dir)
+    print(f"Published snapshot {version} -> {path} (pruned {len(removed)})")
+    return version
+
+
+if __name__ == "__main__":
+    print("current:", current_snapshot())
+    print("snapshots:", list_snapshots())
+    print("readers open:", reader_path())
@@ -0,0 +1,191 @@
+"""
+targeting_sql.py
+
+SQL-backed targeting: percentile ranks, the blended score and the
+budget/capacity cut run inside DuckDB, so only the selected rows come back to
+Python. Same results as clv.business.optimize_targeting on the full snapshot:
+
+- percentile rank = Series.rank(pct=True, method="average"):
+    (rank() + (ties - 1) / 2) / count(non-null)
+  ties = peers of the current row, so each column needs a single sort
+- the cut is ORDER BY ... LIMIT k (DuckDB's top-N operator, no full sort);
+  ties on the score are broken by CustomerID, NULL scores rank last
+
+Run:
+    python src/clv/targeting_sql.py
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from clv.business import RoiCurve, StrategySummary, n_targetable, summarize_targets
+from clv.db import DB_PATH, connect
+
+
+PRED_VIEW = "predictions_customer_latest"
+TARGET_COLS = [
+    "cutoff_date",
+    "CustomerID",
+    "churn_prob",
+    "spend_prob",
+    "pred_revenue_if_spend",
+    "expected_revenue",
+    "expected_clv",
+    "expected_loss",
+]
+
+
+def pct_rank_sql(col: str, partition_by: str | None = None) -> str:
+    """
+    Average-ties percentile rank of col in (0, 1]; NULL stays NULL.
+    partition_by ranks within groups (e.g. "cutoff_date").
+    """
+    part = f"PARTITION BY {partition_by} " if partition_by else ""
+    return f"""CASE WHEN {col} IS NULL THEN NULL ELSE
+        (rank() OVER ({part}ORDER BY {col})
+         + (count(*) OVER ({part}ORDER BY {col} RANGE BETWEEN CURRENT ROW AND CURRENT ROW) - 1) / 2.0)
+        / count({col}) OVER ({part.strip()}) END"""
+
+
+def _ranked_source(score: str, w_loss: float, w_clv: float, source: str) -> tuple[str, str, list[str]]:
+    """
+    (FROM clause, score expression, extra output columns) for score in {"expected_loss", "blended_score"}.
+    """
+    if score == "expected_loss":
+        return source, "expected_loss", []
+    if score == "blended_score":
+        ranked = f"""(
+            SELECT *,
+              {pct_rank_sql("expected_loss")} AS loss_rank,
+              {pct_rank_sql("expected_clv")} AS clv_rank
+            FROM {source}
+        )"""
+        return ranked, f"{float(w_loss)} * loss_rank + {float(w_clv)} * clv_rank", ["loss_rank", "clv_rank"]
+    raise ValueError(f"Unknown score: {score} (expected 'expected_loss' or 'blended_score')")
+
+
+def targets_query(
+    k: int,
+    score: str = "expected_loss",
+    w_loss: float = 0.7,
+    w_clv: float = 0.3,
+    source: str = PRED_VIEW,
+    columns: list[str] = TARGET_COLS,
+) -> str:
+    """
+    SELECT for the top-k rows of source by score, best first. Plain SQL (k inlined),
+    so it can also feed COPY (...) TO for exports.
+    """
+    from_sql, score_expr, extra = _ranked_source(score, w_loss, w_clv, source)
+    select = list(columns) + extra
+    if score_expr != score:
+        select.append(f"{score_expr} AS {score}")
+    order = f"{score_expr} DESC NULLS LAST, CustomerID"
+
+    return f"""
+        SELECT {", ".join(select)}
+        FROM {from_sql}
+        ORDER BY {order}
+        LIMIT {int(k)}
+    """
+
+
+def top_targets_sql(
+    con,
+    k: int,
+    score: str = "expected_loss",
+    w_loss: float = 0.7,
+    w_clv: float = 0.3,
+    source: str = PRED_VIEW,
+    columns: list[str] = TARGET_COLS,
+) -> pd.DataFrame:
+    """
+    Top-k rows of source by score, best first (only k rows are materialized in pandas).
+    """
+    return con.execute(targets_query(k, score, w_loss, w_clv, source, columns)).fetchdf()
+
+
+def targets_limit(budget_eur: float, cost_per_customer: float, max_customers: int, save_rate: float) -> int:
+    """
+    Validated number of customers both constraints allow.
+    """
+    if cost_per_customer <= 0:
+        raise ValueError("cost_per_customer must be > 0")
+    if budget_eur < 0:
+        raise ValueError("budget_eur must be >= 0")
+    if max_customers <= 0:
+        raise ValueError("max_customers must be > 0")
+    if not (0 <= save_rate <= 1):
+        raise ValueError("save_rate must be between 0 and 1")
+    return n_targetable(max_customers, budget_eur, cost_per_customer, max_customers)
+
+
+def optimize_targeting_sql(
+    budget_eur: float,
+    cost_per_customer: float,
+    max_customers: int,
+    save_rate: float,
+    score: str = "expected_loss",
+    w_loss: float = 0.7,
+    w_clv: float = 0.3,
+    source: str = PRED_VIEW,
+    columns: list[str] = TARGET_COLS,
+    db_path: str = DB_PATH,
+) -> tuple[pd.DataFrame, StrategySummary]:
+    """
+    SQL counterpart of clv.business.optimize_targeting: top customers by score
+    under both the budget and the max_customers constraint.
+    """
+    k = targets_limit(budget_eur, cost_per_customer, max_customers, save_rate)
+    con = connect(db_path, read_only=True)
+    targets = top_targets_sql(con, k, score, w_loss, w_clv, source, columns)
+    con.close()
+
+    summary = summarize_targets(targets["expected_loss"].to_numpy(), np.arange(len(targets)), cost_per_customer, save_rate)
+    return targets, summary
+
+
+def roi_curve_sql(
+    max_customers: int,
+    score: str = "expected_loss",
+    w_loss: float = 0.7,
+    w_clv: float = 0.3,
+    source: str = PRED_VIEW,
+    db_path: str = DB_PATH,
+) -> RoiCurve:
+    """
+    RoiCurve over the top max_customers only (enough for optimal / breakeven within max_customers).
+    """
+    con = connect(db_path, read_only=True)
+    top = top_targets_sql(con, max_customers, score, w_loss, w_clv, source, columns=["CustomerID", "expected_loss"])
+    con.close()
+
+    cum = np.zeros(len(top) + 1)
+    np.cumsum(np.nan_to_num(top["expected_loss"].to_numpy(dtype=float)), out=cum[1:])
+    return RoiCurve(cum)
+
+
+def snapshot_info(source: str = PRED_VIEW, db_path: str = DB_PATH) -> dict:
+    """
+    latest cutoff, row count and distinct customers of source (one aggregate row).
+    """
+    con = connect(db_path, read_only=True)
+    cutoff, rows, customers = con.execute(
+        f"SELECT MAX(cutoff_date), COUNT(*), COUNT(DISTINCT CustomerID) FROM {source}"
+    ).fetchone()
+    con.close()
+    return {"latest_cutoff": cutoff, "rows": int(rows), "customers": int(customers)}
+
+
+if __name__ == "__main__":
+    info = snapshot_info()
+    print("\n=== Snapshot ===")
+    print(info)
+
+    for score in ["expected_loss", "blended_score"]:
+        targets, summary = optimize_targeting_sql(500.0, 1.0, 2000, 0.15, score=score)
+        print(f"\n=== {score} ===")
+        print(summary)
+        print(targets.head(10).to_string(index=False))
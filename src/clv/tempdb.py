@@ -11,51 +11,15 @@ Run from project root:
     python src/clv/tmp_duckdb_quick_test.py
 """
 
-import duckdb
-import pandas as pd
+from dataclasses import asdict
 
-
-DB_PATH = "data/warehouse.duckdb"
-
-
-def optimize_targeting(
-    df: pd.DataFrame,
-    budget_eur: float,
-    cost_per_customer: float,
-    max_customers: int,
-    save_rate: float,
-    score_col: str = "expected_loss",
-):
-    # rank by score, then apply capacity + budget constraints
-    df = df.copy().sort_values(score_col, ascending=False)
-
-    # capacity constraint
-    df = df.head(max_customers).copy()
-
-    # budget constraint
-    affordable_n = int(budget_eur // cost_per_customer)
-    affordable_n = max(0, affordable_n)
-
-    targeted = df.head(min(len(df), affordable_n)).copy()
-
-    total_cost = len(targeted) * cost_per_customer
-    expected_prevented = save_rate * targeted[score_col].sum()
-    net_uplift = expected_prevented - total_cost
-    roi = (net_uplift / total_cost) if total_cost > 0 else None
-
-    return {
-        "targeted_customers": int(len(targeted)),
-        "total_cost": float(total_cost),
-        "expected_prevented_loss": float(expected_prevented),
-        "net_uplift": float(net_uplift),
-        "roi": None if roi is None else float(roi),
-        "target_list": targeted,
-    }
+from clv.business import optimize_targeting
+from clv.db import DB_PATH, connect
 
 
 def main():
     # ---- 1) Load from DuckDB ----
-    con = duckdb.connect(DB_PATH)
+    con = connect(DB_PATH)
 
     # sanity: show tables
     print("\n=== TABLES ===")
@@ -102,7 +66,7 @@ def main():
     })
 
     # ---- 4) Optimize ----
-    result = optimize_targeting(
+    targets, summary = optimize_targeting(
         df=snap,
         budget_eur=budget_eur,
         cost_per_customer=cost_per_customer,
@@ -112,9 +76,7 @@ def main():
     )
 
     print("\n=== OUTPUT SUMMARY ===")
-    print({k: v for k, v in result.items() if k != "target_list"})
-
-    targets = result["target_list"]
+    print(asdict(summary))
 
     print("\n=== TOP 10 TARGETS (by expected_loss) ===")
     show_cols = ["CustomerID", "expected_loss", "expected_clv", "expected_revenue", "churn_prob", "spend_prob"]
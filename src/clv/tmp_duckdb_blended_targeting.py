@@ -14,59 +14,15 @@ Run:
     python src/clv/tmp_duckdb_blended_targeting.py
 """
 
-import duckdb
-import pandas as pd
+from dataclasses import asdict
 
-
-DB_PATH = "data/warehouse.duckdb"
-
-
-def add_percentile_rank(df: pd.DataFrame, col: str, out_col: str) -> pd.DataFrame:
-    # Percentile rank in [0,1], higher is better
-    df[out_col] = df[col].rank(pct=True, method="average")
-    return df
-
-
-def optimize_targeting(
-    df: pd.DataFrame,
-    budget_eur: float,
-    cost_per_customer: float,
-    max_customers: int,
-    save_rate: float,
-    score_col: str,
-):
-    df = df.copy().sort_values(score_col, ascending=False)
-
-    # capacity constraint
-    df = df.head(max_customers).copy()
-
-    # budget constraint
-    affordable_n = int(budget_eur // cost_per_customer)
-    affordable_n = max(0, affordable_n)
-
-    targeted = df.head(min(len(df), affordable_n)).copy()
-
-    total_cost = len(targeted) * cost_per_customer
-
-    # For prevented loss, we should still use expected_loss (not blended score)
-    expected_prevented_loss = save_rate * targeted["expected_loss"].sum()
-
-    net_uplift = expected_prevented_loss - total_cost
-    roi = (net_uplift / total_cost) if total_cost > 0 else None
-
-    return {
-        "targeted_customers": int(len(targeted)),
-        "total_cost": float(total_cost),
-        "expected_prevented_loss": float(expected_prevented_loss),
-        "net_uplift": float(net_uplift),
-        "roi": None if roi is None else float(roi),
-        "target_list": targeted,
-    }
+from clv.business import add_percentile_rank, optimize_targeting, top_k_indices
+from clv.db import DB_PATH, connect
 
 
 def main():
     # 1) Load
-    con = duckdb.connect(DB_PATH)
+    con = connect(DB_PATH)
 
     df = con.execute("""
         SELECT
@@ -118,7 +74,7 @@ def main():
     })
 
     # 4) Optimize using blended score
-    result = optimize_targeting(
+    targets, summary = optimize_targeting(
         df=snap,
         budget_eur=budget_eur,
         cost_per_customer=cost_per_customer,
@@ -128,9 +84,7 @@ def main():
     )
 
     print("\n=== Output summary ===")
-    print({k: v for k, v in result.items() if k != "target_list"})
-
-    targets = result["target_list"].copy()
+    print(asdict(summary))
 
     print("\n=== Top 10 targets (by blended_score) ===")
     show_cols = [
@@ -147,9 +101,9 @@ def main():
     print(targets[show_cols].head(10).to_string(index=False))
 
     # Optional: compare what you'd get if you ranked by expected_loss only
-    loss_only = snap.sort_values("expected_loss", ascending=False).head(len(targets))
+    loss_only = snap.iloc[top_k_indices(snap["expected_loss"].to_numpy(), len(targets))]
     overlap = set(targets["CustomerID"]).intersection(set(loss_only["CustomerID"]))
-    print("\nOverlap vs expected_loss-only selection:", round(len(overlap) / len(targets), 3))
+    print("\nOverlap vs expected_loss-only selection:", round(len(overlap) / max(1, len(targets)), 3))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+"""
+tmp_multi_campaign.py
+
+Notebook-style allocation of several retention treatments at once:
+1) Load predictions_customer_latest
+2) Define treatments (cost, save_rate, capacity)
+3) Assign each customer at most one treatment to maximize total net uplift
+4) Print per-treatment summaries + top targets
+
+Run:
+    python src/clv/tmp_multi_campaign.py
+"""
+
+from dataclasses import asdict
+
+from clv.business import Treatment, allocate_treatments
+from clv.db import connect
+from clv.snapshots import reader_path
+
+
+def main():
+    con = connect(reader_path(), read_only=True)
+    snap = con.execute("""
+        SELECT
+          cutoff_date,
+          CustomerID,
+          churn_prob,
+          spend_prob,
+          expected_clv,
+          expected_loss
+        FROM predictions_customer_latest
+    """).fetchdf()
+    con.close()
+
+    print("\n=== Snapshot ===")
+    print("latest_cutoff:", snap["cutoff_date"].max())
+    print("customers:", len(snap))
+
+    # ---- treatments (edit freely) ----
+    treatments = [
+        Treatment("email", cost_per_customer=0.1, save_rate=0.03, capacity=20_000),
+        Treatment("call", cost_per_customer=4.0, save_rate=0.15, capacity=500),
+        Treatment("voucher", cost_per_customer=10.0, save_rate=0.30, capacity=200),
+    ]
+
+    print("\n=== Treatments ===")
+    for t in treatments:
+        print(asdict(t))
+
+    alloc = allocate_treatments(snap, treatments)
+
+    print("\n=== Allocation ===")
+    for name, summary in alloc.summaries.items():
+        print(f"{name:8s}", asdict(summary))
+    print("total   ", asdict(alloc.total))
+
+    for name, targets in alloc.target_lists.items():
+        print(f"\n=== Top 5 ({name}) ===")
+        print(targets[["CustomerID", "expected_loss", "expected_clv", "churn_prob"]].head(5).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
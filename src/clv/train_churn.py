@@ -1,4 +1,3 @@
-import duckdb 
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
@@ -8,15 +7,17 @@ from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LogisticRegression
-from clv.explain import shap_global_local
+from clv.db import connect
+from clv.explain import model_version, shap_global_local
 from clv.score import save_model, score_and_write_to_db
 from clv.business import retention_simulation
+from clv.evaluation import gains_curves, save_curves
 from sklearn.calibration import CalibratedClassifierCV
 
 
 
-def train_churn_model():
-    con = duckdb.connect("data/warehouse.duckdb")
+def train_churn_model(render_shap: bool = False):
+    con = connect(stage="train")
     df = con.execute("SELECT * FROM customer_model_data_rollup").fetchdf()
 
     con.close()
@@ -154,30 +155,23 @@ def train_churn_model():
     # Business Evaluation
     # =========================
 
-    # Get full test set predictions
+    # Test set predictions (computed once, reused by the simulation below)
     test_df = test_df.copy()
     test_df["churn_prob"] = xgb_model.predict_proba(X_test)[:, 1]
-
-    # Strategy A: churn probability ranking
-    test_df = test_df.sort_values("churn_prob", ascending=False)
-
-    total_revenue = test_df["revenue_pred_window"].sum()
-
-    for pct in [0.1, 0.2, 0.3]:
-        top_n = int(len(test_df) * pct)
-        revenue_captured = test_df.head(top_n)["revenue_pred_window"].sum()
-        print(f"\nStrategy A - Top {int(pct*100)}% revenue capture:",
-              round(revenue_captured / total_revenue, 4))
-
     # Strategy B: risk-adjusted revenue
     test_df["risk_score"] = test_df["churn_prob"] * test_df["revenue_pred_window"]
-    test_df = test_df.sort_values("risk_score", ascending=False)
 
-    for pct in [0.1, 0.2, 0.3]:
-        top_n = int(len(test_df) * pct)
-        revenue_captured = test_df.head(top_n)["revenue_pred_window"].sum()
-        print(f"\nStrategy B - Top {int(pct*100)}% revenue capture:",
-              round(revenue_captured / total_revenue, 4))
+    # Full gains / capture curves per cutoff + pooled (one sort per scope),
+    # stored per model version so retrains can be compared
+    version = model_version(xgb_model)
+    for label, score_col in [("A", "churn_prob"), ("B", "risk_score")]:
+        curves = gains_curves(test_df, score_col, "revenue_pred_window", label_col="churn_label")
+        save_curves(curves, "churn_xgb", score_col, "revenue_pred_window", label_col="churn_label", model_version=version)
+
+        pooled = curves[curves["cutoff_date"].isna()].set_index("pct")
+        for pct in [0.1, 0.2, 0.3]:
+            print(f"\nStrategy {label} - Top {int(pct*100)}% revenue capture:",
+                  round(pooled.loc[pct, "value_capture"], 4))
 
     print("\n=== Logistic Coefficients ===")
     coef_df = pd.DataFrame({
@@ -196,13 +190,9 @@ def train_churn_model():
     # ✅ ADDED (necessary): you created it but never printed it
     print(xgb_importance)
 
-    # Save churn model
+    # Save churn model (+ its training cutoffs: in-sample for clv.backtest)
     save_model(xgb_model, "artifacts/models/churn_xgb.joblib")
-
-    # Build business frame for test set
-    test_df = test_df.copy()
-    test_df["churn_prob"] = xgb_model.predict_proba(X_test)[:, 1]
-    test_df["risk_score"] = test_df["churn_prob"] * test_df["revenue_pred_window"]
+    save_model([str(pd.Timestamp(c).date()) for c in train_cutoffs], "artifacts/models/churn_train_cutoffs.joblib")
 
     # Run one example simulation
     sim = retention_simulation(
@@ -214,9 +204,10 @@ def train_churn_model():
     print("\n=== Retention Simulation Example (Top 20%) ===")
     print({k: v for k, v in sim.items() if k != "target_list"})
 
-    # SHAP artifacts
-    shap_info = shap_global_local(xgb_model, X_train, X_test, test_df["CustomerID"])
-    print("\nSHAP saved:", shap_info)
+    # SHAP plots (optional; per-customer reason codes come from clv.explain.score_reason_codes)
+    if render_shap:
+        shap_info = shap_global_local(xgb_model, X_train, X_test, test_df["CustomerID"])
+        print("\nSHAP saved:", shap_info)
 
     # Score all rows and write back to DuckDB
     score_and_write_to_db(xgb_model, feature_cols=feature_cols)
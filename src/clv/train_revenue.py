@@ -1,5 +1,4 @@
 import os
-import duckdb
 import numpy as np
 import pandas as pd
 
@@ -10,15 +9,15 @@ from sklearn.metrics import roc_auc_score, average_precision_score, mean_absolut
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import HistGradientBoostingRegressor
 
+from clv.db import DB_PATH, connect
 from clv.score import save_model
 
 
-DB_PATH = "data/warehouse.duckdb"
 TABLE_IN = "customer_model_data_rollup"
 
 
 def train_revenue_models() -> None:
-    con = duckdb.connect(DB_PATH)
+    con = connect(DB_PATH, stage="train")
     df = con.execute(f"SELECT * FROM {TABLE_IN}").fetchdf()
     con.close()
 
@@ -134,11 +133,13 @@ def train_revenue_models() -> None:
     save_model(spend_model, "artifacts/models/spend_clf.joblib")
     save_model(rev_model, "artifacts/models/revenue_reg.joblib")
     save_model(feature_cols, "artifacts/models/feature_cols.joblib")
+    save_model([str(pd.Timestamp(c).date()) for c in train_cutoffs], "artifacts/models/revenue_train_cutoffs.joblib")
 
     print("\nSaved:")
     print("- artifacts/models/spend_clf.joblib")
     print("- artifacts/models/revenue_reg.joblib")
     print("- artifacts/models/feature_cols.joblib")
+    print("- artifacts/models/revenue_train_cutoffs.joblib")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+from clv.explain import global_shap_importance
+
+
+def test_global_shap_importance_without_strata():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(5_000, 4)), columns=["a", "b", "c", "d"])
+    y = (X["a"] + 0.5 * X["b"] + rng.normal(scale=0.5, size=len(X)) > 0).astype(int)
+    model = xgb.XGBClassifier(n_estimators=20, max_depth=3).fit(X, y)
+
+    result = global_shap_importance(model, X, cache_dir=None, n_workers=1, pilot_size=500)
+
+    assert result["n_strata"] == 1
+    assert result["pilot_rows"] == 500
+    assert 500 <= result["sample_rows"] <= len(X)
+    assert result["features"][0]["feature"] == "a"
+    assert all(np.isfinite(f["mean_abs_shap"]) for f in result["features"])